@@ -0,0 +1,338 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+"""
+界面模型与搜索的性能测试，无界面运行
+    python -m benchmark.bench_ui --output result.json
+    python -m benchmark.bench_ui --save-baseline          # 保存为基线
+    python -m benchmark.bench_ui --quick                  # 只跑 1 万行的规模
+有基线文件时逐项对比，中位数比基线慢超过 tolerance 视为回退，进程以 1 退出。
+基线与机器相关，只在同一台机器上对比
+"""
+
+# 没有指定时使用无界面的 Qt 平台，必须在导入 PyQt5 之前设置
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QT_VERSION_STR, Qt
+from PyQt5.QtWidgets import QApplication
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# 注册的性能测试 [(名称, 函数)]，函数接收行数规模数组，返回 [(用例名, 无参函数)]
+_BENCHMARKS = []
+
+
+def benchmark(name):
+    def decorator(func):
+        _BENCHMARKS.append((name, func))
+        return func
+
+    return decorator
+
+
+def measure(func, repeat=5, min_time=0.05):
+    """
+    计时，自动选择每轮的执行次数使一轮不少于 min_time 秒
+    @return: {'median_ms', 'min_ms', 'number'}，时间为单次执行的耗时
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        cost = timer.timeit(number)
+        if cost >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if cost < min_time / 10 else 2
+    costs = [cost] + timer.repeat(repeat - 1, number)
+    costs = [cost / number * 1000 for cost in costs]
+    return {'median_ms': statistics.median(costs), 'min_ms': min(costs), 'number': number}
+
+
+def make_frame(rows, seed=0):
+    """
+    与行情列表类似的测试数据：代码、名称、价格、涨跌幅、成交量、日期
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.char.zfill(np.arange(rows).astype(str), 6)
+    return pd.DataFrame({
+        'code': codes,
+        'name': np.char.add('股票', codes),
+        'price': np.round(rng.uniform(3, 300, rows), 2),
+        'change': np.round(rng.normal(0, 3, rows), 2),
+        'volume': rng.integers(0, 10 ** 8, rows),
+        'date': pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+    })
+
+
+@benchmark('pdtable')
+def bench_pdtable(sizes):
+    from viewmodel.pdviewmodel import PdTable
+
+    cases = []
+    for rows in sizes:
+        frame = make_frame(rows)
+        model = PdTable(frame, formats={'price': '%.2f', 'change': '%.2f'})
+        rng = np.random.default_rng(1)
+        # 模拟一屏的重绘：随机位置连续 40 行的所有列
+        top = int(rng.integers(0, max(1, rows - 40)))
+        indexes = [model.index(row, col) for row in range(top, min(rows, top + 40)) for col in range(frame.shape[1])]
+        for index in indexes:
+            model.data(index)
+
+        def paint(model=model, indexes=indexes):
+            for index in indexes:
+                model.data(index)
+
+        def sort_price(model=model):
+            model._sort_cache = [None] * len(model._sort_cache)
+            model.sort(frame.columns.get_loc('price'), Qt.DescendingOrder)
+
+        def sort_name(model=model):
+            model._sort_cache = [None] * len(model._sort_cache)
+            model.sort(frame.columns.get_loc('name'), Qt.AscendingOrder)
+
+        def sort_multi(model=model):
+            model._sort_cache = [None] * len(model._sort_cache)
+            model.sort_by(['date', 'change'], [Qt.AscendingOrder, Qt.DescendingOrder])
+
+        cases += [(f'data_screen[{rows}]', paint), (f'sort_price[{rows}]', sort_price),
+                  (f'sort_name[{rows}]', sort_name), (f'sort_date_change[{rows}]', sort_multi)]
+    return cases
+
+
+def _universe():
+    """
+    键盘小精灵的全部代码和拼音首字母
+    """
+    from search import pinyincache
+    from search.SearchBar import SEARCH_DATA_DIR, SEARCH_DATA_FILES
+    from search.SymbolTable import SymbolTable
+    table = SymbolTable.from_csv([(os.path.join(SEARCH_DATA_DIR, file_name), category)
+                                  for file_name, category in SEARCH_DATA_FILES])
+    initials = [pinyincache.name_initials(name) for name in table.names()]
+    return table, initials
+
+
+@benchmark('search')
+def bench_search(sizes):
+    from PyQt5.QtCore import pyqtSignal, QObject
+    from search.SearchBar import ExtendedComboBox
+
+    class Holder(QObject):
+        signal = pyqtSignal(tuple)
+
+    table, initials = _universe()
+    holder = Holder()
+    combobox = ExtendedComboBox(holder.signal)
+    combobox.set_data(table, initials)
+    proxy = combobox.pFilterModel
+
+    def set_data():
+        combobox.set_data(table, initials)
+
+    cases = [('set_data_universe', set_data)]
+    for query in ['p', 'pa', 'pay', 'payh', '60051', '600519', '平安', '平安银行']:
+        def filter_query(query=query):
+            proxy.setFilterFixedString(query)
+
+        cases.append((f'filter[{query}]', filter_query))
+    # 保持引用，避免被回收
+    bench_search.keep = (holder, combobox)
+    return cases
+
+
+@benchmark('combocheckbox')
+def bench_combocheckbox(sizes):
+    from widget.ComboCheckBox import ComboCheckBox
+
+    combo = ComboCheckBox([f'板块{i}' for i in range(500)])
+
+    def select_all():
+        combo.all_selected()
+        combo.all_selected()
+
+    def invert():
+        combo.invert_selected()
+
+    bench_combocheckbox.keep = combo
+    return [('select_all_clear[500]', select_all), ('invert[500]', invert)]
+
+
+@benchmark('indicators')
+def bench_indicators(sizes):
+    from utils.indicators import IndicatorEngine
+
+    bars = 5000
+    rng = np.random.default_rng(3)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    spread = np.abs(rng.normal(0, 0.01, bars)) * close
+    hist = pd.DataFrame({'收盘': close, '最高': close + spread, '最低': close - spread})
+    specs = ['MA5', 'MA20', 'EMA12', 'MACD', 'RSI6', 'KDJ', 'BOLL']
+    engine = IndicatorEngine(specs)
+    engine.compute(hist)
+    bar = {'收盘': close[-1], '最高': close[-1] + spread[-1], '最低': close[-1] - spread[-1]}
+    return [(f'compute[{bars}]', lambda: IndicatorEngine(specs).compute(hist)), ('append[1]', lambda: engine.append(bar))]
+
+
+@benchmark('screener')
+def bench_screener(sizes):
+    from core.Screener import make_panel, screen
+
+    panel = make_panel(dates=250, symbols=5000)
+    condition = 'close > MA20 and volume > 2 * MA(volume, 5)'
+    return [('screen[250x5000]', lambda: screen(panel, condition))]
+
+
+@benchmark('candlestick')
+def bench_candlestick(sizes):
+    from widget.CandlestickChart import CandlestickChart, make_minute_bars
+
+    chart = CandlestickChart()
+    chart.resize(1200, 600)
+    chart.set_bars(*make_minute_bars(years=5))
+    chart.show()
+    QApplication.processEvents()
+    bench_candlestick.keep = chart
+    state = {'dx': 8}
+
+    def pan():
+        # 来回平移，只重画露出来的部分
+        if chart.offset <= -chart.width() // 4 or chart.offset >= chart.pyramid.size / chart.bars_per_pixel - chart.width():
+            state['dx'] = -state['dx']
+        chart.pan(state['dx'])
+        QApplication.processEvents()
+
+    def zoom():
+        chart.zoom(1.25)
+        chart.zoom(0.8)
+        QApplication.processEvents()
+
+    return [('pan[300000]', pan), ('zoom[300000]', zoom)]
+
+
+@benchmark('timeutils')
+def bench_timeutils(sizes):
+    from utils import timeutils
+
+    rows = 100_000
+    rng = np.random.default_rng(2)
+    stamps = 1_600_000_000 + rng.integers(0, 10 ** 8, rows)
+    day_strs = timeutils.stamp_to_str_array(stamps, '%Y%m%d')
+    time_strs = timeutils.stamp_to_str_array(stamps, '%Y-%m-%d %H:%M:%S')
+    scalar_strs = day_strs[:1000].tolist()
+
+    def scalar_cold():
+        timeutils.str_to_stamp.cache_clear()
+        for value in scalar_strs:
+            timeutils.str_to_stamp(value, '%Y%m%d')
+
+    return [
+        (f'str_to_stamp_array[{rows}]', lambda: timeutils.str_to_stamp_array(day_strs, '%Y%m%d')),
+        (f'str_to_stamp_array_seconds[{rows}]',
+         lambda: timeutils.str_to_stamp_array(time_strs, '%Y-%m-%d %H:%M:%S')),
+        (f'stamp_to_str_array[{rows}]', lambda: timeutils.stamp_to_str_array(stamps, '%Y-%m-%d')),
+        (f'format_convert_array[{rows}]', lambda: timeutils.format_convert_array(day_strs, '%Y%m%d', '%Y-%m-%d')),
+        (f'time_str_delta_array[{rows}]', lambda: timeutils.time_str_delta_array(day_strs, '%Y%m%d', days=3)),
+        ('str_to_stamp_scalar_cold[1000]', scalar_cold),
+    ]
+
+
+def run(sizes, pattern=None, repeat=5):
+    """
+    运行性能测试
+    @param sizes: PdTable 的行数规模
+    @param pattern: 只运行名称包含该字符串的用例
+    @return: {用例名: 计时结果}
+    """
+    results = {}
+    for group, func in _BENCHMARKS:
+        for case, case_func in func(sizes):
+            name = f'{group}.{case}'
+            if pattern and pattern not in name:
+                continue
+            results[name] = measure(case_func, repeat)
+            print(f"{name:<48} {results[name]['median_ms']:>10.3f}ms  (min {results[name]['min_ms']:.3f}ms)")
+    return results
+
+
+def environment():
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'qt': QT_VERSION_STR,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线对比
+    @return: 回退的用例 [(名称, 基线耗时, 当前耗时)]
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['median_ms'] > base['median_ms'] * (1 + tolerance):
+            regressions.append((name, base['median_ms'], result['median_ms']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='界面模型与搜索的性能测试')
+    parser.add_argument('--output', help='结果写入的 json 文件')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线 json 文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='允许比基线慢的比例，默认 0.3')
+    parser.add_argument('--sizes', help='PdTable 的行数规模，逗号分隔，默认 10000,100000,1000000')
+    parser.add_argument('--quick', action='store_true', help='只跑 10000 行的规模')
+    parser.add_argument('--filter', help='只运行名称包含该字符串的用例')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的计时轮数')
+    args = parser.parse_args(argv)
+
+    if args.sizes:
+        sizes = [int(size) for size in args.sizes.split(',')]
+    else:
+        sizes = DEFAULT_SIZES[:1] if args.quick else DEFAULT_SIZES
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    data = {'environment': environment(), 'sizes': sizes, 'results': run(sizes, args.filter, args.repeat)}
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print('基线已保存', args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('没有基线文件，跳过对比', args.baseline)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = compare(data['results'], baseline, args.tolerance)
+    for name, base, current in regressions:
+        print(f'回退 {name}: 基线 {base:.3f}ms 当前 {current:.3f}ms')
+    if regressions:
+        return 1
+    print('与基线对比没有回退')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
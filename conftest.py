@@ -0,0 +1,38 @@
+import os
+import time
+
+import pytest
+
+"""
+pytest 的根目录配置，仓库根目录会被加入 sys.path，测试中可以直接 import 各个模块
+"""
+
+# 测试不需要显示窗口
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    """
+    整个测试过程共用一个 QApplication
+    """
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    yield app
+
+
+@pytest.fixture
+def process_events(qapp):
+    """
+    返回一个函数，在指定的秒数内处理事件循环，或者直到 until() 为 True
+    """
+    def process(seconds, until=None):
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            qapp.processEvents()
+            if until is not None and until():
+                return True
+            time.sleep(0.002)
+        return until is None
+
+    return process
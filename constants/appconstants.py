@@ -1,4 +1,7 @@
 # ui文件夹的路径
 import os
 
-ui_dir_path = os.path.split(os.path.abspath(os.path.realpath(__file__)))[0] + "/.."
\ No newline at end of file
+ui_dir_path = os.path.split(os.path.abspath(os.path.realpath(__file__)))[0] + "/.."
+
+# 本地缓存目录，可以通过环境变量 QUANT_UI_CACHE_DIR 修改
+cache_dir_path = os.environ.get('QUANT_UI_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.quant-pyqt-ui')
@@ -1,10 +1,23 @@
+import heapq
+import itertools
 import sys
 import threading
+import time
+from concurrent.futures import Future
 from concurrent.futures.thread import ThreadPoolExecutor
 
 from PyQt5.QtCore import QObject, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QWidget
 
+from core import metrics as app_metrics
+
+# 任务优先级，数值越小越先执行
+# 交互触发的任务，例如用户点开某只股票
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+# 后台预取之类的任务
+PRIORITY_BACKGROUND = 2
+
 
 class QTypeSignal(QObject):
     """
@@ -17,35 +30,141 @@ class QTypeSignal(QObject):
         super(QTypeSignal, self).__init__()
 
 
+class _Task:
+    """
+    提交到线程池的任务
+    """
+    __slots__ = ('executor', 'func', 'callback', 'args', 'kwargs', 'priority', 'key', 'seq', 'future', 'superseded',
+                 'name', 'submit_time', 'start_time', 'end_time')
+
+    def __init__(self, executor, func, callback, args, kwargs, priority, key, seq, name):
+        # 任务持有执行器，保证回调送达主线程之前执行器不会被回收
+        self.executor = executor
+        self.func = func
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.key = key
+        self.seq = seq
+        self.future = Future()
+        # 被同 key 的新任务取代，结果不再回调
+        self.superseded = False
+        # 指标统计用的任务名和时间点
+        self.name = name
+        self.submit_time = time.perf_counter()
+        self.start_time = None
+        self.end_time = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
 class AppThreadExecutor:
     """
     耗时任务的封装，任务扔在线程池执行，执行完成后，通过信号通知主线程
+    每个任务只回调自己的 callback；
+    任务按优先级执行，同优先级先提交先执行；
+    指定 key 的任务，同一个 key 只保留最新的一个，旧任务没开始就取消，已经开始的结果丢弃；
+    每个任务按任务名统计排队、执行、送达主线程和回调的耗时，见 core.metrics
     """
 
-    def __init__(self):
+    def __init__(self, max_workers=None, metrics=None):
+        """
+        @param max_workers: 线程数
+        @param metrics: 指标汇总，默认为 core.metrics.registry
+        """
+        self.metrics = metrics if metrics is not None else app_metrics.registry
         self.signal = QTypeSignal()
-        self.pool = ThreadPoolExecutor()
-
-    def _internal_callback(self, future):
+        # 信号携带任务本身，主线程收到后只调用该任务的回调
+        self.signal.send.connect(_dispatch)
+        self.pool = ThreadPoolExecutor(max_workers)
+        # 等待执行的任务，按 (priority, seq) 排序的堆
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        # key -> 最新提交的任务
+        self._latest = {}
+
+    def _run_next(self):
+        """
+        线程池中执行，取出优先级最高的任务执行
+        """
+        with self._lock:
+            if not self._queue:
+                return
+            task = heapq.heappop(self._queue)
+        if not task.future.set_running_or_notify_cancel():
+            # 任务已经取消
+            self._forget(task)
+            return
+        task.start_time = time.perf_counter()
+        self.metrics.task_started(task.name, task.start_time - task.submit_time)
+        failed = False
+        try:
+            result = task.func(*task.args, **task.kwargs)
+        except BaseException as e:
+            failed = True
+            task.future.set_exception(e)
+        else:
+            task.future.set_result(result)
+        task.end_time = time.perf_counter()
+        self.metrics.task_finished(task.name, task.end_time - task.start_time, failed)
+        self._internal_callback(task)
+
+    def _internal_callback(self, task):
         """
         线程池任务完成后，回调函数
         """
-        print('_____internal_callback___', threading.currentThread().name)
         # 线程切换到主线程
-        self.signal.send.emit(future)
+        self.signal.send.emit(task)
+
+    def _forget(self, task):
+        if task.key is None:
+            return
+        with self._lock:
+            if self._latest.get(task.key) is task:
+                del self._latest[task.key]
 
-    def submit(self, func, callback, *args, **kwargs):
+    def submit(self, func, callback, *args, priority=PRIORITY_NORMAL, key=None, task_name=None, kwargs=None,
+               **task_kwargs):
         """
         @param func: 任务函数
-        @param callback: 回调函数
-        @param args: 任务函数参数
+        @param callback: 回调函数，在主线程执行，参数为 future，可以为 None
+        @param args: 任务函数的位置参数
+        @param priority: 优先级，PRIORITY_INTERACTIVE/PRIORITY_NORMAL/PRIORITY_BACKGROUND
+        @param key: 任务标识，例如 'load_code'，同一个 key 只有最新提交的任务会回调
+        @param task_name: 指标统计用的任务名，默认为任务函数的名称
+        @param kwargs: 任务函数的关键字参数 dict，任务函数的参数与 priority、key 等同名时通过它传入
+        @param task_kwargs: 其余关键字参数原样传给任务函数
+        @return: future
+        """
+        kwargs = {} if kwargs is None else dict(kwargs)
+        kwargs.update(task_kwargs)
+        if task_name is None:
+            task_name = getattr(func, '__qualname__', None) or repr(func)
+        with self._lock:
+            task = _Task(self, func, callback, args, kwargs, priority, key, next(self._seq), task_name)
+            if key is not None:
+                old_task = self._latest.get(key)
+                if old_task is not None:
+                    old_task.superseded = True
+                    old_task.future.cancel()
+                self._latest[key] = task
+            heapq.heappush(self._queue, task)
+        # 把任务提交到线程池，每次提交对应一次执行机会，执行时再按优先级取任务
+        self.pool.submit(self._run_next)
+        return task.future
+
+    def cancel(self, key):
+        """
+        取消 key 对应的任务，没开始的不再执行，已经开始的结果不再回调
         """
-        # 信号连接到回调函数
-        self.signal.send.connect(callback)
-        # 把任务提交到线程池
-        future = self.pool.submit(func, *args, **kwargs)
-        # 线程池任务完成后，回调函数
-        future.add_done_callback(self._internal_callback)
+        with self._lock:
+            task = self._latest.pop(key, None)
+        if task is not None:
+            task.superseded = True
+            task.future.cancel()
 
     def shutdown(self, wait=True):
         """
@@ -54,6 +173,35 @@ class AppThreadExecutor:
         self.pool.shutdown(wait)
 
 
+def _dispatch(task):
+    """
+    主线程执行，调用任务自己的回调
+    """
+    executor = task.executor
+    executor._forget(task)
+    dispatch_time = time.perf_counter() - task.end_time
+    error = task.future.exception() if not task.future.cancelled() else None
+    callback_time = None
+    metrics = executor.metrics
+    try:
+        if task.superseded or task.callback is None:
+            return
+        metrics.current_callback = task.name
+        start = time.perf_counter()
+        try:
+            task.callback(task.future)
+        except BaseException as e:
+            error = e
+            metrics.callback_failed(task.name)
+            raise
+        finally:
+            callback_time = time.perf_counter() - start
+            metrics.current_callback = None
+    finally:
+        metrics.task_dispatched(task.name, task.start_time - task.submit_time, task.end_time - task.start_time,
+                                dispatch_time, callback_time, error)
+
+
 def callback(future):
     """
     回调函数返回future对象，通过future.result()获取任务函数返回值
@@ -0,0 +1,311 @@
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QTableView
+
+from core.AppThreadExecutor import AppThreadExecutor, PRIORITY_INTERACTIVE
+from utils import timeutils
+from viewmodel.pdviewmodel import PdTable
+
+# 行情表的列
+QUOTE_COLUMNS = ['code', 'name', 'price', 'change', 'volume', 'time']
+
+# 延迟统计保留最近的帧数
+LATENCY_WINDOW = 600
+
+
+class QuoteStreamer(QObject):
+    """
+    实时行情看板的数据流
+    行情源线程 -> 有界队列 -> 合并线程(按代码只保留最新值) -> 定时器按固定帧率发起快照任务
+    -> AppThreadExecutor 线程中生成 DataFrame -> 主线程 PdTable.notify_data 增量刷新
+    不论行情来得多快，主线程每秒最多刷新 fps 次；上一帧还没送达时跳过本帧，不会堆积
+    """
+    # 每一帧刷新到表格后发出，参数为该帧的 DataFrame
+    published = pyqtSignal(object)
+
+    def __init__(self, model: PdTable, source, codes, names=None, pre_close=None, fps=8,
+                 executor=None, max_pending_batches=256):
+        """
+        @param model: 行情表，需要以 'code' 为 key 才能增量刷新
+        @param source: 行情源，实现 start(on_batch) 和 stop()，见 datasource.ticksource
+        @param codes: 看板中的代码
+        @param names: 名称数组，为空时使用代码
+        @param pre_close: 昨收价数组，用于计算涨跌幅，为空时涨跌幅为 NaN
+        @param fps: 每秒最多刷新的帧数
+        @param executor: 生成快照的线程池，为空时新建一个单线程的
+        @param max_pending_batches: 等待合并的行情批数上限，超出后丢弃新的批次
+        """
+        super().__init__()
+        self.model = model
+        self.source = source
+        self.codes = np.asarray(codes, dtype=str)
+        self.names = np.asarray(names if names is not None else self.codes, dtype=object)
+        self.pre_close = np.full(len(self.codes), np.nan) if pre_close is None else np.asarray(pre_close, dtype=float)
+        self.fps = fps
+        self.executor = executor if executor is not None else AppThreadExecutor(max_workers=1)
+        self._index = pd.Index(self.codes)
+
+        # 合并后的最新行情，合并线程写，快照任务读，都在 _lock 内
+        self._lock = threading.Lock()
+        self._price = self.pre_close.copy()
+        self._volume = np.zeros(len(self.codes), dtype=np.int64)
+        self._tick_time = np.zeros(len(self.codes))
+        self._time_str = np.full(len(self.codes), '', dtype=object)
+        # 上一帧之后变化过的行
+        self._dirty = np.zeros(len(self.codes), dtype=bool)
+        # 上一帧之后合并的行情笔数，以及其中最早的行情时间
+        self._pending_ticks = 0
+        self._pending_since = None
+
+        self._batches = queue.Queue(maxsize=max_pending_batches)
+        self._merge_thread = None
+        self._running = False
+        self._in_flight = False
+        # 每次 stop 加一，之前发起的快照结果不再刷新到表格
+        self._generation = 0
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(max(1, int(1000 / fps)))
+        self._timer.timeout.connect(self._on_frame)
+        self._last_frame = None
+
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                # 收到的行情笔数
+                'ticks': 0,
+                # 队列满了被丢弃的行情笔数
+                'dropped': 0,
+                # 不在看板中的代码
+                'unknown': 0,
+                # 同一只股票在同一帧内被后来的行情覆盖的笔数
+                'coalesced': 0,
+                # 刷新到表格的帧数
+                'frames': 0,
+                # 上一帧还没送达而跳过的帧数
+                'skipped_frames': 0,
+            }
+            # 每帧最早的一笔行情到刷新完成的延迟，单位秒
+            self._latencies = deque(maxlen=LATENCY_WINDOW)
+            # 每帧在主线程刷新表格的耗时
+            self._apply_costs = deque(maxlen=LATENCY_WINDOW)
+            # 定时器实际间隔超出设定间隔的部分，反映事件循环是否跟得上
+            self._timer_lags = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        """
+        以昨收价初始化表格，启动行情源、合并线程和刷新定时器
+        """
+        if self._running:
+            return
+        self._running = True
+        self.model.notify_data(self._build_frame(np.arange(len(self.codes))))
+        self._merge_thread = threading.Thread(target=self._merge_loop, name='QuoteMerge', daemon=True)
+        self._merge_thread.start()
+        self.source.start(self._on_batch)
+        self._last_frame = time.perf_counter()
+        self._timer.start()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._timer.stop()
+        self.source.stop()
+        self._batches.put(None)
+        self._merge_thread.join()
+        self._merge_thread = None
+        # 正在进行的快照作废，它的回调可能不会再执行，这里直接清除标记，否则重新 start 后每一帧都会被跳过
+        self._generation += 1
+        self._in_flight = False
+        self.executor.cancel(self._task_key())
+
+    def _on_batch(self, batch):
+        """
+        行情源线程中调用，只入队，不做计算
+        """
+        try:
+            self._batches.put_nowait(batch)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['dropped'] += len(batch.codes)
+
+    def _merge_loop(self):
+        """
+        合并线程，按代码写入最新值，同一只股票只保留最后一笔
+        """
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            self.merge(batch)
+
+    def merge(self, batch):
+        """
+        合并一批行情
+        """
+        rows = self._index.get_indexer(batch.codes)
+        known = rows >= 0
+        unknown = len(rows) - int(np.count_nonzero(known))
+        if unknown:
+            rows = rows[known]
+            batch = type(batch)(*[np.asarray(field)[known] for field in batch])
+        with self._lock:
+            # 同一批中重复的代码，numpy 按顺序赋值，最后一笔生效
+            self._price[rows] = batch.price
+            self._volume[rows] = batch.volume
+            self._tick_time[rows] = batch.time
+            self._dirty[rows] = True
+            self._pending_ticks += len(rows)
+            if len(rows) > 0:
+                oldest = float(np.min(batch.time))
+                if self._pending_since is None or oldest < self._pending_since:
+                    self._pending_since = oldest
+        with self._stats_lock:
+            self._stats['ticks'] += len(rows) + unknown
+            self._stats['unknown'] += unknown
+
+    def _on_frame(self):
+        """
+        主线程定时器，发起一帧快照
+        """
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            lag = now - self._last_frame - self._timer.interval() / 1000
+            self._timer_lags.append(max(0.0, lag))
+        self._last_frame = now
+
+        if self._in_flight:
+            with self._stats_lock:
+                self._stats['skipped_frames'] += 1
+            return
+        with self._lock:
+            if self._pending_ticks == 0:
+                return
+        self._in_flight = True
+        generation = self._generation
+
+        def on_snapshot(future):
+            self._on_snapshot(future, generation)
+
+        self.executor.submit(self._snapshot_task, on_snapshot, priority=PRIORITY_INTERACTIVE, key=self._task_key())
+
+    def _snapshot_task(self):
+        """
+        线程池中执行，取出变化的行并生成整张表的 DataFrame
+        """
+        with self._lock:
+            dirty = np.flatnonzero(self._dirty)
+            self._dirty[dirty] = False
+            pending_ticks, pending_since = self._pending_ticks, self._pending_since
+            self._pending_ticks, self._pending_since = 0, None
+        with self._stats_lock:
+            self._stats['coalesced'] += pending_ticks - len(dirty)
+        return self._build_frame(dirty), pending_since
+
+    def _build_frame(self, dirty):
+        """
+        生成行情表，时间字符串只转换变化的行
+        """
+        with self._lock:
+            price = self._price.copy()
+            volume = self._volume.copy()
+            tick_time = self._tick_time[dirty]
+        formatted = np.full(len(dirty), '', dtype=object)
+        has_time = tick_time > 0
+        if has_time.any():
+            formatted[has_time] = timeutils.stamp_to_str_array(tick_time[has_time], '%H:%M:%S')
+        self._time_str[dirty] = formatted
+        return pd.DataFrame({
+            'code': self.codes,
+            'name': self.names,
+            'price': price,
+            'change': np.round((price / self.pre_close - 1) * 100, 2),
+            'volume': volume,
+            'time': self._time_str.copy(),
+        }, columns=QUOTE_COLUMNS)
+
+    def _on_snapshot(self, future, generation):
+        """
+        主线程执行，把快照刷新到表格
+        @param generation: 发起快照时的 _generation，期间 stop 过的结果直接丢弃
+        """
+        if generation != self._generation:
+            return
+        self._in_flight = False
+        if not self._running:
+            return
+        try:
+            frame, pending_since = future.result()
+        except Exception as e:
+            print('行情快照失败', e)
+            return
+        start = time.perf_counter()
+        self.model.notify_data(frame)
+        self._apply_costs.append(time.perf_counter() - start)
+        if pending_since is not None:
+            self._latencies.append(time.time() - pending_since)
+        with self._stats_lock:
+            self._stats['frames'] += 1
+        self.published.emit(frame)
+
+    def _task_key(self):
+        return f'quote_snapshot_{id(self)}'
+
+    def stats(self):
+        """
+        统计数据，时间单位为毫秒
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['pending_batches'] = self._batches.qsize()
+        stats['latency_ms'] = _summary(self._latencies)
+        stats['apply_ms'] = _summary(self._apply_costs)
+        stats['timer_lag_ms'] = _summary(self._timer_lags)
+        return stats
+
+
+def _summary(values):
+    """
+    p50/p95/max，单位毫秒
+    """
+    if not values:
+        return {'p50': None, 'p95': None, 'max': None}
+    values = np.asarray(values) * 1000
+    return {'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'max': float(values.max())}
+
+
+if __name__ == '__main__':
+    from datasource.ticksource import FakeTickSource
+
+    # 压测：5000 只股票，每只每秒 10 笔
+    app = QApplication(sys.argv)
+    symbols = [f'{i:06d}' for i in range(5000)]
+    tick_source = FakeTickSource(symbols, ticks_per_second=10)
+    quote_model = PdTable(key='code', formats={'price': '%.2f', 'change': '%.2f'})
+    streamer = QuoteStreamer(quote_model, tick_source, symbols, pre_close=tick_source.pre_close, fps=8)
+
+    win = QMainWindow()
+    table = QTableView()
+    table.setModel(quote_model)
+    win.setCentralWidget(table)
+    win.resize(800, 600)
+    win.show()
+
+    report_timer = QTimer()
+    report_timer.timeout.connect(lambda: print(streamer.stats()))
+    report_timer.start(1000)
+    streamer.start()
+    sys.exit(app.exec_())
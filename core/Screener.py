@@ -0,0 +1,430 @@
+import ast
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QLabel, QLineEdit, QMainWindow, QTableView, QVBoxLayout, QWidget
+
+from core.AppThreadExecutor import AppThreadExecutor, PRIORITY_INTERACTIVE
+from datasource.panel import PANEL_FIELDS, SymbolPanel
+from viewmodel.pdviewmodel import PdTable
+
+"""
+截面选股
+选股条件是 Python 表达式语法，解析为语法树后只允许白名单内的节点，对整个 日期 × 代码 面板一次向量化计算，
+不按代码循环，例如：
+    close > MA20 and volume > 2 * MA(volume, 5)
+    CROSS(MA5, MA20) and pct > 3
+可用的名称：
+    字段 open close high low volume amount pct turnover，以及对应的中文列名 收盘 成交量 等
+    MA20 EMA12 HHV20 LLV20 STD20 REF1 这类简写，等价于对 close 调用同名函数
+函数(n 为天数，都沿日期方向计算，窗口内有 NaN 时结果为 NaN)：
+    MA(x, n) EMA(x, n) HHV(x, n) LLV(x, n) STD(x, n) SUM(x, n) REF(x, n) COUNT(条件, n)
+    CROSS(a, b) ABS(x) MAX(a, b) MIN(a, b)
+"""
+
+# 结果表固定显示的列
+RESULT_COLUMNS = ['code', 'name', 'close', 'pct']
+# Screener 缓存子表达式结果的总字节数上限，5000 只股票 250 天的一个数组约 10MB
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# 缓存中没有该 key
+_MISSING = object()
+
+
+def _window(x, n, func):
+    """
+    沿日期方向的滑动窗口，前 n - 1 天为 NaN
+    """
+    n = int(n)
+    result = np.full(x.shape, np.nan)
+    if n <= len(x):
+        result[n - 1:] = func(np.lib.stride_tricks.sliding_window_view(x, n, axis=0), axis=-1)
+    return result
+
+
+def _ma(x, n):
+    n = int(n)
+    # 累加和相减，O(日期数 × 代码数)；NaN 按 0 累加，再用计数判断窗口是否完整
+    valid = ~np.isnan(x)
+    total = np.cumsum(np.where(valid, x, 0.0), axis=0)
+    count = np.cumsum(valid, axis=0)
+    result = np.full(x.shape, np.nan)
+    if n <= len(x):
+        window_sum = total[n - 1:].copy()
+        window_sum[1:] -= total[:-n]
+        window_count = count[n - 1:].copy()
+        window_count[1:] -= count[:-n]
+        result[n - 1:] = np.where(window_count == n, window_sum / n, np.nan)
+    return result
+
+
+def _ema(x, n):
+    alpha = 2 / (int(n) + 1)
+    result = np.empty(x.shape)
+    last = np.full(x.shape[1:], np.nan)
+    # 沿日期递推，每一步对全部代码向量化；停牌的日期保持上一个值
+    for i in range(len(x)):
+        value = x[i]
+        last = np.where(np.isnan(last), value, np.where(np.isnan(value), last, alpha * value + (1 - alpha) * last))
+        result[i] = np.where(np.isnan(value), np.nan, last)
+    return result
+
+
+def _ref(x, n):
+    n = int(n)
+    result = np.full(x.shape, np.nan)
+    if n == 0:
+        return x
+    if n < len(x):
+        result[n:] = x[:-n]
+    return result
+
+
+def _sum(x, n):
+    return _ma(x, n) * int(n)
+
+
+def _count(condition, n):
+    return _ma(np.asarray(condition, dtype=np.float64), n) * int(n)
+
+
+def _cross(a, b):
+    return (a > b) & (_ref(a, 1) <= _ref(b, 1))
+
+
+FUNCTIONS = {
+    'MA': _ma,
+    'EMA': _ema,
+    'HHV': lambda x, n: _window(x, n, np.max),
+    'LLV': lambda x, n: _window(x, n, np.min),
+    'STD': lambda x, n: _window(x, n, np.std),
+    'SUM': _sum,
+    'REF': _ref,
+    'COUNT': _count,
+    'CROSS': _cross,
+    'ABS': np.abs,
+    'MAX': np.fmax,
+    'MIN': np.fmin,
+}
+
+# MA20 这类简写
+_SHORTHAND = re.compile(r'^(MA|EMA|HHV|LLV|STD|SUM|REF)(\d+)$')
+
+_BINARY = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide, ast.Pow: np.power}
+_COMPARE = {ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less, ast.LtE: np.less_equal,
+            ast.Eq: np.equal, ast.NotEq: np.not_equal}
+
+
+class ScreenExpression:
+    """
+    编译后的选股条件，只做语法检查，计算时才读取面板
+    """
+
+    def __init__(self, text):
+        """
+        @param text: 选股条件，语法错误或者用到白名单之外的语法时抛出 ValueError
+        """
+        self.text = text
+        try:
+            self._tree = ast.parse(text.replace('×', '*'), mode='eval').body
+        except SyntaxError as e:
+            raise ValueError(f'选股条件语法错误: {e.msg}') from e
+        # 条件中出现的数值项，例如 MA20、MA(volume, 5)，显示在结果表中
+        self.terms = []
+        self._check(self._tree)
+
+    def _check(self, node):
+        if isinstance(node, ast.BoolOp):
+            for value in node.values:
+                self._check(value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub, ast.UAdd)):
+            self._check(node.operand)
+        elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+            for operand in [node.left] + node.comparators:
+                self._check(operand)
+                if not isinstance(operand, ast.Constant):
+                    self._add_term(operand)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            pass
+        elif isinstance(node, ast.Name):
+            if _resolve_name(node.id) is None:
+                raise ValueError(f'未知的名称: {node.id}')
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id.upper() in FUNCTIONS \
+                and not node.keywords:
+            for arg in node.args:
+                self._check(arg)
+        else:
+            raise ValueError(f'不支持的语法: {ast.unparse(node)}')
+
+    def _add_term(self, node):
+        term = ast.unparse(node)
+        if term not in self.terms and not isinstance(node, (ast.Compare, ast.BoolOp)):
+            self.terms.append(term)
+
+    def evaluate(self, panel: SymbolPanel, cache=None):
+        """
+        对整个面板计算，返回 (日期数, 代码数) 的 bool 数组
+        @param cache: 子表达式的结果缓存 {表达式: 数组}，多个条件共用同一个面板时可以传入同一个 dict 或 ExpressionCache
+        """
+        cache = {} if cache is None else cache
+        result = _evaluate(self._tree, panel, cache)
+        return np.broadcast_to(np.asarray(result, dtype=bool), (len(panel.dates), len(panel.codes)))
+
+    def term_values(self, panel: SymbolPanel, position, cache=None):
+        """
+        每个数值项在某一天的截面 {表达式: 代码数长度的数组}
+        """
+        cache = {} if cache is None else cache
+        values = {}
+        for term in self.terms:
+            value = _evaluate(ast.parse(term, mode='eval').body, panel, cache)
+            values[term] = np.broadcast_to(value, (len(panel.dates), len(panel.codes)))[position]
+        return values
+
+
+def _resolve_name(name):
+    """
+    名称对应的 (函数, 字段, 参数)，字段直接读取时函数为空，无法识别时返回 None
+    """
+    if name in panel_field_names():
+        return None, panel_field_names()[name], None
+    match = _SHORTHAND.match(name.upper())
+    if match is not None:
+        return FUNCTIONS[match.group(1)], 'close', int(match.group(2))
+    return None
+
+
+def panel_field_names():
+    """
+    表达式中可用的字段名 {名称: 面板字段}，英文字段和中文列名都可以使用
+    """
+    names = {name: name for name in PANEL_FIELDS}
+    names.update({column: name for name, column in PANEL_FIELDS.items()})
+    return names
+
+
+class ExpressionCache:
+    """
+    子表达式结果的 LRU 缓存，总字节数超出上限时淘汰最久没用的，线程安全
+    与 dict 一样支持 get 和 cache[key] = value，可以作为 screen 的 cache 参数
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        size = int(getattr(value, 'nbytes', 0))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, _MISSING)
+            if old is not _MISSING:
+                self.bytes -= int(getattr(old, 'nbytes', 0))
+            self._entries[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= int(getattr(evicted, 'nbytes', 0))
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _evaluate(node, panel, cache):
+    key = ast.dump(node)
+    cached = cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+    if isinstance(node, ast.Constant):
+        result = node.value
+    elif isinstance(node, ast.Name):
+        func, field, n = _resolve_name(node.id)
+        result = panel[field] if func is None else func(panel[field], n)
+    elif isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        result = _evaluate(node.values[0], panel, cache)
+        for value in node.values[1:]:
+            result = combine(result, _evaluate(value, panel, cache))
+    elif isinstance(node, ast.UnaryOp):
+        operand = _evaluate(node.operand, panel, cache)
+        if isinstance(node.op, ast.Not):
+            result = np.logical_not(operand)
+        else:
+            result = -operand if isinstance(node.op, ast.USub) else operand
+    elif isinstance(node, ast.BinOp):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = _BINARY[type(node.op)](_evaluate(node.left, panel, cache), _evaluate(node.right, panel, cache))
+    elif isinstance(node, ast.Compare):
+        # a < b < c 按 a < b and b < c 计算，NaN 的比较结果为 False
+        left = _evaluate(node.left, panel, cache)
+        result = True
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, panel, cache)
+            with np.errstate(invalid='ignore'):
+                result = np.logical_and(result, _COMPARE[type(op)](left, right))
+            left = right
+    else:
+        func = FUNCTIONS[node.func.id.upper()]
+        args = [_evaluate(arg, panel, cache) for arg in node.args]
+        with np.errstate(invalid='ignore'):
+            result = func(*args)
+    cache[key] = result
+    return result
+
+
+def screen(panel: SymbolPanel, expression, date=None, cache=None) -> pd.DataFrame:
+    """
+    选出某一天满足条件的代码
+    @param expression: 选股条件字符串或 ScreenExpression
+    @param date: 日期，为空时为面板的最后一天
+    @return: 结果表，列为 code、name、close、pct 以及条件中的数值项
+    """
+    if not isinstance(expression, ScreenExpression):
+        expression = ScreenExpression(expression)
+    if len(panel.dates) == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS + expression.terms)
+    cache = {} if cache is None else cache
+    position = panel.date_position(date)
+    selected = np.flatnonzero(expression.evaluate(panel, cache)[position])
+    result = {'code': panel.codes[selected], 'name': panel.names[selected]}
+    for field in ('close', 'pct'):
+        result[field] = panel[field][position, selected] if field in panel.fields else np.nan
+    for term, values in expression.term_values(panel, position, cache).items():
+        if term not in result:
+            result[term] = values[selected]
+    return pd.DataFrame(result)
+
+
+class Screener(QObject):
+    """
+    在线程池中选股，结果刷新到 PdTable
+    连续修改条件时，还没开始的旧任务被新任务替换，只显示最后一次的结果
+    """
+    # 选股完成，参数为 (条件, 结果 DataFrame, 耗时秒)
+    finished = pyqtSignal(str, object, float)
+    # 条件错误或计算失败，参数为 (条件, 错误信息)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, model: PdTable, panel: SymbolPanel = None, executor=None, cache_bytes=CACHE_MAX_BYTES):
+        """
+        @param model: 显示结果的表格模型
+        @param panel: 面板，也可以之后通过 set_panel 设置
+        @param executor: 线程池，为空时新建一个单线程的
+        @param cache_bytes: 子表达式结果缓存的总字节数上限
+        """
+        super().__init__()
+        self.model = model
+        self.panel = panel
+        self.executor = executor if executor is not None else AppThreadExecutor(max_workers=1)
+        # 同一个面板上子表达式的结果缓存，换面板时换一个新的，还在计算的旧任务只写旧缓存
+        self._cache = ExpressionCache(cache_bytes)
+        self._generation = 0
+
+    def set_panel(self, panel: SymbolPanel):
+        self.panel = panel
+        self._cache = ExpressionCache(self._cache.max_bytes)
+
+    def run(self, text, date=None):
+        """
+        提交选股，语法错误直接发出 failed
+        """
+        try:
+            expression = ScreenExpression(text)
+        except ValueError as e:
+            self.failed.emit(text, str(e))
+            return
+        self._generation += 1
+        generation = self._generation
+        panel, cache = self.panel, self._cache
+
+        def task():
+            start = time.perf_counter()
+            return screen(panel, expression, date, cache), time.perf_counter() - start
+
+        def callback(future):
+            if generation != self._generation:
+                return
+            try:
+                result, cost = future.result()
+            except Exception as e:
+                self.failed.emit(text, f'{type(e).__name__}: {e}')
+                return
+            self.model.notify_data(result)
+            self.finished.emit(text, result, cost)
+
+        self.executor.submit(task, callback, priority=PRIORITY_INTERACTIVE, key=f'screener_{id(self)}',
+                             task_name='Screener.run')
+
+
+def make_panel(dates=250, symbols=5000, seed=0):
+    """
+    随机游走的测试面板
+    """
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.02, (dates, symbols))
+    close = 10 * np.exp(np.cumsum(returns, axis=0))
+    volume = rng.lognormal(13, 0.5, (dates, symbols))
+    volume[-1, :symbols // 20] *= 3
+    fields = {
+        'close': close,
+        'open': close / np.exp(returns),
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'volume': volume,
+        'pct': (np.exp(returns) - 1) * 100,
+    }
+    codes = np.char.zfill(np.arange(symbols).astype(str), 6)
+    return SymbolPanel(np.busday_offset('2022-01-03', np.arange(dates)), codes, fields, np.char.add('股票', codes))
+
+
+if __name__ == '__main__':
+    demo_panel = make_panel()
+    condition = 'close > MA20 and volume > 2 * MA(volume, 5)'
+    start_time = time.perf_counter()
+    print(screen(demo_panel, condition).head())
+    print(f'{len(demo_panel.codes)} 只 × {len(demo_panel.dates)} 天 选股耗时 {(time.perf_counter() - start_time) * 1000:.1f}ms')
+
+    app = QApplication(sys.argv)
+    result_model = PdTable(key='code', formats={'close': '%.2f', 'pct': '%.2f'})
+    screener = Screener(result_model, demo_panel)
+
+    win = QMainWindow()
+    central = QWidget()
+    layout = QVBoxLayout(central)
+    condition_edit = QLineEdit(condition)
+    status = QLabel()
+    table = QTableView()
+    table.setModel(result_model)
+    table.setSortingEnabled(True)
+    layout.addWidget(condition_edit)
+    layout.addWidget(status)
+    layout.addWidget(table)
+    condition_edit.returnPressed.connect(lambda: screener.run(condition_edit.text()))
+    screener.finished.connect(lambda text, df, cost: status.setText(f'{len(df)} 只 耗时 {cost * 1000:.1f}ms'))
+    screener.failed.connect(lambda text, message: status.setText(message))
+    win.setCentralWidget(central)
+    win.resize(800, 600)
+    win.show()
+    screener.run(condition)
+    sys.exit(app.exec_())
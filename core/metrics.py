@@ -0,0 +1,318 @@
+"""
+线程池任务与事件循环的运行指标
+AppThreadExecutor 按任务名统计排队耗时、执行耗时、回调送达主线程的延迟、回调耗时、执行中的数量和失败次数；
+EventLoopLagMonitor 通过定时器的漂移统计事件循环的延迟，主线程卡住时由看门狗线程记录当时的调用栈。
+每条记录都会交给注册的输出(sink)，sink 只需要实现 emit(record)，record 是 dict：
+    {'type': 'task', 'name', 'queue_ms', 'run_ms', 'dispatch_ms', 'callback_ms', 'ok', 'error'}
+    {'type': 'loop_lag', 'lag_ms', 'callback'}  callback 为延迟期间耗时最长的任务回调
+    {'type': 'stall', 'stall_ms', 'callback', 'stack'}
+"""
+
+import json
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer
+
+# 每个任务名保留最近的耗时数量，用于计算分位数
+RECENT_SIZE = 256
+
+
+class _TaskStats:
+    """
+    单个任务名的统计
+    """
+    __slots__ = ('count', 'failures', 'in_flight', 'queue', 'run', 'dispatch', 'callback')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.in_flight = 0
+        # 最近的耗时，单位秒
+        self.queue = deque(maxlen=RECENT_SIZE)
+        self.run = deque(maxlen=RECENT_SIZE)
+        self.dispatch = deque(maxlen=RECENT_SIZE)
+        self.callback = deque(maxlen=RECENT_SIZE)
+
+
+class MetricsRegistry:
+    """
+    指标汇总，线程安全
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self._sinks = []
+        self._loop_lags = deque(maxlen=RECENT_SIZE)
+        self._stalls = 0
+        # 主线程正在执行的回调名，卡顿时用于定位
+        self.current_callback = None
+        # 上一次取走之后耗时最长的回调 (任务名, 耗时)
+        self._slowest_callback = None
+
+    def add_sink(self, sink):
+        with self._lock:
+            if sink not in self._sinks:
+                self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        with self._lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def emit(self, record):
+        """
+        把记录交给所有 sink，sink 出错不影响其他 sink
+        """
+        with self._lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                print('指标输出失败', type(sink).__name__, e)
+
+    def _stats(self, name):
+        stats = self._tasks.get(name)
+        if stats is None:
+            stats = self._tasks[name] = _TaskStats()
+        return stats
+
+    def task_started(self, name, queue_time):
+        """
+        任务开始执行，线程池中调用
+        @param queue_time: 排队耗时，单位秒
+        """
+        with self._lock:
+            stats = self._stats(name)
+            stats.in_flight += 1
+            stats.queue.append(queue_time)
+
+    def task_finished(self, name, run_time, failed):
+        """
+        任务执行结束，线程池中调用
+        """
+        with self._lock:
+            stats = self._stats(name)
+            stats.in_flight -= 1
+            stats.count += 1
+            stats.run.append(run_time)
+            if failed:
+                stats.failures += 1
+
+    def task_dispatched(self, name, queue_time, run_time, dispatch_time, callback_time, error=None):
+        """
+        回调在主线程执行完，输出一条任务记录
+        @param error: 任务或回调的异常
+        """
+        with self._lock:
+            stats = self._stats(name)
+            stats.dispatch.append(dispatch_time)
+            if callback_time is not None:
+                stats.callback.append(callback_time)
+                if self._slowest_callback is None or callback_time > self._slowest_callback[1]:
+                    self._slowest_callback = (name, callback_time)
+        self.emit({
+            'type': 'task',
+            'name': name,
+            'queue_ms': queue_time * 1000,
+            'run_ms': run_time * 1000,
+            'dispatch_ms': dispatch_time * 1000,
+            'callback_ms': None if callback_time is None else callback_time * 1000,
+            'ok': error is None,
+            'error': None if error is None else repr(error),
+        })
+
+    def take_slowest_callback(self):
+        """
+        取出上一次调用之后耗时最长的回调名，没有时返回 None
+        """
+        with self._lock:
+            slowest, self._slowest_callback = self._slowest_callback, None
+        return None if slowest is None else slowest[0]
+
+    def callback_failed(self, name):
+        with self._lock:
+            self._stats(name).failures += 1
+
+    def loop_lag(self, lag):
+        """
+        记录一次事件循环延迟，单位秒
+        """
+        with self._lock:
+            self._loop_lags.append(lag)
+
+    def stall(self):
+        with self._lock:
+            self._stalls += 1
+
+    def snapshot(self):
+        """
+        当前的统计，时间单位为毫秒
+        @return: {'tasks': {任务名: {...}}, 'loop_lag_ms': {...}, 'stalls': 卡顿次数}
+        """
+        with self._lock:
+            tasks = {name: {
+                'count': stats.count,
+                'failures': stats.failures,
+                'in_flight': stats.in_flight,
+                'queue_ms': _summary(stats.queue),
+                'run_ms': _summary(stats.run),
+                'dispatch_ms': _summary(stats.dispatch),
+                'callback_ms': _summary(stats.callback),
+            } for name, stats in self._tasks.items()}
+            return {'tasks': tasks, 'loop_lag_ms': _summary(self._loop_lags), 'stalls': self._stalls}
+
+    def reset(self):
+        with self._lock:
+            self._tasks.clear()
+            self._loop_lags.clear()
+            self._stalls = 0
+
+
+def _summary(values):
+    """
+    p50/p95/max，单位毫秒
+    """
+    if not values:
+        return {'p50': None, 'p95': None, 'max': None}
+    values = np.asarray(values) * 1000
+    return {'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'max': float(values.max())}
+
+
+# 默认的指标汇总，AppThreadExecutor 没有指定时使用
+registry = MetricsRegistry()
+
+
+class LogSink:
+    """
+    打印到控制台，只打印慢任务、事件循环延迟和卡顿
+    """
+
+    def __init__(self, slow_ms=100.0):
+        """
+        @param slow_ms: 任务的执行耗时或回调耗时超过该值才打印
+        """
+        self.slow_ms = slow_ms
+
+    def emit(self, record):
+        if record['type'] == 'task':
+            slow = max(record['run_ms'], record['callback_ms'] or 0, record['dispatch_ms'])
+            if slow < self.slow_ms and record['ok']:
+                return
+            print(f"任务 {record['name']} 排队 {record['queue_ms']:.1f}ms 执行 {record['run_ms']:.1f}ms "
+                  f"送达 {record['dispatch_ms']:.1f}ms 回调 {record['callback_ms'] or 0:.1f}ms"
+                  + ('' if record['ok'] else f" 失败 {record['error']}"))
+        elif record['type'] == 'loop_lag':
+            print(f"事件循环延迟 {record['lag_ms']:.1f}ms 回调 {record['callback']}")
+        elif record['type'] == 'stall':
+            print(f"主线程卡住 {record['stall_ms']:.0f}ms 回调 {record['callback']}")
+            print(''.join(record['stack']))
+
+
+class JsonLinesSink:
+    """
+    每条记录一行 json 追加到文件，便于事后分析
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(dict(record, ts=time.time()), ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class MemorySink:
+    """
+    保留最近的记录，用于界面展示或调试
+    """
+
+    def __init__(self, maxlen=1000):
+        self.records = deque(maxlen=maxlen)
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class EventLoopLagMonitor(QObject):
+    """
+    事件循环延迟监控
+    主线程定时器按固定间隔触发，实际间隔超出设定间隔的部分即事件循环延迟，超过 lag_ms 时输出记录；
+    看门狗线程检查主线程的心跳，超过 stall_ms 没有心跳时记录主线程当时的调用栈和正在执行的回调，
+    不必等主线程恢复就能知道卡在哪里
+    """
+
+    def __init__(self, interval_ms=100, lag_ms=50, stall_ms=500, metrics=None, parent=None):
+        """
+        @param interval_ms: 定时器间隔
+        @param lag_ms: 延迟超过该值才输出记录
+        @param stall_ms: 主线程超过该时间没有心跳视为卡住，为 0 时不启动看门狗线程
+        @param metrics: 指标汇总，默认为 registry
+        """
+        super().__init__(parent)
+        self.metrics = metrics if metrics is not None else registry
+        self.lag_ms = lag_ms
+        self.stall_ms = stall_ms
+        self._timer = QTimer(self)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._on_timeout)
+        self._last = None
+        # 定时器间隔(秒)，启动时记录，看门狗线程不能访问属于主线程的 QTimer
+        self._interval = interval_ms / 1000
+        self._main_thread_id = threading.main_thread().ident
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        self._interval = self._timer.interval() / 1000
+        self._last = time.perf_counter()
+        self._timer.start()
+        if self.stall_ms > 0 and self._watchdog is None:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='EventLoopWatchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    def _on_timeout(self):
+        now = time.perf_counter()
+        lag = max(0.0, now - self._last - self._interval)
+        self._last = now
+        self.metrics.loop_lag(lag)
+        # 延迟期间耗时最长的回调，最可能是造成延迟的原因
+        callback = self.metrics.take_slowest_callback()
+        if lag * 1000 >= self.lag_ms:
+            self.metrics.emit({'type': 'loop_lag', 'lag_ms': lag * 1000, 'callback': callback})
+
+    def _watch(self):
+        """
+        看门狗线程，同一次卡顿只记录一次
+        """
+        reported = None
+        while not self._stop.wait(self.stall_ms / 4000):
+            last = self._last
+            stalled = time.perf_counter() - last - self._interval
+            if stalled * 1000 < self.stall_ms or reported == last:
+                continue
+            reported = last
+            frame = sys._current_frames().get(self._main_thread_id)
+            stack = traceback.format_stack(frame) if frame is not None else []
+            self.metrics.stall()
+            self.metrics.emit({'type': 'stall', 'stall_ms': stalled * 1000,
+                               'callback': self.metrics.current_callback, 'stack': stack})
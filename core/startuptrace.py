@@ -0,0 +1,193 @@
+import importlib.abc
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+启动耗时统计
+设置环境变量 QUANT_UI_STARTUP_TRACE=1 开启，统计每个阶段的耗时以及各个包的导入耗时，
+首个窗口显示后输出；设置为 .json 结尾的路径时，结果同时写入该文件，便于对比。
+设置 QUANT_UI_STARTUP_BUDGET_MS 后，首个窗口显示的耗时超出预算会给出提示。
+需要在入口文件中最先导入本模块，才能统计到后续的导入耗时
+"""
+
+ENV_TRACE = 'QUANT_UI_STARTUP_TRACE'
+ENV_BUDGET = 'QUANT_UI_STARTUP_BUDGET_MS'
+
+# 统计的起点
+_origin = time.perf_counter()
+# 阶段耗时 [(名称, 开始时间, 耗时)]，单位秒
+_phases = []
+# 时间点 {名称: 距离起点的时间}
+_marks = {}
+# 每个模块的导入耗时(包含它导入的子模块)
+_imports = {}
+# 每个模块自身的导入耗时(不包含它导入的其他模块)
+_import_self = {}
+# 每个线程正在导入的模块，栈中每项为已经计入的子模块耗时
+_import_stack = threading.local()
+
+
+def enabled():
+    return bool(os.environ.get(ENV_TRACE))
+
+
+@contextmanager
+def phase(name):
+    """
+    统计一个阶段的耗时
+    with startuptrace.phase('初始化主窗口'):
+        ...
+    """
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, start - _origin, time.perf_counter() - start))
+
+
+def mark(name):
+    """
+    记录一个时间点
+    """
+    if enabled():
+        _marks[name] = time.perf_counter() - _origin
+
+
+def result():
+    """
+    统计结果，时间单位为毫秒
+    """
+    # 按顶层包汇总自身耗时，子模块的耗时计入所属的包
+    packages = {}
+    for name, cost in _import_self.items():
+        package = name.split('.', 1)[0]
+        packages[package] = packages.get(package, 0.0) + cost
+    first_window = _marks.get('首个窗口显示')
+    budget = os.environ.get(ENV_BUDGET)
+    return {
+        'phases': [{'name': name, 'start_ms': start * 1000, 'cost_ms': cost * 1000} for name, start, cost in _phases],
+        'marks': {name: value * 1000 for name, value in _marks.items()},
+        'packages': {name: cost * 1000 for name, cost in sorted(packages.items(), key=lambda item: -item[1])},
+        'imports': [{'name': name, 'self_ms': cost * 1000, 'total_ms': _imports.get(name, cost) * 1000}
+                    for name, cost in sorted(_import_self.items(), key=lambda item: -item[1])],
+        'first_window_ms': None if first_window is None else first_window * 1000,
+        'budget_ms': None if budget is None else float(budget),
+    }
+
+
+def report(top=15):
+    """
+    输出统计结果
+    @param top: 导入耗时只输出最耗时的 top 个包和 top 个模块
+    """
+    if not enabled():
+        return None
+    data = result()
+    print('启动耗时统计')
+    for item in data['phases']:
+        print(f"  阶段 {item['name']:<24} 开始 {item['start_ms']:>8.1f}ms 耗时 {item['cost_ms']:>8.1f}ms")
+    for name, value in data['marks'].items():
+        print(f"  时间点 {name:<22} {value:>8.1f}ms")
+    for name, cost in list(data['packages'].items())[:top]:
+        print(f"  导入包 {name:<22} {cost:>8.1f}ms")
+    # 最耗时的模块，自身耗时不包含它导入的其他模块
+    for item in data['imports'][:top]:
+        print(f"  导入 {item['name']:<32} 自身 {item['self_ms']:>8.1f}ms 合计 {item['total_ms']:>8.1f}ms")
+
+    if data['budget_ms'] is not None and data['first_window_ms'] is not None \
+            and data['first_window_ms'] > data['budget_ms']:
+        print(f"  首个窗口显示耗时 {data['first_window_ms']:.1f}ms 超出预算 {data['budget_ms']:.1f}ms")
+
+    path = os.environ.get(ENV_TRACE)
+    if path.endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return data
+
+
+def report_when_shown():
+    """
+    事件循环处理完首个窗口的显示后，记录时间点并输出统计结果
+    """
+    if not enabled():
+        return
+    from PyQt5.QtCore import QTimer
+
+    def on_shown():
+        mark('首个窗口显示')
+        report()
+
+    QTimer.singleShot(0, on_shown)
+
+
+class _TimedLoader:
+    """
+    包装模块加载器，统计 create_module 和 exec_module 的耗时，
+    扩展模块(例如 PyQt5.QtWidgets)的动态库在 create_module 中加载
+    """
+
+    def __init__(self, loader, fullname):
+        self._loader = loader
+        self._fullname = fullname
+
+    def create_module(self, spec):
+        return _timed(self._fullname, self._loader.create_module, spec)
+
+    def exec_module(self, module):
+        # 加载器可能会检查 module.__spec__.loader，这里还原为原始的加载器
+        module.__spec__.loader = self._loader
+        module.__loader__ = self._loader
+        _timed(self._fullname, self._loader.exec_module, module)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+def _timed(fullname, func, *args):
+    """
+    执行 func 并把耗时累加到模块 fullname 上，期间导入的其他模块的耗时不计入自身耗时
+    """
+    stack = getattr(_import_stack, 'children', None)
+    if stack is None:
+        stack = _import_stack.children = []
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        cost = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            # 计入正在导入它的模块
+            stack[-1] += cost
+        _imports[fullname] = _imports.get(fullname, 0.0) + cost
+        _import_self[fullname] = _import_self.get(fullname, 0.0) + max(cost - children, 0.0)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    导入钩子，交给其他 finder 查找模块，只替换加载器用于计时
+    """
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(spec.loader, fullname)
+            return spec
+        return None
+
+
+if enabled() and not any(isinstance(finder, _ImportTimer) for finder in sys.meta_path):
+    sys.meta_path.insert(0, _ImportTimer())
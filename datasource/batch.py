@@ -0,0 +1,114 @@
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from datasource import datasource
+from datasource.provider import HIST_COLUMNS
+from utils import tradecalendar
+
+"""
+批量获取多个代码的日线
+线程池并发请求，数据源的限速由 provider_limiter 控制，连接失败和超时会重试
+"""
+
+# 需要重试的异常，只有连接失败和超时，文件、权限等其他 OSError 重试也不会成功
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, socket.timeout)
+try:
+    # akshare 通过 requests 请求，requests 的连接失败、超时不是内置 ConnectionError 的子类
+    import requests
+    TRANSIENT_ERRORS += (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+except ImportError:
+    pass
+
+
+def iter_hist_batch(codes, start_time, end_time, adjust='qfq', max_workers=8, retries=3, backoff=0.5,
+                    retry_counts=None):
+    """
+    并发获取多个代码的日线，哪个先完成先返回哪个
+    :param codes: 代码数组
+    :param start_time: 开始日期 '%Y-%m-%d'
+    :param end_time: 结束日期 '%Y-%m-%d'
+    :param adjust: 复权方式
+    :param max_workers: 最大并发数
+    :param retries: 连接失败、超时的重试次数
+    :param backoff: 第一次重试前等待的秒数，之后每次翻倍
+    :param retry_counts: dict，传入时记录重试过的代码及其重试次数 {code: 次数}
+    :return: 生成器，每个代码返回一次 (code, DataFrame, error)，失败时 DataFrame 为 None
+    """
+    codes = list(dict.fromkeys(str(code) for code in codes))
+    if retry_counts is None:
+        retry_counts = {}
+    # 首尾收缩到交易日，区间内没有交易日时不请求
+    sessions = tradecalendar.get_calendar().clamp(start_time, end_time)
+    if sessions is None:
+        for code in codes:
+            yield code, pd.DataFrame(columns=HIST_COLUMNS), None
+        return
+    start_time, end_time = sessions
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hist_batch')
+    try:
+        futures = {pool.submit(_fetch_with_retry, code, start_time, end_time, adjust, retries, backoff,
+                               retry_counts): code
+                   for code in codes}
+        for future in as_completed(futures):
+            code = futures[future]
+            try:
+                yield code, future.result(), None
+            except Exception as e:
+                yield code, None, e
+    finally:
+        # 调用方提前停止迭代时，取消还没开始的任务
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def data_hist_batch(codes, start_time, end_time, adjust='qfq', max_workers=8, retries=3, backoff=0.5,
+                    on_result=None, compact=False) -> pd.DataFrame:
+    """
+    并发获取多个代码的日线，合并为长表，第一列为 code
+    :param on_result: 每个代码完成时的回调 on_result(code, DataFrame, error)，在工作线程之外的调用线程执行
+    :param compact: True 时压缩合并后的列类型，code 列变为 category，压缩报告在 df.attrs['compact_report']
+    :return: 合并后的 DataFrame，失败的代码及异常记录在 df.attrs['errors'] 中，
+    重试过的代码及重试次数记录在 df.attrs['retries'] 中
+    """
+    frames = []
+    errors = {}
+    retry_counts = {}
+    for code, df, error in iter_hist_batch(codes, start_time, end_time, adjust, max_workers, retries, backoff,
+                                           retry_counts):
+        if on_result is not None:
+            on_result(code, df, error)
+        if error is not None:
+            errors[code] = error
+        elif df is not None and len(df) > 0:
+            frames.append(df.assign(code=code))
+
+    if frames:
+        result = pd.concat(frames, ignore_index=True)
+        result = result[['code'] + [column for column in result.columns if column != 'code']]
+    else:
+        result = pd.DataFrame(columns=['code'])
+    if compact:
+        result = datasource.compact_hist(result)
+    result.attrs['errors'] = errors
+    result.attrs['retries'] = dict(retry_counts)
+    return result
+
+
+def _fetch_with_retry(code, start_time, end_time, adjust, retries, backoff, retry_counts):
+    """
+    获取单个代码的日线，连接失败、超时时指数退避重试，重试次数记录在 retry_counts 中，不逐次输出
+    """
+    attempt = 0
+    while True:
+        try:
+            return datasource.data_hist(code, start_time, end_time, adjust)
+        except TRANSIENT_ERRORS as e:
+            if attempt >= retries:
+                raise
+            wait = backoff * (2 ** attempt)
+            attempt += 1
+            # 每个代码只由一个线程写入
+            retry_counts[code] = attempt
+            time.sleep(wait)
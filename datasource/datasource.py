@@ -1,13 +1,80 @@
-import akshare as ak
 import pandas as pd
 
-from utils import timeutils
+from datasource.histstore import HistStore
+from datasource.provider import AkshareHistProvider
+from datasource.singleflight import SingleFlight
+from utils.frameutils import compact_frame
 
+# 日线本地存储，第一次使用时创建
+_hist_store = None
 
-def data_hist(code, start_time, end_time) -> pd.DataFrame:
-    df = ak.stock_zh_a_hist(
-        symbol=str(code),
-        start_date=timeutils.format_convert(start_time, '%Y-%m-%d', '%Y%m%d'),
-        end_date=timeutils.format_convert(end_time, '%Y-%m-%d', '%Y%m%d'),
-        adjust="qfq")
+# 同一个代码的并发请求合并为一次，结果在内存中保留一小段时间
+hist_flight = SingleFlight()
+
+
+def get_hist_store() -> HistStore:
+    global _hist_store
+    if _hist_store is None:
+        _hist_store = HistStore(AkshareHistProvider())
+    return _hist_store
+
+
+def set_hist_store(store: HistStore):
+    """
+    替换日线存储，例如换成 FakeHistProvider 的存储，测试时不访问网络
+    """
+    global _hist_store
+    _hist_store = store
+    hist_flight.invalidate()
+
+
+def set_hist_provider(provider, root=None):
+    """
+    替换日线数据源
+    @param provider: 实现 fetch(code, start_date, end_date, adjust) 的数据源
+    @param root: 本地存储目录，默认 cache_dir_path/hist
+    """
+    set_hist_store(HistStore(provider, root))
+
+
+def invalidate_hist(code, adjust='qfq'):
+    """
+    删除某个代码的本地缓存和内存中的结果
+    """
+    get_hist_store().invalidate(code, adjust)
+    for use_cache in (True, False):
+        hist_flight.invalidate((str(code), adjust, use_cache))
+
+
+def data_hist(code, start_time, end_time, adjust='qfq', use_cache=True, compact=False) -> pd.DataFrame:
+    """
+    获取日线数据，已经缓存的区间直接读本地，只请求缺少的部分
+    @param code: 股票代码
+    @param start_time: 开始日期 '%Y-%m-%d'
+    @param end_time: 结束日期 '%Y-%m-%d'
+    @param adjust: 复权方式，'qfq' 前复权，'hfq' 后复权，'' 不复权
+    @param use_cache: False 时直接请求数据源
+    @param compact: True 时压缩列类型以减少内存，'日期' 列变为 datetime64，压缩报告在 df.attrs['compact_report']
+    同一个代码的并发请求、区间重叠的请求合并为一次，见 hist_flight
+    """
+    store = get_hist_store()
+    code = str(code)
+    if not use_cache:
+        def load(start, end):
+            return store.fetch(code, start, end, adjust)
+    else:
+        def load(start, end):
+            return store.get(code, start, end, adjust)
+    df = hist_flight.get((code, adjust, use_cache), start_time, end_time, load)
+    if compact:
+        df = compact_hist(df)
+    return df
+
+
+def compact_hist(df) -> pd.DataFrame:
+    """
+    压缩日线的列类型，压缩报告记录在 df.attrs['compact_report']
+    """
+    df, report = compact_frame(df)
+    df.attrs['compact_report'] = report
     return df
@@ -0,0 +1,233 @@
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from constants.appconstants import cache_dir_path
+from datasource.provider import HIST_COLUMNS, provider_limiter
+from utils import timeutils, tradecalendar
+
+logger = logging.getLogger(__name__)
+
+
+class HistStore:
+    """
+    本地日线存储
+    每个代码一个文件，按复权方式分目录：
+    root/<adjust>/<code>.parquet  日线数据
+    root/<adjust>/<code>.json     已经请求过的日期区间 {"start": "2023-01-01", "end": "2023-06-30"}
+    请求的区间已经缓存时直接读本地，否则只向数据源请求缺少的头部或尾部，
+    缺少的部分没有交易日(周末、节假日)时不请求，直接扩展已覆盖的区间。
+    补数据时会多请求一根已缓存的K线，如果价格对不上，说明前复权数据已经变化(除权除息)，
+    整个区间作废重新请求
+    """
+    date_column = '日期'
+    close_column = '收盘'
+
+    def __init__(self, provider, root=None, fmt=None, tolerance=1e-6, calendar=None):
+        """
+        @param provider: 数据源，实现 fetch(code, start_date, end_date, adjust)
+        @param root: 存储目录，默认 cache_dir_path/hist
+        @param fmt: 'parquet' 或 'pickle'，默认有 parquet 引擎时用 parquet
+        @param tolerance: 判断复权变化时收盘价的相对误差
+        @param calendar: 交易日历，默认为 tradecalendar.get_calendar()
+        """
+        self.provider = provider
+        self._calendar = calendar
+        self.root = root or os.path.join(cache_dir_path, 'hist')
+        if fmt is None:
+            has_engine = importlib.util.find_spec('pyarrow') or importlib.util.find_spec('fastparquet')
+            fmt = 'parquet' if has_engine else 'pickle'
+        self.fmt = fmt
+        self.tolerance = tolerance
+        # 每个代码一把锁，避免同一个代码并发写文件
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def get(self, code, start_time, end_time, adjust='qfq') -> pd.DataFrame:
+        """
+        获取日线，日期格式 '%Y-%m-%d'
+        """
+        code = str(code)
+        with self._code_lock(code, adjust):
+            cached, covered = self._load(code, adjust)
+            if cached is None:
+                sessions = self.calendar.clamp(start_time, end_time)
+                if sessions is None:
+                    # 区间内没有交易日
+                    return pd.DataFrame(columns=HIST_COLUMNS)
+                df = self._fetch(code, sessions[0], sessions[1], adjust)
+                self._save(code, adjust, df, start_time, end_time)
+                return self._slice(df, start_time, end_time)
+
+            cov_start, cov_end = covered
+            parts = [cached]
+            invalid = False
+            # 缺少的头部、尾部中有交易日才需要请求
+            need_head = start_time < cov_start and self._has_sessions(
+                start_time, timeutils.time_str_delta(cov_start, '%Y-%m-%d', days=-1))
+            need_tail = end_time > cov_end and self._has_sessions(
+                timeutils.time_str_delta(cov_end, '%Y-%m-%d', days=1), end_time)
+            if need_head:
+                # 缺少头部，连同第一根已缓存的K线一起请求
+                head_end = cached[self.date_column].iloc[0] if len(cached) > 0 else cov_start
+                head = self._fetch(code, start_time, head_end, adjust)
+                invalid = invalid or self._adjust_changed(cached, head)
+                parts.insert(0, head)
+            if need_tail:
+                # 缺少尾部，从最后一根已缓存的K线开始请求
+                tail_start = cached[self.date_column].iloc[-1] if len(cached) > 0 else cov_end
+                tail = self._fetch(code, tail_start, end_time, adjust)
+                invalid = invalid or self._adjust_changed(cached, tail)
+                parts.append(tail)
+
+            if len(parts) == 1:
+                if start_time < cov_start or end_time > cov_end:
+                    # 缺少的部分都不是交易日，只扩展已覆盖的区间，下次不再检查
+                    self._save_meta(code, adjust, min(start_time, cov_start), max(end_time, cov_end))
+                return self._slice(cached, start_time, end_time)
+
+            new_start, new_end = min(start_time, cov_start), max(end_time, cov_end)
+            if invalid:
+                # 复权数据变化了，缓存的区间作废，整体重新请求
+                logger.info('复权数据变化，重新获取 %s %s %s', code, new_start, new_end)
+                df = self._fetch(code, new_start, new_end, adjust)
+            else:
+                df = pd.concat([part for part in parts if len(part) > 0], ignore_index=True)
+                df = df.drop_duplicates(self.date_column, keep='last')
+                df = df.sort_values(self.date_column).reset_index(drop=True)
+            self._save(code, adjust, df, new_start, new_end)
+            return self._slice(df, start_time, end_time)
+
+    @property
+    def calendar(self):
+        if self._calendar is None:
+            self._calendar = tradecalendar.get_calendar()
+        return self._calendar
+
+    def _has_sessions(self, start_time, end_time):
+        """
+        [start_time, end_time] 之间是否有交易日
+        """
+        return self.calendar.count(start_time, end_time) > 0
+
+    def invalidate(self, code, adjust='qfq'):
+        """
+        删除某个代码的缓存
+        """
+        for path in self._paths(str(code), adjust):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def fetch(self, code, start_time, end_time, adjust='qfq') -> pd.DataFrame:
+        """
+        不读写本地缓存，直接向数据源请求，同样经过数据源的限速，日期格式 '%Y-%m-%d'
+        """
+        return self._fetch(str(code), start_time, end_time, adjust)
+
+    def _fetch(self, code, start_time, end_time, adjust):
+        limiter = provider_limiter(self.provider)
+        if limiter is not None:
+            limiter.acquire()
+        df = self.provider.fetch(
+            code,
+            timeutils.format_convert(start_time, '%Y-%m-%d', '%Y%m%d'),
+            timeutils.format_convert(end_time, '%Y-%m-%d', '%Y%m%d'),
+            adjust)
+        if df is None:
+            return pd.DataFrame(columns=HIST_COLUMNS)
+        df = df.copy()
+        if self.date_column in df.columns:
+            # 日期统一存为 '%Y-%m-%d' 字符串
+            df[self.date_column] = pd.to_datetime(df[self.date_column]).dt.strftime('%Y-%m-%d')
+        return df
+
+    def _adjust_changed(self, cached, fetched):
+        """
+        对比重叠日期的收盘价，判断复权数据是否变化
+        """
+        if len(cached) == 0 or len(fetched) == 0 or self.close_column not in fetched.columns:
+            return False
+        merged = cached[[self.date_column, self.close_column]].merge(
+            fetched[[self.date_column, self.close_column]], on=self.date_column)
+        if len(merged) == 0:
+            return False
+        old = merged[self.close_column + '_x'].to_numpy(dtype=np.float64)
+        new = merged[self.close_column + '_y'].to_numpy(dtype=np.float64)
+        return not np.allclose(old, new, rtol=self.tolerance, atol=0, equal_nan=True)
+
+    def _slice(self, df, start_time, end_time):
+        if len(df) == 0 or self.date_column not in df.columns:
+            return df
+        dates = df[self.date_column]
+        return df[(dates >= start_time) & (dates <= end_time)].reset_index(drop=True)
+
+    def _load(self, code, adjust):
+        """
+        读取缓存，返回 (DataFrame, (start, end))，没有缓存时返回 (None, None)
+        """
+        data_path, meta_path = self._paths(code, adjust)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if self.fmt == 'parquet':
+                df = pd.read_parquet(data_path)
+            else:
+                df = pd.read_pickle(data_path)
+            return df, (meta['start'], meta['end'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('日线缓存读取失败 %s: %s', data_path, e)
+            return None, None
+
+    def _save(self, code, adjust, df, start_time, end_time):
+        """
+        保存数据和已覆盖的区间，今天的数据可能还没收盘，不写入缓存
+        """
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        end_time = min(end_time, yesterday)
+        if end_time < start_time:
+            return
+        if len(df) > 0 and self.date_column in df.columns:
+            df = df[df[self.date_column] <= end_time]
+        data_path, meta_path = self._paths(code, adjust)
+        try:
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            if self.fmt == 'parquet':
+                df.to_parquet(data_path, index=False)
+            else:
+                df.to_pickle(data_path)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'start': start_time, 'end': end_time}, f)
+        except OSError as e:
+            logger.warning('日线缓存写入失败 %s: %s', data_path, e)
+
+    def _save_meta(self, code, adjust, start_time, end_time):
+        """
+        只更新已覆盖的区间，数据不变
+        """
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        end_time = min(end_time, yesterday)
+        if end_time < start_time:
+            return
+        _, meta_path = self._paths(code, adjust)
+        try:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'start': start_time, 'end': end_time}, f)
+        except OSError as e:
+            logger.warning('日线缓存写入失败 %s: %s', meta_path, e)
+
+    def _paths(self, code, adjust):
+        directory = os.path.join(self.root, adjust or 'none')
+        suffix = '.parquet' if self.fmt == 'parquet' else '.pkl'
+        return os.path.join(directory, code + suffix), os.path.join(directory, code + '.json')
+
+    def _code_lock(self, code, adjust):
+        with self._locks_lock:
+            return self._locks.setdefault((code, adjust), threading.Lock())
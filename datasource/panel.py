@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from datasource import batch
+
+"""
+日期 × 代码的二维面板
+把多个代码的日线长表对齐为每个字段一个 (日期数, 代码数) 的 float64 数组，停牌、未上市的位置为 NaN，
+截面选股、排名这类计算可以对整个市场一次向量化完成
+"""
+
+# 面板字段名 -> 日线列名，与 datasource.provider.HIST_COLUMNS 一致
+PANEL_FIELDS = {
+    'open': '开盘',
+    'close': '收盘',
+    'high': '最高',
+    'low': '最低',
+    'volume': '成交量',
+    'amount': '成交额',
+    'pct': '涨跌幅',
+    'turnover': '换手率',
+}
+
+
+class SymbolPanel:
+    """
+    对齐后的面板，dates 升序
+    """
+
+    def __init__(self, dates, codes, fields, names=None):
+        """
+        @param dates: datetime64[D] 数组
+        @param codes: 代码数组
+        @param fields: {字段名: (日期数, 代码数) 的 float64 数组}
+        @param names: 与 codes 对应的名称数组，为空时使用代码
+        """
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.codes = np.asarray(codes, dtype=str)
+        self.fields = fields
+        self.names = np.asarray(names if names is not None else self.codes, dtype=object)
+        # 获取失败的代码 {代码: 异常}
+        self.errors = {}
+        for name, values in fields.items():
+            if values.shape != (len(self.dates), len(self.codes)):
+                raise ValueError(f'字段 {name} 的形状 {values.shape} 与面板不一致')
+
+    @classmethod
+    def from_long(cls, df, codes=None, names=None, date_column='日期', code_column='code', fields=None):
+        """
+        从长表生成，例如 batch.data_hist_batch 的结果
+        @param df: 每行一个代码一天的数据
+        @param codes: 面板的代码顺序，为空时按长表中出现的顺序，不在长表中的代码整列为 NaN
+        @param names: 与 codes 对应的名称
+        @param fields: {字段名: 列名}，默认 PANEL_FIELDS 中长表存在的列
+        """
+        if fields is None:
+            fields = {name: column for name, column in PANEL_FIELDS.items() if column in df.columns}
+        row_codes = df[code_column].astype(str).to_numpy()
+        if codes is None:
+            codes = pd.unique(row_codes)
+        codes = np.asarray(codes, dtype=str)
+        # 每行所在的日期下标和代码下标，直接散列写入二维数组，不按代码循环
+        date_index, dates = pd.factorize(pd.to_datetime(df[date_column]).to_numpy(dtype='datetime64[D]'), sort=True)
+        code_index = pd.Index(codes).get_indexer(row_codes)
+        keep = code_index >= 0
+        date_index, code_index = date_index[keep], code_index[keep]
+        arrays = {}
+        for name, column in fields.items():
+            values = np.full((len(dates), len(codes)), np.nan)
+            values[date_index, code_index] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)[keep]
+            arrays[name] = values
+        return cls(dates, codes, arrays, names)
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def date_position(self, date=None):
+        """
+        date 当天或之前最近的交易日下标，为空时为最后一天
+        """
+        if date is None:
+            return len(self.dates) - 1
+        position = int(np.searchsorted(self.dates, np.datetime64(date, 'D'), side='right')) - 1
+        if position < 0:
+            raise ValueError(f'{date} 早于面板的第一天 {self.dates[0]}')
+        return position
+
+    def nbytes(self):
+        return sum(values.nbytes for values in self.fields.values())
+
+
+def load_panel(table, start_time, end_time, categories=('股票',), adjust='qfq', max_workers=8, on_result=None):
+    """
+    从代码表加载面板
+    @param table: search.SymbolTable，即键盘小精灵的代码表
+    @param start_time: 开始日期 '%Y-%m-%d'
+    @param end_time: 结束日期 '%Y-%m-%d'
+    @param categories: 加载的归类，data_hist 目前只支持个股日线
+    @param on_result: 每个代码完成时的回调，见 batch.data_hist_batch
+    @return: SymbolPanel，获取失败的代码整列为 NaN，异常记录在 panel.errors
+    """
+    mask = np.isin(table.category_names(), list(categories))
+    codes = table.codes()[mask]
+    names = np.asarray(table.names(), dtype=object)[mask]
+    df = batch.data_hist_batch(codes, start_time, end_time, adjust, max_workers=max_workers, on_result=on_result)
+    if len(df) == 0:
+        panel = SymbolPanel(np.array([], dtype='datetime64[D]'), codes,
+                            {name: np.empty((0, len(codes))) for name in PANEL_FIELDS}, names)
+    else:
+        panel = SymbolPanel.from_long(df, codes, names)
+    panel.errors = df.attrs.get('errors', {})
+    return panel
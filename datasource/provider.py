@@ -0,0 +1,147 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+"""
+日线数据源
+数据源需要实现 fetch(code, start_date, end_date, adjust) 方法，
+日期格式为 '%Y%m%d'，返回与 ak.stock_zh_a_hist 相同列名的 DataFrame
+"""
+
+# 日线的列名，与 akshare 保持一致
+HIST_COLUMNS = ['日期', '开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '涨跌额', '换手率']
+
+
+class RateLimiter:
+    """
+    令牌桶限速，多个线程共用
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        @param rate: 每秒允许的次数
+        @param burst: 允许瞬间连续请求的次数
+        """
+        self.rate = float(rate)
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取一个令牌，没有令牌时阻塞等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# 每个数据源一个限速器，以数据源的 name 区分
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def provider_limiter(provider):
+    """
+    数据源的限速器，数据源的 rate_limit 属性为每秒请求次数，没有该属性或为空时不限速
+    """
+    rate = getattr(provider, 'rate_limit', None)
+    if not rate:
+        return None
+    key = getattr(provider, 'name', type(provider).__name__)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None or limiter.rate != rate:
+            limiter = _limiters[key] = RateLimiter(rate)
+        return limiter
+
+
+class AkshareHistProvider:
+    """
+    akshare 日线数据源
+    """
+    name = 'akshare'
+    # 每秒请求次数，请求太快会被服务端限制
+    rate_limit = 5
+
+    def fetch(self, code, start_date, end_date, adjust='qfq'):
+        # akshare 导入很慢，第一次请求时才导入
+        import akshare as ak
+        return ak.stock_zh_a_hist(
+            symbol=str(code),
+            start_date=start_date,
+            end_date=end_date,
+            adjust=adjust)
+
+
+class FakeHistProvider:
+    """
+    本地模拟数据源，不访问网络，用于测试
+    同一个代码同一天的数据总是相同的，工作日才有数据
+    """
+    name = 'fake'
+
+    def __init__(self, latency=0.0, adjust_factor=1.0, rate_limit=None, fail_times=0):
+        """
+        @param latency: 每次请求的模拟耗时，单位秒
+        @param adjust_factor: 复权因子，修改后所有价格随之变化，用于模拟除权导致的前复权数据变化
+        @param rate_limit: 每秒请求次数限制
+        @param fail_times: 每个代码前几次请求抛出 ConnectionError，用于模拟网络抖动
+        """
+        self.latency = latency
+        self.adjust_factor = adjust_factor
+        self.rate_limit = rate_limit
+        self.fail_times = fail_times
+        # 请求记录 [(code, start_date, end_date, adjust)]
+        self.calls = []
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, code, start_date, end_date, adjust='qfq'):
+        with self._lock:
+            self.calls.append((code, start_date, end_date, adjust))
+            failures = self._failures.get(code, 0)
+            self._failures[code] = failures + 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if failures < self.fail_times:
+            raise ConnectionError(f'模拟请求失败 {code}')
+
+        dates = pd.bdate_range(pd.to_datetime(start_date, format='%Y%m%d'), pd.to_datetime(end_date, format='%Y%m%d'))
+        if len(dates) == 0:
+            return pd.DataFrame(columns=HIST_COLUMNS)
+
+        # 以日期为种子生成，保证不同区间请求到的同一天数据一致
+        days = (dates.values.astype('datetime64[D]').astype(np.int64))
+        seed = zlib.crc32(str(code).encode())
+        noise = np.sin(days * 0.7 + seed % 1000) + np.cos(days * 0.13 + seed % 97)
+        close = np.round((10 + seed % 50 + noise * 2 + days % 365 * 0.01) * self.adjust_factor, 2)
+        open_ = np.round(close * (1 + np.sin(days + seed) * 0.01), 2)
+        high = np.maximum(open_, close) + 0.1
+        low = np.minimum(open_, close) - 0.1
+        volume = (100000 + (days * 7919 + seed) % 50000).astype(np.int64)
+        pre_close = np.concatenate([[close[0]], close[:-1]])
+        return pd.DataFrame({
+            '日期': dates.strftime('%Y-%m-%d'),
+            '开盘': open_,
+            '收盘': close,
+            '最高': high,
+            '最低': low,
+            '成交量': volume,
+            '成交额': np.round(volume * close * 100, 2),
+            '振幅': np.round((high - low) / pre_close * 100, 2),
+            '涨跌幅': np.round((close - pre_close) / pre_close * 100, 2),
+            '涨跌额': np.round(close - pre_close, 2),
+            '换手率': np.round(volume / 1e7, 2),
+        })
@@ -0,0 +1,240 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.frameutils import frame_bytes
+
+"""
+日线请求合并
+多个界面同时打开同一个代码时，各自调用 data_hist 会重复请求同一段数据。
+SingleFlight 按 key(代码、复权方式等)登记正在进行的请求：
+    区间被正在进行的请求覆盖时直接等待它的结果；
+    同一个 key 已经有请求在进行中时，新发起的请求先等待 window 秒收集随后到来的请求，区间合并为一次更宽的请求，
+    没有其他请求在进行中时(例如顺序调用)直接发出，不等待；
+    结果按 TTL 在内存中保留一小段时间，总字节数超出上限时淘汰最久没用的；
+    invalidate 之前发出的请求，结果只返回给已经在等待的调用方，不再写入缓存
+每个调用方拿到的都是按自己区间切出来的新 DataFrame
+"""
+
+# 日期列，与 HistStore 一致，值为 '%Y-%m-%d' 字符串或日期类型
+DATE_COLUMN = '日期'
+
+
+class FrameMemo:
+    """
+    DataFrame 的短期缓存，过期时间 + 按字节数的 LRU 淘汰，线程安全
+    每个 key 保存一段区间的数据，请求的区间被覆盖时命中
+    """
+
+    def __init__(self, ttl=30.0, max_bytes=128 * 1024 * 1024):
+        """
+        @param ttl: 保留的秒数，0 表示不缓存
+        @param max_bytes: 所有缓存的总字节数上限
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, start_time, end_time):
+        """
+        区间被缓存覆盖且没有过期时返回缓存的完整 DataFrame，否则返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expire, start, end, df, size = entry
+            if expire < time.monotonic():
+                self._pop(key)
+                return None
+            if start > start_time or end < end_time:
+                return None
+            self._entries.move_to_end(key)
+            return df
+
+    def put(self, key, start_time, end_time, df):
+        if self.ttl <= 0:
+            return
+        size = frame_bytes(df)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None and old[0] >= time.monotonic() and old[1] <= start_time and old[2] >= end_time:
+                # 已有的缓存区间更宽
+                return
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, start_time, end_time, df, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def invalidate(self, key=None):
+        """
+        删除某个 key 的缓存，key 为空时全部删除
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self.bytes = 0
+            else:
+                self._pop(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[4]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Flight:
+    """
+    一次进行中的请求
+    """
+    __slots__ = ('start', 'end', 'started', 'generation', 'done', 'result', 'error')
+
+    def __init__(self, start_time, end_time):
+        self.start = start_time
+        self.end = end_time
+        # 已经向数据源发出请求，区间不能再扩大
+        self.started = False
+        # 发出请求时 key 的版本，写入缓存前版本变了说明期间调用过 invalidate
+        self.generation = None
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def covers(self, start_time, end_time):
+        return self.start <= start_time and end_time <= self.end
+
+
+class SingleFlight:
+    """
+    同一个 key 的并发请求合并为一次，见模块说明
+    """
+
+    def __init__(self, window=0.02, ttl=30.0, max_bytes=128 * 1024 * 1024):
+        """
+        @param window: 同一个 key 已有请求在进行中时，新请求发出前收集其他请求的秒数，0 表示只合并已经在进行中的请求
+        @param ttl: 结果在内存中保留的秒数，0 表示不保留
+        @param max_bytes: 保留结果的总字节数上限
+        """
+        self.window = window
+        self.memo = FrameMemo(ttl, max_bytes)
+        self._flights = {}
+        # 每个 key 的版本，invalidate 时加 1，_all_generation 对应 invalidate 全部
+        self._generations = {}
+        self._all_generation = 0
+        self._lock = threading.Lock()
+        # 统计：实际请求次数、合并到其他请求的次数、缓存命中次数
+        self.stats = {'fetches': 0, 'shared': 0, 'memo_hits': 0}
+
+    def get(self, key, start_time, end_time, loader):
+        """
+        获取 [start_time, end_time] 的数据
+        @param key: 区分数据的 key，例如 (代码, 复权方式)
+        @param start_time: 开始日期 '%Y-%m-%d'
+        @param end_time: 结束日期 '%Y-%m-%d'
+        @param loader: loader(start_time, end_time) 返回 DataFrame，只在发起请求的线程中调用
+        """
+        cached = self.memo.get(key, start_time, end_time)
+        if cached is not None:
+            with self._lock:
+                self.stats['memo_hits'] += 1
+            return slice_dates(cached, start_time, end_time)
+
+        with self._lock:
+            flight, leader, gather = self._join(key, start_time, end_time)
+        if leader:
+            self._run(key, flight, loader, gather)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return slice_dates(flight.result, start_time, end_time)
+
+    def _join(self, key, start_time, end_time):
+        """
+        找到可以加入的请求，找不到时新建，在 _lock 内调用
+        @return: (请求, 是否由当前线程发起, 发起前是否需要等待收集其他请求)
+        """
+        flights = self._flights.setdefault(key, [])
+        for flight in flights:
+            overlapped = start_time <= flight.end and flight.start <= end_time
+            if flight.covers(start_time, end_time) or (overlapped and not flight.started):
+                # 还在收集中且区间重叠的请求直接扩大区间
+                flight.start = min(flight.start, start_time)
+                flight.end = max(flight.end, end_time)
+                self.stats['shared'] += 1
+                return flight, False, False
+        # 已经有请求在进行中，说明同一个 key 的请求正在密集到来，值得等一等
+        gather = len(flights) > 0
+        flight = _Flight(start_time, end_time)
+        flights.append(flight)
+        return flight, True, gather
+
+    def _run(self, key, flight, loader, gather):
+        if gather and self.window > 0:
+            time.sleep(self.window)
+        with self._lock:
+            flight.started = True
+            flight.generation = self._generation(key)
+            start_time, end_time = flight.start, flight.end
+            self.stats['fetches'] += 1
+        try:
+            flight.result = loader(start_time, end_time)
+            with self._lock:
+                # 请求期间调用过 invalidate 时结果可能是旧数据，不写入缓存
+                if flight.generation == self._generation(key):
+                    self.memo.put(key, start_time, end_time, flight.result)
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                flights = self._flights.get(key)
+                if flights is not None and flight in flights:
+                    flights.remove(flight)
+                    if not flights:
+                        del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, key=None):
+        """
+        清除缓存的结果，key 为空时全部清除
+        进行中的请求照常返回给已经在等待的调用方，但结果不写入缓存，之后的调用不再加入这些请求
+        """
+        with self._lock:
+            if key is None:
+                self._all_generation += 1
+                self._flights.clear()
+            else:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._flights.pop(key, None)
+            self.memo.invalidate(key)
+
+    def _generation(self, key):
+        """
+        key 当前的版本，在 _lock 内调用
+        """
+        return self._all_generation, self._generations.get(key, 0)
+
+
+def slice_dates(df, start_time, end_time):
+    """
+    按日期列切出 [start_time, end_time]，返回新的 DataFrame
+    """
+    if df is None or len(df) == 0 or DATE_COLUMN not in df.columns:
+        return df.copy() if df is not None else df
+    dates = df[DATE_COLUMN]
+    if dates.dtype == object and isinstance(dates.iloc[0], str):
+        mask = (dates >= start_time) & (dates <= end_time)
+    else:
+        dates = pd.to_datetime(dates)
+        mask = (dates >= pd.Timestamp(start_time)) & (dates <= pd.Timestamp(end_time))
+    return df[mask.to_numpy()].reset_index(drop=True)
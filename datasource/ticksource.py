@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+"""
+实时行情源
+行情源需要实现 start(on_batch) 和 stop()，在自己的线程中把逐笔行情按批回调给 on_batch，
+每批是一个 TickBatch，字段都是等长的 numpy 数组
+"""
+
+# codes: 代码, price: 最新价, volume: 当日累计成交量, time: 行情时间(epoch 秒)
+TickBatch = namedtuple('TickBatch', ['codes', 'price', 'volume', 'time'])
+
+
+class FakeTickSource:
+    """
+    本地模拟行情源，不访问网络，用于压测
+    每只股票每秒产生 ticks_per_second 笔行情，价格随机游走
+    """
+
+    def __init__(self, codes, ticks_per_second=10, interval=0.02, pre_close=None, seed=0):
+        """
+        @param codes: 代码数组
+        @param ticks_per_second: 每只股票每秒的行情笔数
+        @param interval: 每批行情的间隔，单位秒
+        @param pre_close: 昨收价数组，为空时随机生成
+        @param seed: 随机种子
+        """
+        self.codes = np.asarray(codes)
+        self.ticks_per_second = ticks_per_second
+        self.interval = interval
+        self._rng = np.random.default_rng(seed)
+        if pre_close is None:
+            pre_close = np.round(self._rng.uniform(3, 100, len(self.codes)), 2)
+        self.pre_close = np.asarray(pre_close, dtype=float)
+        self._price = self.pre_close.copy()
+        self._volume = np.zeros(len(self.codes), dtype=np.int64)
+        self._thread = None
+        self._stop = threading.Event()
+        # 已经产生的行情笔数
+        self.generated = 0
+
+    def start(self, on_batch):
+        """
+        启动行情线程
+        @param on_batch: 回调，参数为 TickBatch，在行情线程中调用
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_batch,), name='FakeTickSource', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, on_batch):
+        rate = self.ticks_per_second * len(self.codes)
+        last = time.monotonic()
+        # 不足一笔的部分留到下一批
+        remainder = 0.0
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            remainder += (now - last) * rate
+            last = now
+            count = int(remainder)
+            remainder -= count
+            if count > 0:
+                on_batch(self.next_batch(count))
+
+    def next_batch(self, count):
+        """
+        生成一批行情，同一只股票可能出现多笔
+        """
+        rows = self._rng.integers(0, len(self.codes), count)
+        steps = 1 + self._rng.normal(0, 0.001, count)
+        # 同一批中重复的股票只保留最后一次变动，和真实行情一样价格在涨跌停范围内
+        self._price[rows] = np.clip(np.round(self._price[rows] * steps, 2),
+                                    np.round(self.pre_close[rows] * 0.9, 2),
+                                    np.round(self.pre_close[rows] * 1.1, 2))
+        np.add.at(self._volume, rows, self._rng.integers(1, 1000, count) * 100)
+        self.generated += count
+        return TickBatch(self.codes[rows], self._price[rows], self._volume[rows], np.full(count, time.time()))
+
+
+class AkshareSpotSource:
+    """
+    akshare 全市场快照轮询，每次轮询作为一批行情
+    """
+
+    def __init__(self, interval=3.0):
+        """
+        @param interval: 轮询间隔，单位秒，请求太快会被服务端限制
+        """
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self, on_batch):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(on_batch,), name='AkshareSpotSource', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, on_batch):
+        # akshare 导入很慢，轮询线程中才导入
+        import akshare as ak
+        while not self._stop.is_set():
+            try:
+                df = ak.stock_zh_a_spot_em()
+            except Exception as e:
+                print('行情轮询失败', e)
+            else:
+                df = df.dropna(subset=['最新价'])
+                on_batch(TickBatch(df['代码'].to_numpy(dtype=str), df['最新价'].to_numpy(dtype=float),
+                                   df['成交量'].fillna(0).to_numpy(dtype=np.int64), np.full(len(df), time.time())))
+            self._stop.wait(self.interval)
@@ -1,21 +1,32 @@
+# 启动耗时统计需要最先导入
+from core import startuptrace
+
 import os
 import re
 import threading
 
-import pandas as pd
-import qdarkstyle
-from PyQt5.QtCore import Qt, QEvent, QSortFilterProxyModel, pyqtSignal
+import numpy as np
+from PyQt5.QtCore import Qt, QEvent, QAbstractProxyModel, QModelIndex, QTimer, pyqtSignal
 from PyQt5.QtGui import QCursor
 from PyQt5.QtWidgets import QApplication, QMainWindow, QComboBox, QCompleter, QVBoxLayout, QWidget, QSizePolicy
-from pypinyin import pinyin, Style
 
-from core.AppThreadExecutor import AppThreadExecutor
+from core.AppThreadExecutor import AppThreadExecutor, PRIORITY_INTERACTIVE
+from search import pinyincache
+from search.SearchIndex import SearchIndex, normalize_query
+from search.SymbolTable import SymbolTable, load_symbol_table
+from utils.styleutils import apply_dark_style, dark_stylesheet
+
+# 搜索数据所在目录，以及每个文件对应的归类
+SEARCH_DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCH_DATA_FILES = [('stock.csv', '股票'), ('industry.csv', '板块'), ('market.csv', '指数')]
+# 输入停顿多少毫秒后才开始查询
+FILTER_DELAY_MS = 80
 
 
 class SearchBar(QMainWindow):
     """
     搜索栏，用于搜索股票，板块，指数
-    数据初始化数据类型为tuple数组，分别是[(股票代码,股票名称,代码归类)]
+    数据初始化数据类型为 SymbolTable 或者 tuple数组，分别是[(股票代码,股票名称,代码归类)]
     列如：[('000001', '平安银行', '股票'),('BK1037', '消费电子', '板块'),('sh000852', '中证1000', '指数')]
     搜索完后，按上下键选中，按回车键选择
     """
@@ -27,6 +38,8 @@ class SearchBar(QMainWindow):
         # 回调信号槽
         # 父窗口，用于显示搜索窗口的位置
         self.parent = parent
+        # 数据初始化和输入查询共用的线程池
+        self.executor = AppThreadExecutor()
         self._init_view()
         self._init_listener()
         self._init_data()
@@ -35,7 +48,7 @@ class SearchBar(QMainWindow):
         """
         初始化搜索栏工具条
         """
-        self.setStyleSheet(qdarkstyle.load_stylesheet())
+        apply_dark_style(self)
 
         self.setWindowTitle("键盘小精灵")
         # 隐藏标题栏中的最小化、最大化和帮助按钮
@@ -48,7 +61,7 @@ class SearchBar(QMainWindow):
         # 设置搜索栏的宽高
         self.setGeometry(100, 100, 300, 50)
 
-        self.search_combobox = ExtendedComboBox(self.select_item_signal, self)
+        self.search_combobox = ExtendedComboBox(self.select_item_signal, self, executor=self.executor)
 
         # 创建布局和容器
         layout = QVBoxLayout()
@@ -71,53 +84,36 @@ class SearchBar(QMainWindow):
         self.select_item_signal.connect(self._on_select_item)
 
     def _init_data(self):
-        executor = AppThreadExecutor()
-        executor.submit(self.__get_data_task, self.__get_data_callback)
+        self.executor.submit(self.__get_data_task, self.__get_data_callback)
 
     def __get_data_task(self):
         """
         子线程执行键盘小精灵的数据初始化
-        获取数据任务,耗时操作，获取股票，板块，指数的数据
+        获取数据任务,耗时操作，获取股票，板块，指数的数据，以及名称的拼音首字母
         """
         print('异步任务获取搜索数据', '当前线程: ', threading.currentThread().name)
         # 获取网络股票代码和股票名
         # stock_df = ak.stock_info_a_code_name()
-        # 获取该类所处的目录,
-        stock_df = pd.read_csv(rf'{os.path.dirname(__file__)}\stock.csv', dtype={
-            'code': str, 'name': str}, index_col=0)
-        # 转为list
-        stock_list = stock_df.values.tolist()
-        stock_list = [(stock[0], stock[1], '股票') for stock in stock_list]
-
-        # 板块数据
-        industry_df = pd.read_csv(rf'{os.path.dirname(__file__)}\industry.csv', dtype={
-            'code': str, 'name': str}, index_col=0)
-        # 转为list
-        industry_list = industry_df.values.tolist()
-        industry_list = [(industry[0], industry[1], '板块') for industry in industry_list]
-
-        # 指数数据
-        market_df = pd.read_csv(rf'{os.path.dirname(__file__)}\market.csv', dtype={
-            'code': str, 'name': str}, index_col=0)
-        # 转为list
-        market_list = market_df.values.tolist()
-        market_list = [(market[0], market[1], '指数') for market in market_list]
-
-        # 合并数据
-        data = stock_list + industry_list + market_list
-        return data
+        # csv 只在第一次或者内容变化时解析，之后直接内存映射二进制代码表
+        files = [(os.path.join(SEARCH_DATA_DIR, file_name), category) for file_name, category in SEARCH_DATA_FILES]
+        data = load_symbol_table(files)
+
+        # 拼音首字母，优先读取本地缓存
+        initials = pinyincache.load_initials(data.names(), source_hash=data.source_hash)
+        return data, initials
 
     def __get_data_callback(self, future):
         print('异步任务成功', '当前线程: ', threading.currentThread().name)
-        data = future.result()
-        self.set_data(data)
+        data, initials = future.result()
+        self.set_data(data, initials)
 
-    def set_data(self, data: list):
+    def set_data(self, data, initials=None):
         """
-        数据是tuple类型数组,分别是(股票代码,股票名称,归类)
+        数据是 SymbolTable，或者tuple类型数组,分别是(股票代码,股票名称,归类)
         列如：('000001', '平安银行', '股票')
+        initials 是名称的拼音首字母数组，为空时自动计算
         """
-        self.search_combobox.set_data(data)
+        self.search_combobox.set_data(data, initials)
 
     def _on_select_item(self, item):
         """
@@ -205,9 +201,13 @@ class ExtendedComboBox(QComboBox):
     自定义QComboBox，添加筛选功能
     """
 
-    def __init__(self, select_item_signal, parent=None):
+    def __init__(self, select_item_signal, parent=None, ranked=True, limit=50, filter_delay=FILTER_DELAY_MS,
+                 executor=None):
         """
         select_item_signal 回调信号槽
+        ranked 是否按相关度排序，只显示最相关的 limit 条结果
+        filter_delay 输入停顿多少毫秒后才查询，连续输入时只查询最后一次的文本，0 表示每次输入都查询
+        executor 查询所在的线程池，默认单独创建一个单线程的 AppThreadExecutor
         """
         self.select_item = select_item_signal
         # 外面传进来的数据
@@ -218,8 +218,8 @@ class ExtendedComboBox(QComboBox):
         self.setEditable(True)
 
         # 添加筛选器模型来筛选匹配项
-        self.pFilterModel = StockFilterProxyModel(self)
-        self.pFilterModel.setFilterCaseSensitivity(Qt.CaseInsensitive)  # 大小写不敏感
+        self.pFilterModel = StockFilterProxyModel(self)  # 搜索索引本身大小写不敏感
+        self.pFilterModel.setRanked(ranked, limit)
         self.pFilterModel.setSourceModel(self.model())
 
         # 添加一个使用筛选器模型的QCompleter
@@ -229,47 +229,85 @@ class ExtendedComboBox(QComboBox):
         self.completer.setCaseSensitivity(Qt.CaseInsensitive)  # 不区分大小写
         self.setCompleter(self.completer)
 
+        # 查询在线程池中执行，输入时主线程只重新计时
+        self.pFilterModel.set_executor(executor if executor is not None else AppThreadExecutor(1))
+        self.pFilterModel.filter_ready.connect(self._on_filter_ready)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.timeout.connect(self._start_filter)
+        self.set_filter_delay(filter_delay)
+
         # Qcombobox编辑栏文本变化时对应的槽函数
-        self.lineEdit().textEdited.connect(self.pFilterModel.setFilterFixedString)
+        self.lineEdit().textEdited.connect(self._on_text_edited)
         self.completer.activated.connect(self.on_completer_activated)
         self.lineEdit().setPlaceholderText("输入...")
 
-    def set_data(self, data: list):
+    def set_data(self, data, initials=None):
         """
-        数据是tuple类型数组,分别是(股票代码,股票名称,归类)
+        数据是 SymbolTable，或者tuple类型数组,分别是(股票代码,股票名称,归类)
         列如：('000001', '平安银行', '股票')
+        initials 是名称的拼音首字母数组，为空时通过拼音缓存获取
         """
-
+        if not isinstance(data, SymbolTable):
+            data = SymbolTable.from_rows(data)
         self.data = data
+        codes = data.codes().tolist()
+        names = data.names()
 
         # 转为字符串数组，固定宽度，右对齐最后一个字符串
         width = 30
         items = []
-        for item in data:
-            text = f"{item[1]} ({item[0]})"
-            text = f'{text:<{width}}' + item[2]
+        for code, name, category in zip(codes, names, data.category_names().tolist()):
+            text = f"{name} ({code})"
+            text = f'{text:<{width}}' + category
             items.append(text)
 
+        self.clear()
         self.addItems(items)
 
-        # 获取 filter
-        filter_map = {}
-        # 将中文转换为拼音
-        for item in data:
-            code = item[0]
-            name = item[1]
-            pinyin_list = pinyin(name, style=Style.NORMAL)
+        # 将中文转换为拼音首字母
+        if initials is None:
+            initials = pinyincache.load_initials(names)
 
-            # 获取拼音首字母
-            pinyin_list = [py[0].lower() for py in pinyin_list]
-            pinyin_str = ''.join([py[0] for py in pinyin_list])
+        # 按行建立搜索索引，行号与下拉框的行一致
+        search_index = SearchIndex(codes, names, initials)
+        self.pFilterModel.setSearchIndex(search_index)
 
-            # 自身以及code
-            pinyin_str = pinyin_str + name.lower() + code
-            # 以 code 为key
-            filter_map[code] = pinyin_str
+    def set_filter_delay(self, delay):
+        """
+        设置输入停顿多少毫秒后才查询
+        """
+        self.filter_timer.setInterval(max(0, int(delay)))
+
+    def _on_text_edited(self, text):
+        """
+        输入变化时，正在进行的查询作废，重新计时，停顿 filter_delay 毫秒后才查询
+        """
+        self.filter_timer.stop()
+        self.pFilterModel.cancel_filter()
+        if normalize_query(text) == '' or self.filter_timer.interval() == 0:
+            # 清空输入时直接清空结果，不需要等待
+            self._start_filter()
+        else:
+            self.filter_timer.start()
+
+    def _start_filter(self):
+        text = self.lineEdit().text()
+        if normalize_query(text) == '':
+            self.pFilterModel.setFilterFixedString(text)
+        else:
+            self.pFilterModel.request_filter(text)
 
-        self.pFilterModel.setFilterMap(filter_map)
+    def _on_filter_ready(self, text):
+        """
+        查询结果替换进代理模型后，按新的行数重新弹出补全列表
+        """
+        if not self.lineEdit().hasFocus() or text != self.lineEdit().text():
+            return
+        if self.pFilterModel.rowCount() > 0:
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
 
     def on_completer_activated(self, text):
         """
@@ -285,6 +323,8 @@ class ExtendedComboBox(QComboBox):
             # 获取括号的内容
             code = re.search(r'\((.*?)\)', text).group(1)
             data = self.data[index]
+            # 记录选中，下次搜索时排在前面
+            self.pFilterModel.record_selection(index)
             self.select_item.emit(data)
 
     def setModel(self, model):
@@ -321,51 +361,208 @@ class ExtendedComboBox(QComboBox):
         super(ExtendedComboBox, self).keyPressEvent(e)
 
 
-class StockFilterProxyModel(QSortFilterProxyModel):
+class StockFilterProxyModel(QAbstractProxyModel):
+    """
+    搜索结果代理模型
+    输入变化时通过搜索索引一次算出命中的行集合，代理模型直接按行集合映射到源模型，
+    不再逐行判断是否命中
+    中文拼音的首字母也会被匹配，例如：输入"zg"，"中国"也会被匹配
+    自身中文也会被匹配，例如：输入"中国"，"中国"也会被匹配
+    股票代码也会被匹配，例如：输入"000001"，"平安银行"也会被匹配
+    设置了 executor 时可以通过 request_filter 在线程池中查询，结果回到主线程后只应用最新一次请求的
+    """
+    # request_filter 的结果替换进来后发出，参数为查询的文本
+    filter_ready = pyqtSignal(str)
 
     def __init__(self, parent=None):
         super(StockFilterProxyModel, self).__init__(parent)
-        # code 对应的filter
-        self.filter_map = None
+        # 搜索索引
+        self.search_index = None
+        # 当前输入的文本
+        self.filter_text = ''
+        # 是否按相关度排序，以及排序后保留的行数
+        self.ranked = False
+        self.limit = None
+        self.filter_column = 0
+        # 命中的源模型行号，按显示顺序排列
+        self.rows = np.empty(0, dtype=np.int32)
+        # 源模型行号 -> 代理模型行号，按需构建
+        self._source_to_proxy = None
+        # 查询所在的线程池，见 request_filter
+        self.executor = None
+        # 每次请求查询或者结果被同步替换时加一，用于丢弃过期的查询结果
+        self._generation = 0
+        # 正在线程池中查询的文本，没有时为 None
+        self._pending_text = None
+
+    def setSearchIndex(self, search_index):
+        self.search_index = search_index
+        self.invalidate()
+
+    def setRanked(self, ranked, limit=50):
+        """
+        设置排序模式，ranked 为 True 时按相关度只保留前 limit 行，否则按源模型顺序显示全部命中行
+        """
+        self.ranked = ranked
+        self.limit = limit
+        self.invalidate()
+
+    def record_selection(self, source_row):
+        """
+        记录选中的源模型行，用于排序加权
+        """
+        if self.search_index is not None:
+            self.search_index.record_selection(source_row)
+
+    def setSourceModel(self, model):
+        old_model = self.sourceModel()
+        if old_model is not None:
+            for signal in (old_model.modelReset, old_model.rowsInserted, old_model.rowsRemoved,
+                           old_model.layoutChanged):
+                signal.disconnect(self.invalidate)
+        super(StockFilterProxyModel, self).setSourceModel(model)
+        if model is not None:
+            # 源模型变化后按当前输入重新查询
+            for signal in (model.modelReset, model.rowsInserted, model.rowsRemoved, model.layoutChanged):
+                signal.connect(self.invalidate)
+        self.invalidate()
 
-    def setFilterMap(self, filter_map):
-        self.filter_map = filter_map
+    def setFilterKeyColumn(self, column):
+        self.filter_column = column
 
-    def filterAcceptsRow(self, source_row, source_parent):
+    def filterKeyColumn(self):
+        return self.filter_column
+
+    def set_executor(self, executor):
+        """
+        @param executor: AppThreadExecutor，None 表示 request_filter 也在主线程同步查询
+        """
+        self.executor = executor
+
+    def setFilterFixedString(self, pattern):
+        """
+        输入变化时查询搜索索引，整体替换命中的行，主线程同步执行
+        """
+        self.filter_text = pattern
+        self.set_rows(self.match_rows(pattern))
+
+    def request_filter(self, pattern):
         """
-        重写filterAcceptsRow方法，当某一行包含筛选文本时，返回True，否则返回False
-        中文拼音的首字母也会被匹配，例如：输入"zg"，"中国"也会被匹配
-        自身中文也会被匹配，例如：输入"中国"，"中国"也会被匹配
-        股票代码也会被匹配，例如：输入"000001"，"平安银行"也会被匹配
+        在线程池中查询，查询期间视图保持原来的结果，
+        期间再次请求或者调用 cancel_filter 时，旧的结果直接丢弃
         """
         source_model = self.sourceModel()
-        index = source_model.index(source_row, self.filterKeyColumn(), source_parent)
-        item = source_model.data(index, Qt.DisplayRole)
-
-        # 获取输入框的文本，去掉空格，转为小写
-        text = self.filterRegExp().pattern().lower().replace(" ", "")
-        if text == "":
-            return False
-
-        # 获取code
-        left_index = item.find("(")
-        right_index = item.find(")")
-        if left_index != -1 and right_index != -1:
-            code = item[left_index + 1: right_index]
-        else:
-            code = ""
+        if self.executor is None or self.search_index is None or source_model is None:
+            self.setFilterFixedString(pattern)
+            self.filter_ready.emit(pattern)
+            return
+        self.cancel_filter()
+        generation = self._generation
+        self._pending_text = pattern
 
-        if self.filter_map is not None:
-            pinyin_str = self.filter_map[code]
-        else:
-            pinyin_str = ""
+        def on_ready(future):
+            if generation != self._generation:
+                # 期间又有新的输入，或者数据已经变化
+                return
+            self._pending_text = None
+            self.filter_text = pattern
+            self.set_rows(future.result())
+            self.filter_ready.emit(pattern)
+
+        self.executor.submit(query_rows, on_ready, self.search_index, pattern, self.ranked, self.limit,
+                             source_model.rowCount(), priority=PRIORITY_INTERACTIVE,
+                             key=f'search_filter_{id(self)}', task_name='SearchBar.query_rows')
+
+    def cancel_filter(self):
+        """
+        丢弃正在进行的查询，还没开始的不再执行
+        """
+        self._generation += 1
+        self._pending_text = None
+        if self.executor is not None:
+            self.executor.cancel(f'search_filter_{id(self)}')
 
-        # 判断是否匹配
-        condition = text in pinyin_str
-        # print('item', item, 'pinyin_str', pinyin_str, 'condition', condition)
+    def invalidate(self, *args):
+        """
+        数据或索引变化后，按当前输入重新查询，正在线程池中查询的文本按新数据重新请求
+        """
+        pending_text = self._pending_text
+        self._pending_text = None
+        self.set_rows(self.match_rows(self.filter_text))
+        if pending_text is not None:
+            self.request_filter(pending_text)
 
-        # 判断是否匹配
-        return condition
+    def match_rows(self, text):
+        """
+        查询 text 命中的源模型行
+        @return: 源模型行号数组
+        """
+        source_model = self.sourceModel()
+        if source_model is None:
+            return np.empty(0, dtype=np.int32)
+        return query_rows(self.search_index, text, self.ranked, self.limit, source_model.rowCount())
+
+    def set_rows(self, rows):
+        """
+        替换命中的行，一次性通知视图，正在进行的查询结果作废
+        """
+        self._generation += 1
+        self.beginResetModel()
+        self.rows = rows
+        self._source_to_proxy = None
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        source_model = self.sourceModel()
+        if parent.isValid() or source_model is None:
+            return 0
+        return source_model.columnCount()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        if index is None:
+            return super(StockFilterProxyModel, self).parent()
+        return QModelIndex()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid() or proxy_index.row() >= len(self.rows):
+            return QModelIndex()
+        return self.sourceModel().index(int(self.rows[proxy_index.row()]), proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        if self._source_to_proxy is None:
+            self._source_to_proxy = {int(row): i for i, row in enumerate(self.rows)}
+        row = self._source_to_proxy.get(source_index.row())
+        if row is None:
+            return QModelIndex()
+        return self.index(row, source_index.column())
+
+
+def query_rows(search_index, text, ranked, limit, row_count):
+    """
+    查询 text 命中的源模型行，只读取搜索索引，可以在线程池中执行
+    @param ranked: 是否按相关度排序，只保留前 limit 行
+    @param row_count: 源模型的行数，超出的行丢弃
+    @return: 源模型行号数组
+    """
+    if search_index is None:
+        return np.empty(0, dtype=np.int32)
+    if ranked:
+        rows = search_index.search_ranked(text, limit)
+    else:
+        rows = search_index.search(text)
+    return rows[rows < row_count]
 
 
 class MainWin(QMainWindow):
@@ -383,7 +580,7 @@ class MainWin(QMainWindow):
         """
         初始化搜索栏工具条
         """
-        self.setStyleSheet(qdarkstyle.load_stylesheet())
+        apply_dark_style(self)
         self.setGeometry(100, 100, 1000, 600)
 
         # 在主题窗口初始化搜索栏
@@ -434,9 +631,14 @@ class MainWin(QMainWindow):
 
 
 if __name__ == '__main__':
-    app = QApplication([])
-    # 设置样式表
-    app.setStyleSheet(qdarkstyle.load_stylesheet())
-    mainWin = MainWin()
-    mainWin.show()
+    startuptrace.mark('模块导入完成')
+    with startuptrace.phase('创建 QApplication'):
+        app = QApplication([])
+    with startuptrace.phase('加载样式表'):
+        # 设置样式表
+        app.setStyleSheet(dark_stylesheet())
+    with startuptrace.phase('初始化主窗口'):
+        mainWin = MainWin()
+        mainWin.show()
+    startuptrace.report_when_shown()
     app.exec_()
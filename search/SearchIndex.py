@@ -0,0 +1,120 @@
+import numpy as np
+
+# 空结果
+_EMPTY_ROWS = np.empty(0, dtype=np.int32)
+
+
+class SearchIndex:
+    """
+    键盘小精灵的搜索索引
+    每一行的搜索键由 拼音首字母 + 名称 + 代码 组成(全部小写)，
+    对搜索键的单字符和 n 字符片段建立倒排表，查询时取各片段倒排表的交集，
+    只有查询长度超过 n 时才需要对少量候选行做一次子串校验
+    """
+
+    def __init__(self, codes, names, initials, n=2):
+        """
+        @param codes: 代码数组
+        @param names: 名称数组
+        @param initials: 名称的拼音首字母数组
+        @param n: 片段长度
+        """
+        self.codes = [str(code).lower() for code in codes]
+        self.names = [str(name).lower() for name in names]
+        self.initials = [str(initial).lower() for initial in initials]
+        self.n = n
+        self.keys = [initial + name + code for initial, name, code in zip(self.initials, self.names, self.codes)]
+
+        postings = {}
+        for row, key in enumerate(self.keys):
+            grams = set(key)
+            grams.update(key[i:i + n] for i in range(len(key) - n + 1))
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+        # 倒排表：片段 -> 升序的行号数组
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+        # 排序用的定长字符串数组
+        self._code_array = np.array(self.codes, dtype=str)
+        self._name_array = np.array(self.names, dtype=str)
+        self._initial_array = np.array(self.initials, dtype=str)
+        # 每行被选中的次数，以及最近一次被选中的序号，用于排序加权
+        self.hits = np.zeros(len(self.keys), dtype=np.int32)
+        self.last_used = np.zeros(len(self.keys), dtype=np.int64)
+        self._use_seq = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, text):
+        """
+        查询搜索键包含 text 的所有行
+        @param text: 输入的文本，忽略大小写和空格
+        @return: 升序的行号数组
+        """
+        text = normalize_query(text)
+        if text == '':
+            return _EMPTY_ROWS
+        n = self.n
+        if len(text) <= n:
+            # 单字符和 n 字符片段的倒排表本身就是精确结果
+            return self.postings.get(text, _EMPTY_ROWS)
+
+        grams = {text[i:i + n] for i in range(len(text) - n + 1)}
+        # 从最短的倒排表开始求交集
+        posting_list = sorted((self.postings.get(gram, _EMPTY_ROWS) for gram in grams), key=len)
+        rows = posting_list[0]
+        for other in posting_list[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+
+        # 片段都命中不代表连续出现，校验候选行
+        keys = self.keys
+        return np.array([row for row in rows if text in keys[row]], dtype=np.int32)
+
+    def search_ranked(self, text, limit=50, boost=True):
+        """
+        查询并排序，只返回最相关的 limit 行
+        排序规则：代码完全一致 > 拼音首字母、名称或代码前缀匹配 > 子串匹配，
+        同一档内按选中次数、最近选中的先后排序，最后按原始顺序
+        @param text: 输入的文本
+        @param limit: 返回的最大行数，None 表示不限制
+        @param boost: 是否按选中记录加权
+        @return: 按相关度排列的行号数组
+        """
+        rows = self.search(text)
+        if len(rows) == 0:
+            return rows
+        text = normalize_query(text)
+        codes = self._code_array[rows]
+        prefix = (np.char.startswith(self._initial_array[rows], text)
+                  | np.char.startswith(self._name_array[rows], text)
+                  | np.char.startswith(codes, text))
+        tier = np.where(codes == text, 0, np.where(prefix, 1, 2))
+        if boost:
+            # np.lexsort 以最后一个键为主键
+            order = np.lexsort((rows, -self.last_used[rows], -self.hits[rows], tier))
+        else:
+            order = np.lexsort((rows, tier))
+        if limit is not None:
+            order = order[:limit]
+        return rows[order]
+
+    def record_selection(self, row):
+        """
+        记录一次选中，后续排序时加权
+        """
+        if 0 <= row < len(self.keys):
+            self._use_seq += 1
+            self.hits[row] += 1
+            self.last_used[row] = self._use_seq
+
+
+def normalize_query(text):
+    """
+    输入文本去掉空格，转为小写
+    """
+    if text is None:
+        return ''
+    return text.lower().replace(' ', '')
@@ -0,0 +1,210 @@
+import csv
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from constants.appconstants import cache_dir_path
+from search import pinyincache
+
+# 代码归类，文件中存为 uint8 下标
+CATEGORIES = ['股票', '板块', '指数']
+
+# 文件头：魔数, 版本, 行数, 代码宽度, 名称字节数, csv 内容哈希
+_MAGIC = b'QSYM'
+_VERSION = 1
+_HEADER = struct.Struct('<4sIIII40s')
+_HEADER_SIZE = 64
+
+# 缓存文件名
+CACHE_FILE_NAME = 'symbols.bin'
+
+
+class SymbolTable:
+    """
+    紧凑的代码表，键盘小精灵的搜索数据
+    文件布局(小端)：
+    文件头 | 定长代码 S{code_width} * n | 归类 uint8 * n | 名称偏移 uint32 * (n + 1) | UTF-8 名称，以换行分隔
+    从 csv 生成一次后，启动时直接内存映射，不再为每一行创建 tuple，
+    取单行时返回 (股票代码, 股票名称, 归类) tuple，与原来的 list 数据兼容
+    """
+
+    def __init__(self, codes, categories, offsets, blob, source_hash='', buffer=None):
+        """
+        @param codes: 定长字节串数组 S{n}
+        @param categories: uint8 归类下标数组
+        @param offsets: uint32 名称偏移数组，长度为行数 + 1
+        @param blob: 名称的 UTF-8 字节，uint8 数组
+        @param source_hash: 生成该表的 csv 内容哈希
+        @param buffer: 内存映射对象，表释放前需要保持打开
+        """
+        self._codes = codes
+        self._categories = categories
+        self._offsets = offsets
+        self._blob = blob
+        self.source_hash = source_hash
+        self._buffer = buffer
+        self._names = None
+
+    @classmethod
+    def from_rows(cls, rows, source_hash=''):
+        """
+        从 [(股票代码, 股票名称, 归类)] 数组生成
+        """
+        codes = [str(row[0]) for row in rows]
+        names = [str(row[1]).replace('\n', ' ') for row in rows]
+        categories = [CATEGORIES.index(row[2]) for row in rows]
+        return cls._build(codes, names, categories, source_hash)
+
+    @classmethod
+    def from_csv(cls, files):
+        """
+        从 csv 生成，csv 格式与 search 目录下的一致：,code,name
+        @param files: [(csv 路径, 归类)]
+        """
+        codes = []
+        names = []
+        categories = []
+        for path, category in files:
+            category_index = CATEGORIES.index(category)
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    codes.append(row['code'])
+                    names.append(row['name'].replace('\n', ' '))
+                    categories.append(category_index)
+        source_hash = pinyincache.content_hash([path for path, _ in files])
+        return cls._build(codes, names, categories, source_hash)
+
+    @classmethod
+    def _build(cls, codes, names, categories, source_hash):
+        width = max([len(code.encode('utf-8')) for code in codes] + [1])
+        encoded = [name.encode('utf-8') for name in names]
+        lengths = np.array([len(name) for name in encoded], dtype=np.int64)
+        # 每个名称后面跟一个换行符，names() 可以一次 split 出全部名称
+        offsets = np.zeros(len(names) + 1, dtype=np.uint32)
+        offsets[1:] = np.cumsum(lengths + 1)
+        blob = np.frombuffer(b''.join(name + b'\n' for name in encoded), dtype=np.uint8)
+        return cls(np.array([code.encode('utf-8') for code in codes], dtype=f'S{width}'),
+                   np.array(categories, dtype=np.uint8), offsets, blob, source_hash)
+
+    @classmethod
+    def open(cls, path):
+        """
+        内存映射打开，格式不对时抛出 ValueError
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(buffer) < _HEADER_SIZE:
+                raise ValueError(f'代码表文件不完整 {path}')
+            magic, version, count, width, blob_size, source_hash = _HEADER.unpack_from(buffer, 0)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f'代码表文件格式不对 {path}')
+            codes_offset = _HEADER_SIZE
+            categories_offset = codes_offset + _align(count * width)
+            offsets_offset = categories_offset + _align(count)
+            blob_offset = offsets_offset + (count + 1) * 4
+            if len(buffer) < blob_offset + blob_size:
+                raise ValueError(f'代码表文件不完整 {path}')
+        except ValueError:
+            # 还没有数组引用映射，可以直接关闭
+            buffer.close()
+            raise
+        codes = np.frombuffer(buffer, dtype=f'S{width}', count=count, offset=codes_offset)
+        categories = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=categories_offset)
+        offsets = np.frombuffer(buffer, dtype='<u4', count=count + 1, offset=offsets_offset)
+        blob = np.frombuffer(buffer, dtype=np.uint8, count=blob_size, offset=blob_offset)
+        return cls(codes, categories, offsets, blob, source_hash.rstrip(b'\0').decode('ascii'), buffer)
+
+    def save(self, path):
+        """
+        写入文件，先写临时文件再替换
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        count = len(self)
+        width = self._codes.dtype.itemsize
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            header = _HEADER.pack(_MAGIC, _VERSION, count, width, len(self._blob),
+                                  self.source_hash.encode('ascii').ljust(40, b'\0')[:40])
+            f.write(header.ljust(_HEADER_SIZE, b'\0'))
+            f.write(self._codes.tobytes().ljust(_align(count * width), b'\0'))
+            f.write(self._categories.tobytes().ljust(_align(count), b'\0'))
+            f.write(self._offsets.astype('<u4').tobytes())
+            f.write(self._blob.tobytes())
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, row):
+        """
+        单行数据 (股票代码, 股票名称, 归类)
+        """
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self.code(row), self.name(row), self.category(row)
+
+    def code(self, row):
+        return self._codes[row].decode('utf-8')
+
+    def name(self, row):
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1]) - 1
+        return self._blob[start:end].tobytes().decode('utf-8')
+
+    def category(self, row):
+        return CATEGORIES[self._categories[row]]
+
+    def codes(self):
+        """
+        全部代码，numpy 字符串数组
+        """
+        return np.char.decode(self._codes, 'utf-8')
+
+    def names(self):
+        """
+        全部名称，一次解码后缓存
+        """
+        if self._names is None:
+            self._names = self._blob.tobytes().decode('utf-8').split('\n')[:len(self)]
+        return self._names
+
+    def category_indexes(self):
+        return self._categories
+
+    def category_names(self):
+        """
+        全部归类，numpy 字符串数组
+        """
+        return np.array(CATEGORIES)[self._categories]
+
+
+def load_symbol_table(files, cache_path=None):
+    """
+    加载代码表，缓存文件与 csv 内容一致时直接内存映射，否则从 csv 重新生成
+    @param files: [(csv 路径, 归类)]
+    @param cache_path: 缓存文件路径，默认在 cache_dir_path 下
+    """
+    if cache_path is None:
+        cache_path = os.path.join(cache_dir_path, CACHE_FILE_NAME)
+    source_hash = pinyincache.content_hash([path for path, _ in files])
+    try:
+        table = SymbolTable.open(cache_path)
+        if table.source_hash == source_hash:
+            return table
+    except (OSError, ValueError):
+        pass
+
+    table = SymbolTable.from_csv(files)
+    try:
+        table.save(cache_path)
+    except OSError as e:
+        print('代码表缓存写入失败', cache_path, e)
+    return table
+
+
+def _align(size, alignment=4):
+    return (size + alignment - 1) // alignment * alignment
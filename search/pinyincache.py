@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+from constants.appconstants import cache_dir_path
+
+"""
+搜索键的拼音首字母缓存
+名称转拼音是键盘小精灵冷启动最慢的一步，把 名称 -> 拼音首字母 的结果存到本地，
+缓存以数据源 csv 的内容哈希为版本，csv 变化时只重新计算新增或改名的条目
+"""
+
+# 缓存文件名
+CACHE_FILE_NAME = 'search_pinyin.json'
+
+
+def name_initials(name):
+    """
+    名称的拼音首字母，eg: '平安银行' -> 'payh'
+    pypinyin 导入较慢，缓存命中时不需要导入
+    """
+    from pypinyin import pinyin, Style
+    pinyin_list = pinyin(name, style=Style.NORMAL)
+    return ''.join([py[0][0].lower() for py in pinyin_list])
+
+
+def content_hash(paths):
+    """
+    多个文件内容的哈希
+    :param paths: 文件路径数组，顺序不同哈希也不同
+    :return: 十六进制字符串
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_initials(names, source_paths=None, cache_path=None, source_hash=None):
+    """
+    获取每个名称的拼音首字母，优先读取本地缓存
+    :param names: 名称数组
+    :param source_paths: 名称所在的 csv 文件，用于计算缓存版本，为空时只读缓存不更新版本
+    :param cache_path: 缓存文件路径，默认在 cache_dir_path 下
+    :param source_hash: 已经算好的 csv 内容哈希，传入时不再读取 source_paths
+    :return: 与 names 一一对应的首字母数组
+    """
+    if cache_path is None:
+        cache_path = os.path.join(cache_dir_path, CACHE_FILE_NAME)
+    cache = _read_cache(cache_path)
+    mapping = cache.get('names', {})
+    if source_hash is not None:
+        digest = source_hash
+    else:
+        digest = content_hash(source_paths) if source_paths else cache.get('hash')
+
+    missing = {name for name in names if name not in mapping}
+    if not missing and digest == cache.get('hash'):
+        # 热启动：版本一致，直接查表
+        return [mapping[name] for name in names]
+
+    # 只计算新增或改名的条目，并去掉已经不存在的名称
+    mapping = {name: mapping[name] if name in mapping else name_initials(name) for name in names}
+    _write_cache(cache_path, {'hash': digest, 'names': mapping})
+    return [mapping[name] for name in names]
+
+
+def _read_cache(cache_path):
+    """
+    读取缓存，文件不存在或者损坏时返回空缓存
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if isinstance(cache, dict) and isinstance(cache.get('names'), dict):
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _write_cache(cache_path, cache):
+    """
+    先写临时文件再替换，避免写到一半的缓存被读取
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print('拼音缓存写入失败', cache_path, e)
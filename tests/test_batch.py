@@ -0,0 +1,128 @@
+import time
+
+import pytest
+
+from datasource import batch, datasource
+from datasource.histstore import HistStore
+from datasource.provider import FakeHistProvider
+from utils import tradecalendar
+from utils.tradecalendar import TradeCalendar
+
+"""
+批量获取日线：有限并发、网络异常重试、逐个返回结果
+"""
+
+CODES = ['000001', '000002', '600000', '600519', '000858', '300750', '601318', '002594']
+
+
+@pytest.fixture
+def use_provider(tmp_path):
+    """
+    返回一个函数，把 data_hist 的数据源替换为指定的模拟数据源，测试结束后恢复
+    """
+    old_store = datasource._hist_store
+    old_calendar = tradecalendar._calendar
+    calendar = TradeCalendar.weekdays('2023-01-01')
+    tradecalendar.set_calendar(calendar)
+
+    def use(provider):
+        datasource.set_hist_store(HistStore(provider, root=str(tmp_path), fmt='pickle', calendar=calendar))
+        return provider
+
+    yield use
+    datasource.set_hist_store(old_store)
+    tradecalendar.set_calendar(old_calendar)
+
+
+def test_batch_runs_concurrently(use_provider):
+    provider = use_provider(FakeHistProvider(latency=0.2))
+    started = time.perf_counter()
+    df = batch.data_hist_batch(CODES, '2024-01-01', '2024-01-31', max_workers=8)
+    elapsed = time.perf_counter() - started
+    # 串行需要 8 * 0.2 秒
+    assert elapsed < 0.8
+    assert len(provider.calls) == len(CODES)
+    assert set(df['code']) == set(CODES)
+    assert df.columns[0] == 'code'
+    assert len(df) == len(CODES) * 23
+    assert df.attrs['errors'] == {}
+
+
+def test_max_workers_bounds_concurrency(use_provider):
+    use_provider(FakeHistProvider(latency=0.1))
+    started = time.perf_counter()
+    batch.data_hist_batch(CODES[:4], '2024-01-01', '2024-01-31', max_workers=2)
+    # 两个线程处理 4 个代码至少需要两轮
+    assert time.perf_counter() - started >= 0.2
+
+
+def test_results_streamed_per_code(use_provider):
+    use_provider(FakeHistProvider(latency=0.05))
+    results = list(batch.iter_hist_batch(CODES, '2024-01-01', '2024-01-31'))
+    assert sorted(code for code, _, _ in results) == sorted(CODES)
+    assert all(error is None and len(df) == 23 for _, df, error in results)
+
+
+def test_transient_failures_retried(use_provider, capsys):
+    provider = use_provider(FakeHistProvider(fail_times=2))
+    df = batch.data_hist_batch(CODES[:3], '2024-01-01', '2024-01-31', backoff=0.01)
+    assert df.attrs['errors'] == {}
+    # 重试只计数，不逐次输出
+    assert df.attrs['retries'] == {code: 2 for code in CODES[:3]}
+    assert capsys.readouterr().out == ''
+    assert len(provider.calls) == 3 * 3
+    assert set(df['code']) == set(CODES[:3])
+
+
+def test_failures_after_retries_reported(use_provider):
+    use_provider(FakeHistProvider(fail_times=10))
+    received = []
+    df = batch.data_hist_batch(CODES[:2], '2024-01-01', '2024-01-31', retries=1, backoff=0.01,
+                               on_result=lambda code, frame, error: received.append((code, frame, error)))
+    assert set(df.attrs['errors']) == set(CODES[:2])
+    assert all(isinstance(error, ConnectionError) for error in df.attrs['errors'].values())
+    assert len(df) == 0
+    assert sorted(code for code, _, _ in received) == sorted(CODES[:2])
+    assert all(frame is None for _, frame, _ in received)
+
+
+class _PermissionDeniedProvider(FakeHistProvider):
+    def fetch(self, code, start_date, end_date, adjust='qfq'):
+        super().fetch(code, start_date, end_date, adjust)
+        raise PermissionError(f'没有权限 {code}')
+
+
+def test_non_transient_errors_not_retried(use_provider, capsys):
+    provider = use_provider(_PermissionDeniedProvider())
+    df = batch.data_hist_batch(CODES[:2], '2024-01-01', '2024-01-31', backoff=0.01)
+    assert len(provider.calls) == 2
+    assert df.attrs['retries'] == {}
+    assert all(isinstance(error, PermissionError) for error in df.attrs['errors'].values())
+    # 失败记录在 attrs 中，不逐个输出
+    assert capsys.readouterr().out == ''
+
+
+def test_rate_limit(use_provider):
+    provider = use_provider(FakeHistProvider(rate_limit=20))
+    started = time.perf_counter()
+    batch.data_hist_batch(CODES, '2024-01-01', '2024-01-31', max_workers=8)
+    # 令牌桶只允许瞬间请求一次，之后每秒 20 次
+    assert time.perf_counter() - started >= (len(CODES) - 1) / 20 * 0.9
+    assert len(provider.calls) == len(CODES)
+
+
+def test_weekend_range_not_fetched(use_provider):
+    provider = use_provider(FakeHistProvider())
+    results = list(batch.iter_hist_batch(CODES[:2], '2024-01-06', '2024-01-07'))
+    assert provider.calls == []
+    assert [len(df) for _, df, _ in results] == [0, 0]
+
+
+def test_uncached_fetch_rate_limited(use_provider):
+    provider = use_provider(FakeHistProvider(rate_limit=20))
+    started = time.perf_counter()
+    for code in CODES[:5]:
+        df = datasource.data_hist(code, '2024-01-01', '2024-01-31', use_cache=False)
+        assert len(df) == 23
+    assert time.perf_counter() - started >= 4 / 20 * 0.9
+    assert len(provider.calls) == 5
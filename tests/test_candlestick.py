@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from widget.CandlestickChart import OhlcPyramid
+
+"""
+OhlcPyramid 按任意边界合并的结果与逐根合并一致
+"""
+
+
+def make_pyramid(size, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, size)))
+    open_ = close * (1 + rng.normal(0, 0.005, size))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, size)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, size)))
+    volume = rng.integers(100, 10000, size).astype(np.float64)
+    return OhlcPyramid(open_, high, low, close, volume)
+
+
+def naive_buckets(pyramid, bounds):
+    rows = []
+    for i in range(len(bounds) - 1):
+        start, end = bounds[i], bounds[i + 1]
+        if end > start:
+            rows.append((i, pyramid.open[start], pyramid.high[start:end].max(), pyramid.low[start:end].min(),
+                         pyramid.close[end - 1], pyramid.volume[start:end].sum()))
+    return [np.array(column) for column in zip(*rows)]
+
+
+def assert_buckets_equal(pyramid, bounds):
+    actual = pyramid.buckets(bounds)
+    expected = naive_buckets(pyramid, bounds)
+    np.testing.assert_array_equal(actual[0], expected[0])
+    # 最高、最低价只是取值，必须完全一致
+    for a, e in zip(actual[1:5], expected[1:5]):
+        np.testing.assert_array_equal(a, e)
+    np.testing.assert_allclose(actual[5], expected[5], rtol=1e-9)
+
+
+@pytest.mark.parametrize('size', [1, 100, 257, 5000, 100000])
+def test_random_bounds_match_naive(size):
+    pyramid = make_pyramid(size)
+    rng = np.random.default_rng(size)
+    for buckets in (1, 7, 300):
+        bounds = np.sort(rng.integers(0, size + 1, buckets + 1))
+        assert_buckets_equal(pyramid, bounds)
+
+
+@pytest.mark.parametrize('width', [1, 3, 16, 129, 1000])
+def test_uniform_bounds_match_naive(width):
+    pyramid = make_pyramid(50000, seed=1)
+    # 与绘图一样的等宽像素列，起点不对齐
+    bounds = np.minimum(np.arange(37, 50000 + width, width), 50000)
+    assert_buckets_equal(pyramid, bounds)
+
+
+def test_empty_and_single_bar_buckets():
+    pyramid = make_pyramid(1000, seed=2)
+    bounds = np.array([0, 0, 1, 1, 5, 5, 600, 601, 1000, 1000])
+    assert_buckets_equal(pyramid, bounds)
+    valid, *columns = pyramid.buckets(np.array([10, 10, 10]))
+    assert len(valid) == 0 and all(len(column) == 0 for column in columns)
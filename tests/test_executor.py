@@ -0,0 +1,47 @@
+import threading
+
+from core.AppThreadExecutor import AppThreadExecutor
+
+"""
+AppThreadExecutor 的参数传递与按 key 取消
+"""
+
+
+def test_task_kwargs_not_taken_by_submit(process_events):
+    executor = AppThreadExecutor(1)
+    results = []
+
+    def task(value, priority=None, key=None, task_name=None):
+        return value, priority, key, task_name
+
+    executor.submit(task, lambda future: results.append(future.result()), 1, priority=0, key='k',
+                    kwargs={'priority': 'p', 'key': 'kk', 'task_name': 't'})
+    assert process_events(2, until=lambda: results)
+    assert results == [(1, 'p', 'kk', 't')]
+
+
+def test_plain_kwargs_forwarded(process_events):
+    executor = AppThreadExecutor(1)
+    results = []
+
+    def task(value, scale=1, offset=0):
+        return value * scale + offset
+
+    executor.submit(task, lambda future: results.append(future.result()), 2, key='k', scale=3,
+                    kwargs={'offset': 1})
+    assert process_events(2, until=lambda: results)
+    assert results == [7]
+
+
+def test_same_key_only_latest_callback(process_events):
+    executor = AppThreadExecutor(1)
+    gate = threading.Event()
+    results = []
+    # 占住唯一的线程，后面的任务都在排队
+    executor.submit(gate.wait, None)
+    for i in range(5):
+        executor.submit(lambda value: value, lambda future: results.append(future.result()), i, key='same')
+    gate.set()
+    assert process_events(2, until=lambda: results)
+    process_events(0.1)
+    assert results == [4]
@@ -0,0 +1,144 @@
+import json
+
+import pandas as pd
+import pytest
+
+from datasource.histstore import HistStore
+from datasource.provider import HIST_COLUMNS, FakeHistProvider
+from utils.tradecalendar import TradeCalendar
+
+"""
+HistStore 的增量请求：头部、尾部缺口只请求缺少的部分，缺口没有交易日时不请求，复权变化时整体重新请求
+"""
+
+
+@pytest.fixture
+def provider():
+    return FakeHistProvider()
+
+
+@pytest.fixture
+def store(provider, tmp_path):
+    return HistStore(provider, root=str(tmp_path), fmt='pickle', calendar=TradeCalendar.weekdays('2023-01-01'))
+
+
+# 振幅、涨跌幅等列依赖请求区间内的上一根K线，拼接处会与整段请求不同，只比较原始行情
+PRICE_COLUMNS = ['日期', '开盘', '收盘', '最高', '最低', '成交量']
+
+
+def assert_prices_equal(df, expected):
+    pd.testing.assert_frame_equal(df[PRICE_COLUMNS].reset_index(drop=True),
+                                  expected[PRICE_COLUMNS].reset_index(drop=True))
+
+
+def read_meta(store, code='000001', adjust='qfq'):
+    with open(store._paths(code, adjust)[1], encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_first_fetch_clamped_to_sessions(store, provider):
+    # 2024-01-06 是周六，2024-01-14 是周日
+    df = store.get('000001', '2024-01-06', '2024-01-14')
+    assert provider.calls == [('000001', '20240108', '20240112', 'qfq')]
+    assert df['日期'].tolist() == ['2024-01-08', '2024-01-09', '2024-01-10', '2024-01-11', '2024-01-12']
+    assert read_meta(store) == {'start': '2024-01-06', 'end': '2024-01-14'}
+
+
+def test_cached_range_served_from_disk(store, provider):
+    store.get('000001', '2024-01-01', '2024-01-31')
+    df = store.get('000001', '2024-01-10', '2024-01-20')
+    assert len(provider.calls) == 1
+    assert df['日期'].iloc[0] == '2024-01-10'
+    assert df['日期'].iloc[-1] == '2024-01-19'
+
+
+def test_tail_gap_fetches_only_tail(store, provider):
+    store.get('000001', '2024-01-01', '2024-01-31')
+    df = store.get('000001', '2024-01-01', '2024-02-15')
+    # 从最后一根已缓存的K线开始请求，用于校验复权
+    assert provider.calls[1] == ('000001', '20240131', '20240215', 'qfq')
+    assert len(provider.calls) == 2
+    expected = FakeHistProvider().fetch('000001', '20240101', '20240215')
+    assert_prices_equal(df, expected)
+    assert read_meta(store) == {'start': '2024-01-01', 'end': '2024-02-15'}
+
+
+def test_head_gap_fetches_only_head(store, provider):
+    store.get('000001', '2024-02-01', '2024-02-29')
+    df = store.get('000001', '2024-01-15', '2024-02-29')
+    # 请求到第一根已缓存的K线为止
+    assert provider.calls[1] == ('000001', '20240115', '20240201', 'qfq')
+    assert len(provider.calls) == 2
+    expected = FakeHistProvider().fetch('000001', '20240115', '20240229')
+    assert_prices_equal(df, expected)
+
+
+def test_both_gaps(store, provider):
+    store.get('000001', '2024-02-01', '2024-02-29')
+    store.get('000001', '2024-01-15', '2024-03-15')
+    assert sorted(provider.calls[1:]) == [('000001', '20240115', '20240201', 'qfq'),
+                                          ('000001', '20240229', '20240315', 'qfq')]
+
+
+def test_weekend_gap_not_fetched(store, provider):
+    # 缓存到周五，再请求到周日，缺少的只有周末
+    store.get('000001', '2024-01-08', '2024-01-12')
+    df = store.get('000001', '2024-01-06', '2024-01-14')
+    assert len(provider.calls) == 1
+    assert len(df) == 5
+    # 已覆盖的区间扩展到周末，下次不再检查
+    assert read_meta(store) == {'start': '2024-01-06', 'end': '2024-01-14'}
+
+
+def test_holiday_gap_not_fetched(provider, tmp_path):
+    # 2024-01-15 周一设为休市
+    calendar = TradeCalendar.weekdays('2023-01-01')
+    calendar = TradeCalendar(calendar.sessions[calendar.sessions != pd.Timestamp('2024-01-15').to_datetime64()])
+    store = HistStore(provider, root=str(tmp_path), fmt='pickle', calendar=calendar)
+    store.get('000001', '2024-01-08', '2024-01-12')
+    store.get('000001', '2024-01-08', '2024-01-15')
+    assert len(provider.calls) == 1
+    # 下一个交易日仍然需要请求
+    store.get('000001', '2024-01-08', '2024-01-16')
+    assert provider.calls[1] == ('000001', '20240112', '20240116', 'qfq')
+
+
+def test_range_without_sessions(store, provider):
+    df = store.get('000001', '2024-01-06', '2024-01-07')
+    assert len(df) == 0
+    assert list(df.columns) == HIST_COLUMNS
+    assert provider.calls == []
+
+
+def test_adjust_change_refetches_full_range(store, provider):
+    store.get('000001', '2024-01-01', '2024-01-31')
+    # 除权后前复权价格整体变化
+    provider.adjust_factor = 0.9
+    df = store.get('000001', '2024-01-01', '2024-02-15')
+    assert provider.calls[1] == ('000001', '20240131', '20240215', 'qfq')
+    assert provider.calls[2] == ('000001', '20240101', '20240215', 'qfq')
+    expected = FakeHistProvider(adjust_factor=0.9).fetch('000001', '20240101', '20240215')
+    assert_prices_equal(df, expected)
+    # 缓存的也是新的复权数据
+    cached = store.get('000001', '2024-01-01', '2024-01-31')
+    assert len(provider.calls) == 3
+    assert_prices_equal(cached, expected[expected['日期'] <= '2024-01-31'])
+
+
+def test_adjust_unchanged_keeps_cache(store, provider):
+    store.get('000001', '2024-01-01', '2024-01-31')
+    store.get('000001', '2024-01-01', '2024-02-15')
+    assert len(provider.calls) == 2
+
+
+def test_adjust_types_stored_separately(store, provider):
+    store.get('000001', '2024-01-01', '2024-01-31', adjust='qfq')
+    store.get('000001', '2024-01-01', '2024-01-31', adjust='hfq')
+    assert [call[3] for call in provider.calls] == ['qfq', 'hfq']
+
+
+def test_invalidate(store, provider):
+    store.get('000001', '2024-01-01', '2024-01-31')
+    store.invalidate('000001')
+    store.get('000001', '2024-01-01', '2024-01-31')
+    assert len(provider.calls) == 2
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.indicators import CLOSE_COLUMN, HIGH_COLUMN, LOW_COLUMN, IndicatorEngine, add_indicators, \
+    create_indicator
+
+"""
+技术指标：向量化结果与逐行循环的参考实现一致，增量追加的结果与整段重新计算一致
+"""
+
+SPECS = ['MA5', 'MA20', 'EMA12', 'MACD', 'RSI6', 'KDJ', 'BOLL']
+
+
+def make_bars(bars, seed=0, level=10.0):
+    rng = np.random.default_rng(seed)
+    close = level * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    # 一段价格不变的K线，覆盖分母为 0 的情况
+    close[100:130] = close[99]
+    spread = np.abs(rng.normal(0, 0.01, bars)) * close
+    df = pd.DataFrame({CLOSE_COLUMN: close, HIGH_COLUMN: close + spread, LOW_COLUMN: close - spread})
+    df.loc[100:129, [HIGH_COLUMN, LOW_COLUMN]] = close[99]
+    return df
+
+
+def reference(df):
+    """
+    逐行循环的参考实现，列与 SPECS 对应
+    """
+    close = df[CLOSE_COLUMN].tolist()
+    high = df[HIGH_COLUMN].tolist()
+    low = df[LOW_COLUMN].tolist()
+    rows = len(close)
+    out = {name: [np.nan] * rows for name in ['MA5', 'MA20', 'EMA12', 'DIF', 'DEA', 'MACD', 'RSI6', 'K', 'D', 'J',
+                                                'BOLL', 'UB', 'LB']}
+    ema12 = ema26 = dea = None
+    gain = move = None
+    k = d = 50.0
+    for i in range(rows):
+        if i >= 4:
+            out['MA5'][i] = sum(close[i - 4:i + 1]) / 5
+        if i >= 19:
+            window = close[i - 19:i + 1]
+            mid = sum(window) / 20
+            std = (sum((x - mid) ** 2 for x in window) / 20) ** 0.5
+            out['MA20'][i] = mid
+            out['BOLL'][i], out['UB'][i], out['LB'][i] = mid, mid + 2 * std, mid - 2 * std
+        ema12 = close[i] if ema12 is None else 2 / 13 * close[i] + 11 / 13 * ema12
+        ema26 = close[i] if ema26 is None else 2 / 27 * close[i] + 25 / 27 * ema26
+        dif = ema12 - ema26
+        dea = dif if dea is None else 0.2 * dif + 0.8 * dea
+        out['EMA12'][i], out['DIF'][i], out['DEA'][i], out['MACD'][i] = ema12, dif, dea, 2 * (dif - dea)
+        if i >= 1:
+            diff = close[i] - close[i - 1]
+            gain = max(diff, 0) if gain is None else (max(diff, 0) + 5 * gain) / 6
+            move = abs(diff) if move is None else (abs(diff) + 5 * move) / 6
+            out['RSI6'][i] = 0.0 if move == 0 else gain / move * 100
+        highest, lowest = max(high[max(0, i - 8):i + 1]), min(low[max(0, i - 8):i + 1])
+        rsv = 50.0 if highest == lowest else (close[i] - lowest) / (highest - lowest) * 100
+        k = (rsv + 2 * k) / 3
+        d = (k + 2 * d) / 3
+        out['K'][i], out['D'][i], out['J'][i] = k, d, 3 * k - 2 * d
+    return pd.DataFrame(out)
+
+
+def incremental(df, history, specs=SPECS):
+    """
+    前 history 根向量化计算，之后逐根追加
+    """
+    engine = IndicatorEngine(specs)
+    vectorized = engine.compute(df.iloc[:history])
+    appended = [engine.append(bar) for bar in df.iloc[history:].to_dict('records')]
+    return pd.concat([vectorized, pd.DataFrame(appended, columns=engine.columns)], ignore_index=True)
+
+
+def assert_columns_close(actual, expected, rtol=1e-9, atol=1e-9):
+    for column in expected.columns:
+        np.testing.assert_allclose(actual[column].to_numpy(), expected[column].to_numpy(), rtol=rtol, atol=atol,
+                                   equal_nan=True, err_msg=column)
+
+
+def test_vectorized_matches_reference():
+    df = make_bars(2000)
+    assert_columns_close(IndicatorEngine(SPECS).compute(df), reference(df))
+
+
+@pytest.mark.parametrize('history', [0, 3, 19, 500])
+def test_incremental_matches_reference(history):
+    # history 小于窗口长度时，窗口在追加过程中才填满
+    df = make_bars(1000)
+    assert_columns_close(incremental(df, history), reference(df))
+
+
+def test_incremental_no_drift_after_many_appends():
+    # 价格较高、追加次数多时，累加再减去的窗口和会有误差累积
+    df = make_bars(30000, seed=1, level=3000.0)
+    expected = IndicatorEngine(SPECS).compute(df)
+    actual = incremental(df, 1000)
+    assert_columns_close(actual, expected, rtol=1e-10, atol=1e-8)
+
+
+def test_incremental_boll_flat_window_exact():
+    # 价格较高时窗口变为全部相同，滑动更新的方差残留误差开方后会被放大，标准差应正好为 0
+    df = make_bars(400, seed=3, level=3000.0)
+    actual = incremental(df, 50, ['BOLL'])
+    flat = actual.iloc[119:130]
+    np.testing.assert_array_equal(flat['UB'].to_numpy(), flat['BOLL'].to_numpy())
+    np.testing.assert_array_equal(flat['LB'].to_numpy(), flat['BOLL'].to_numpy())
+
+
+@pytest.mark.parametrize('spec', ['MA60', 'EMA5', 'MACD5,10,4', 'RSI14', 'KDJ14,5,5', 'BOLL10,1.5'])
+def test_parameterized_incremental_matches_vectorized(spec):
+    df = make_bars(3000, seed=2)
+    expected = IndicatorEngine([spec]).compute(df)
+    assert_columns_close(incremental(df, 200, [spec]), expected)
+
+
+def test_missing_high_low_uses_close():
+    df = make_bars(200)[[CLOSE_COLUMN]]
+    result = add_indicators(df, ['KDJ'])
+    assert list(result.columns) == [CLOSE_COLUMN, 'K', 'D', 'J']
+    engine = IndicatorEngine(['KDJ'])
+    engine.compute(df)
+    assert set(engine.append({CLOSE_COLUMN: 10.0})) == {'K', 'D', 'J'}
+
+
+def test_attach_replaces_existing_columns():
+    df = make_bars(100)
+    df['MA5'] = 0.0
+    engine = IndicatorEngine(['MA5', 'MACD'])
+    result = engine.attach(df)
+    assert list(result.columns) == [CLOSE_COLUMN, HIGH_COLUMN, LOW_COLUMN, 'MA5', 'DIF', 'DEA', 'MACD']
+    assert result['MA5'].iloc[-1] == pytest.approx(df[CLOSE_COLUMN].iloc[-5:].mean())
+
+
+@pytest.mark.parametrize('spec', ['XYZ', 'MA-5', ''])
+def test_unknown_spec(spec):
+    with pytest.raises(ValueError):
+        create_indicator(spec)
+
+
+def test_duplicate_columns():
+    with pytest.raises(ValueError):
+        IndicatorEngine(['MACD', 'MACD5,10,4'])
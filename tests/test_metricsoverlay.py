@@ -0,0 +1,30 @@
+from PyQt5 import sip
+from PyQt5.QtWidgets import QWidget
+
+from core.metrics import MetricsRegistry
+from widget.MetricsOverlay import MetricsOverlay
+
+"""
+MetricsOverlay 的 sink 注册：关闭或随父窗口销毁时从指标汇总注销
+"""
+
+
+def test_sink_removed_when_closed(qapp):
+    registry = MetricsRegistry()
+    parent = QWidget()
+    overlay = MetricsOverlay(parent, metrics=registry)
+    assert registry._sinks == [overlay]
+    overlay.close()
+    assert registry._sinks == []
+    sip.delete(parent)
+
+
+def test_sink_removed_when_parent_destroyed(qapp):
+    registry = MetricsRegistry()
+    parent = QWidget()
+    MetricsOverlay(parent, metrics=registry)
+    assert len(registry._sinks) == 1
+    # 父窗口销毁时子控件不会收到 closeEvent
+    sip.delete(parent)
+    assert registry._sinks == []
+    registry.emit({'type': 'loop_lag', 'lag_ms': 1.0, 'callback': None})
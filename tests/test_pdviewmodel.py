@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt
+
+from core.AppThreadExecutor import AppThreadExecutor
+from viewmodel.pdviewmodel import PdTable
+
+"""
+PdTable 在线程池中排序、过滤时，新数据不会被后来的请求丢掉
+"""
+
+ROWS = 20000
+
+
+def make_frame(sign):
+    return pd.DataFrame({'name': np.arange(ROWS).astype(str), 'value': sign * np.arange(ROWS, dtype=float)})
+
+
+def make_model(qapp, data):
+    model = PdTable(data)
+    model.set_executor(AppThreadExecutor(1), min_rows=1000)
+    return model
+
+
+def test_sort_while_new_data_pending(qapp, process_events):
+    model = make_model(qapp, make_frame(1))
+    new = make_frame(-1)
+    model.notify_data(new)
+    # 新数据还在计算中就排序
+    model.sort(1, Qt.AscendingOrder)
+    assert process_events(3, until=lambda: model._data is new and model._pending_data is None)
+    process_events(0.1)
+    assert float(model.index(0, 1).data()) == -(ROWS - 1)
+
+
+def test_filter_while_new_data_pending(qapp, process_events):
+    model = make_model(qapp, make_frame(-1))
+    new = make_frame(1)
+    model.notify_data(new)
+    model.set_row_filter(lambda df: df['value'] >= ROWS - 10)
+    assert process_events(3, until=lambda: model._data is new and model._pending_data is None)
+    process_events(0.1)
+    assert model.rowCount() == 10
+
+
+def test_reset_drops_pending_data(qapp, process_events):
+    model = make_model(qapp, make_frame(1))
+    model.notify_data(make_frame(-1))
+    model.notify_data(None)
+    model.sort(1, Qt.AscendingOrder)
+    process_events(0.3)
+    assert model._data is None
+    assert model.rowCount() == 0
@@ -0,0 +1,44 @@
+import time
+
+from core.QuoteStreamer import QuoteStreamer
+from datasource.ticksource import FakeTickSource
+from viewmodel.pdviewmodel import PdTable
+
+"""
+QuoteStreamer 停止、重新启动后继续刷新
+"""
+
+CODES = [f'{i:06d}' for i in range(500)]
+
+
+def make_streamer():
+    source = FakeTickSource(CODES, ticks_per_second=10)
+    model = PdTable(key='code')
+    return QuoteStreamer(model, source, CODES, pre_close=source.pre_close, fps=20)
+
+
+def test_restart_after_stop_with_snapshot_in_flight(process_events):
+    streamer = make_streamer()
+    snapshot_task = streamer._snapshot_task
+
+    def slow_snapshot():
+        time.sleep(0.1)
+        return snapshot_task()
+
+    # 让快照足够慢，stop 时一定有快照在进行中
+    streamer._snapshot_task = slow_snapshot
+    streamer.start()
+    assert process_events(2, until=lambda: streamer._in_flight)
+    streamer.stop()
+    # 作废的快照结果不会刷新到表格
+    process_events(0.3)
+    frames = streamer.stats()['frames']
+    assert frames == 0
+
+    streamer._snapshot_task = snapshot_task
+    streamer.start()
+    try:
+        assert process_events(3, until=lambda: streamer.stats()['frames'] > frames + 3)
+    finally:
+        streamer.stop()
+    assert streamer.model.rowCount() == len(CODES)
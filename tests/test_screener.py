@@ -0,0 +1,62 @@
+import threading
+
+import numpy as np
+import pytest
+
+from core.Screener import ExpressionCache, ScreenExpression, make_panel, screen
+
+"""
+截面选股：与逐列计算的结果一致，子表达式缓存有上限且可以多线程共用
+"""
+
+
+@pytest.fixture(scope='module')
+def panel():
+    return make_panel(dates=120, symbols=300)
+
+
+def test_matches_pandas_reference(panel):
+    import pandas as pd
+    result = screen(panel, 'close > MA20 and pct > 1')
+    close = pd.DataFrame(panel['close'])
+    ma20 = close.rolling(20).mean().to_numpy()[-1]
+    expected = panel.codes[(panel['close'][-1] > ma20) & (panel['pct'][-1] > 1)]
+    assert sorted(result['code']) == sorted(expected)
+    np.testing.assert_allclose(result['MA20'].to_numpy(), ma20[np.isin(panel.codes, result['code'])])
+
+
+@pytest.mark.parametrize('text', ['__import__("os")', 'close.shape', 'UNKNOWN(close, 5)', 'close >'])
+def test_rejects_unsafe_expressions(text):
+    with pytest.raises(ValueError):
+        ScreenExpression(text)
+
+
+def test_cache_evicts_by_bytes(panel):
+    array_bytes = panel['close'].nbytes
+    cache = ExpressionCache(max_bytes=array_bytes * 3)
+    for n in range(2, 12):
+        screen(panel, f'close > MA{n}', cache=cache)
+    assert cache.bytes <= cache.max_bytes
+
+
+def test_cache_shared_between_threads(panel):
+    cache = ExpressionCache(max_bytes=panel['close'].nbytes * 8)
+    expressions = ['close > MA20 and volume > 2 * MA(volume, 5)', 'CROSS(MA5, MA20)', 'HHV20 > close * 1.1']
+    expected = {text: screen(panel, text)['code'].tolist() for text in expressions}
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(5):
+                for text in expressions:
+                    assert screen(panel, text, cache=cache)['code'].tolist() == expected[text]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.bytes <= cache.max_bytes
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from datasource.singleflight import FrameMemo, SingleFlight
+
+"""
+日线请求合并：并发请求合并为一次，顺序请求不等待，异常传给所有等待方
+"""
+
+
+def make_loader(calls, latency=0.0, error=None):
+    def load(start_time, end_time):
+        calls.append((start_time, end_time))
+        if latency:
+            time.sleep(latency)
+        if error is not None:
+            raise error
+        dates = pd.bdate_range(start_time, end_time).strftime('%Y-%m-%d')
+        return pd.DataFrame({'日期': dates, '收盘': range(len(dates))})
+
+    return load
+
+
+def run_concurrently(func, args_list):
+    results = [None] * len(args_list)
+    errors = [None] * len(args_list)
+
+    def worker(i, args):
+        try:
+            results[i] = func(*args)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i, args)) for i, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_sequential_calls_do_not_wait():
+    flight = SingleFlight(window=0.2, ttl=0)
+    calls = []
+    started = time.perf_counter()
+    for i in range(5):
+        flight.get(('000001', 'qfq'), '2024-01-01', '2024-01-31', make_loader(calls))
+    assert time.perf_counter() - started < 0.2
+    assert len(calls) == 5
+
+
+def test_concurrent_same_range_fetched_once():
+    flight = SingleFlight(ttl=0)
+    calls = []
+    loader = make_loader(calls, latency=0.1)
+    results, errors = run_concurrently(flight.get, [(('000001', 'qfq'), '2024-01-01', '2024-01-31', loader)] * 8)
+    assert errors == [None] * 8
+    assert len(calls) == 1
+    assert all(len(result) == 23 for result in results)
+    # 每个调用方拿到的是各自的 DataFrame
+    assert len({id(result) for result in results}) == 8
+
+
+def test_concurrent_overlapping_ranges_coalesced():
+    flight = SingleFlight(window=0.05, ttl=0)
+    calls = []
+    loader = make_loader(calls, latency=0.1)
+    ranges = [('2024-01-01', '2024-01-31'), ('2024-01-15', '2024-02-29'), ('2024-02-01', '2024-03-15'),
+              ('2024-02-10', '2024-03-31')]
+    results, errors = run_concurrently(flight.get, [(('000001', 'qfq'), start, end, loader) for start, end in ranges])
+    assert errors == [None] * len(ranges)
+    assert len(calls) < len(ranges)
+    for (start, end), result in zip(ranges, results):
+        assert result['日期'].iloc[0] >= start and result['日期'].iloc[-1] <= end
+        assert len(result) == len(pd.bdate_range(start, end))
+
+
+def test_error_propagates_to_waiters():
+    flight = SingleFlight(ttl=0)
+    calls = []
+    loader = make_loader(calls, latency=0.1, error=ConnectionError('down'))
+    _, errors = run_concurrently(flight.get, [(('000001', 'qfq'), '2024-01-01', '2024-01-31', loader)] * 4)
+    assert len(calls) == 1
+    assert all(isinstance(error, ConnectionError) for error in errors)
+
+
+def test_memo_serves_covered_range():
+    flight = SingleFlight(ttl=30)
+    calls = []
+    flight.get(('000001', 'qfq'), '2024-01-01', '2024-03-31', make_loader(calls))
+    result = flight.get(('000001', 'qfq'), '2024-02-01', '2024-02-29', make_loader(calls))
+    assert len(calls) == 1
+    assert flight.stats['memo_hits'] == 1
+    assert result['日期'].iloc[0] == '2024-02-01'
+    flight.invalidate(('000001', 'qfq'))
+    flight.get(('000001', 'qfq'), '2024-02-01', '2024-02-29', make_loader(calls))
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('invalidate_key', [('000001', 'qfq'), None])
+def test_invalidate_during_flight_not_memoized(invalidate_key):
+    flight = SingleFlight(ttl=30)
+    calls = []
+    key = ('000001', 'qfq')
+    loading = threading.Event()
+    release = threading.Event()
+
+    def slow_load(start_time, end_time):
+        loading.set()
+        release.wait(2)
+        return make_loader(calls)(start_time, end_time)
+
+    thread = threading.Thread(target=flight.get, args=(key, '2024-01-01', '2024-01-31', slow_load))
+    thread.start()
+    assert loading.wait(2)
+    # 请求发出之后数据变化了，旧请求的结果不能写入缓存
+    flight.invalidate(invalidate_key)
+    release.set()
+    thread.join()
+    assert len(flight.memo) == 0
+    flight.get(key, '2024-01-01', '2024-01-31', make_loader(calls))
+    assert len(calls) == 2
+    assert flight.stats['memo_hits'] == 0
+
+
+def test_memo_evicts_by_bytes():
+    frame = make_loader([])('2024-01-01', '2024-12-31')
+    memo = FrameMemo(ttl=30, max_bytes=int(frame.memory_usage(deep=True).sum() * 2.5))
+    for code in ['a', 'b', 'c']:
+        memo.put(code, '2024-01-01', '2024-12-31', frame)
+    assert len(memo) == 2
+    assert memo.get('a', '2024-01-01', '2024-12-31') is None
+    assert memo.get('c', '2024-03-01', '2024-03-31') is frame
@@ -0,0 +1,41 @@
+import pytest
+
+from search.SymbolTable import SymbolTable
+
+"""
+SymbolTable 的文件读写：保存后内存映射打开，文件不完整或格式不对时抛出 ValueError
+"""
+
+ROWS = [('000001', '平安银行', '股票'), ('BK0475', '银行', '板块'), ('000300', '沪深300', '指数')]
+
+
+def test_save_and_open(tmp_path):
+    path = str(tmp_path / 'symbols.bin')
+    SymbolTable.from_rows(ROWS, source_hash='abc').save(path)
+    table = SymbolTable.open(path)
+    assert table.source_hash == 'abc'
+    assert [table[row] for row in range(len(table))] == ROWS
+
+
+@pytest.mark.parametrize('size', [0, 10, 80])
+def test_truncated_file_rejected(tmp_path, size):
+    path = str(tmp_path / 'symbols.bin')
+    SymbolTable.from_rows(ROWS).save(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:size])
+    with pytest.raises(ValueError):
+        SymbolTable.open(path)
+    # 打开失败后映射已经关闭，可以直接覆盖重新生成
+    SymbolTable.from_rows(ROWS).save(path)
+    assert len(SymbolTable.open(path)) == len(ROWS)
+
+
+def test_wrong_magic_rejected(tmp_path):
+    path = str(tmp_path / 'symbols.bin')
+    SymbolTable.from_rows(ROWS).save(path)
+    with open(path, 'r+b') as f:
+        f.write(b'XXXX')
+    with pytest.raises(ValueError):
+        SymbolTable.open(path)
@@ -0,0 +1,46 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from utils import timeutils
+
+"""
+日期数组转换与单个值转换的结果一致
+"""
+
+FAST_FORMATS = ['%Y%m%d', '%Y-%m-%d']
+# 各格式下合法的日期
+VALID = {'%Y%m%d': '20220101', '%Y-%m-%d': '2022-01-01'}
+
+
+@pytest.mark.parametrize('format_str', FAST_FORMATS)
+def test_round_trip(format_str):
+    dates = np.arange(np.datetime64('1900-01-01'), np.datetime64('2100-01-01'))
+    strs = [date.strftime(format_str) for date in dates.astype(object)]
+    assert (timeutils.to_datetime64(strs, format_str) == dates).all()
+    assert timeutils.from_datetime64(dates, format_str).tolist() == strs
+
+
+@pytest.mark.parametrize('format_str', FAST_FORMATS)
+@pytest.mark.parametrize('value', ['20221301', '20220230', '', 'abcdefgh', '2022010', '202201011', '00000101',
+                                   '２０２２０１０１', '2022-13-01', '2022-02-29', '2022-01-015', '2022/01/01', 'NaT'])
+def test_invalid_strings_raise(format_str, value):
+    with pytest.raises(ValueError):
+        datetime.datetime.strptime(value, format_str)
+    with pytest.raises(ValueError):
+        timeutils.to_datetime64([VALID[format_str], value], format_str)
+
+
+def test_same_rules_as_strptime():
+    # strptime 接受不补零的月份
+    assert timeutils.to_datetime64(['2022-1-01'], '%Y-%m-%d')[0] == np.datetime64('2022-01-01')
+    assert timeutils.format_convert_array(['20220810', '20240229'], '%Y%m%d', '%Y-%m-%d').tolist() == [
+        timeutils.format_convert('20220810', '%Y%m%d', '%Y-%m-%d'),
+        timeutils.format_convert('20240229', '%Y%m%d', '%Y-%m-%d')]
+
+
+@pytest.mark.parametrize('format_str', FAST_FORMATS + ['%Y/%m/%d'])
+def test_nat_formats_as_empty(format_str):
+    dates = np.array(['2022-01-01', 'NaT'], dtype='datetime64[D]')
+    assert timeutils.from_datetime64(dates, format_str)[1] == ''
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+"""
+DataFrame 内存压缩
+日线、行情这类表默认是 float64 的价格、int64 的成交量、object 的名称和日期，
+打开的页面多了内存占用很大，compact_frame 在不丢精度(允许 rtol 的相对误差)的前提下缩小列类型
+"""
+
+# 按名称识别的日期列，object 类型时转为 datetime64
+DATE_COLUMNS = ('日期', 'date', 'datetime', 'trade_date')
+
+
+def frame_bytes(df):
+    """
+    DataFrame 占用的字节数，包含 object 列中字符串本身
+    """
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def compact_frame(df, rtol=1e-6, category_ratio=0.5, date_columns=DATE_COLUMNS):
+    """
+    压缩 DataFrame 的内存占用，返回新的 DataFrame，原数据不变
+    浮点列：转为 float32 后与原值的相对误差都在 rtol 以内才转换；
+    整数列：按取值范围转为最小的有符号整数类型；
+    字符串列：不同取值的数量不超过行数的 category_ratio 时转为 category；
+    日期列：名称在 date_columns 中的 object/字符串列转为 datetime64，无法解析时保持不变
+    @param df: DataFrame
+    @param rtol: 浮点数允许的相对误差
+    @param category_ratio: 转为 category 的不同取值占比上限
+    @param date_columns: 按名称识别的日期列
+    @return: (压缩后的 DataFrame, 报告)，报告为
+             {'before': 字节数, 'after': 字节数, 'saved': 节省的字节数, 'columns': {列名: (原类型, 新类型, 节省的字节数)}}
+    """
+    before = frame_bytes(df)
+    columns = {}
+    result = {}
+    for name in df.columns:
+        series = df[name]
+        compacted = _compact_series(series, name in date_columns, rtol, category_ratio)
+        if compacted is not series:
+            saved = int(series.memory_usage(deep=True, index=False) - compacted.memory_usage(deep=True, index=False))
+            columns[name] = (str(series.dtype), str(compacted.dtype), saved)
+        result[name] = compacted
+    compact = pd.DataFrame(result, index=df.index, columns=df.columns)
+    compact.attrs = dict(df.attrs)
+    after = frame_bytes(compact)
+    return compact, {'before': before, 'after': after, 'saved': before - after, 'columns': columns}
+
+
+def _compact_series(series, is_date, rtol, category_ratio):
+    """
+    压缩单列，不需要转换时返回原 Series
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series
+    kind = dtype.kind if isinstance(dtype, np.dtype) else None
+
+    if kind == 'f' and dtype.itemsize > 4:
+        values = series.to_numpy()
+        narrowed = values.astype(np.float32)
+        finite = np.isfinite(values)
+        # 超出 float32 范围的值会变为 inf，和 NaN 的位置一起检查
+        if np.array_equal(finite, np.isfinite(narrowed)) and \
+                np.allclose(narrowed[finite], values[finite], rtol=rtol, atol=0):
+            return pd.Series(narrowed, index=series.index, name=series.name)
+        return series
+
+    if kind is not None and kind in 'iu' and dtype.itemsize > 1:
+        values = series.to_numpy()
+        if len(values) == 0:
+            return series
+        low, high = values.min(), values.max()
+        for candidate in (np.int8, np.int16, np.int32):
+            info = np.iinfo(candidate)
+            if np.dtype(candidate).itemsize < dtype.itemsize and info.min <= low and high <= info.max:
+                return pd.Series(values.astype(candidate), index=series.index, name=series.name)
+        return series
+
+    if kind == 'O' or pd.api.types.is_string_dtype(dtype):
+        if is_date:
+            try:
+                return pd.Series(pd.to_datetime(series.to_numpy(dtype=object)), index=series.index, name=series.name)
+            except (ValueError, TypeError):
+                pass
+        if len(series) > 0 and series.nunique(dropna=False) <= len(series) * category_ratio:
+            return series.astype('category')
+    return series
+
+
+if __name__ == '__main__':
+    rows = 100000
+    demo = pd.DataFrame({
+        'code': np.repeat(['000001', '600519', '300750', '000858'], rows // 4),
+        '日期': np.tile(pd.bdate_range('2000-01-01', periods=rows // 4).strftime('%Y-%m-%d'), 4),
+        '收盘': np.round(np.random.uniform(3, 300, rows), 2),
+        '成交量': np.random.randint(0, 10 ** 6, rows),
+    })
+    compacted, report = compact_frame(demo)
+    print(compacted.dtypes)
+    print(f"压缩前 {report['before'] / 1e6:.2f}MB 压缩后 {report['after'] / 1e6:.2f}MB 节省 {report['saved'] / 1e6:.2f}MB")
+    for column, (old, new, saved) in report['columns'].items():
+        print(f'  {column}: {old} -> {new} 节省 {saved / 1e6:.2f}MB')
@@ -0,0 +1,429 @@
+import re
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+"""
+技术指标
+一次向量化计算日线的全部指标，计算完保留每个指标的状态，之后追加新的K线时每个指标按状态 O(1) 更新，不必重算整段历史。
+指标用字符串描述，名称后面的数字为参数，省略时用默认参数：
+    'MA5' 'MA20'        简单移动平均                       列 MA5
+    'EMA12'             指数移动平均，以第一根K线的收盘价为初值   列 EMA12
+    'MACD' 'MACD12,26,9' DIF = EMA(快) - EMA(慢)，DEA = EMA(DIF)，MACD = 2 * (DIF - DEA)
+    'RSI6' 'RSI14'      SMA(上涨, N, 1) / SMA(|涨跌|, N, 1) * 100，与通达信一致
+    'KDJ' 'KDJ9,3,3'    RSV 取最近 N 根(不足 N 根时取已有的)，K、D 以 50 为初值
+    'BOLL' 'BOLL20,2'   中轨 MA(N)，上下轨为中轨 ± K 倍标准差(总体标准差)
+用法：
+    engine = IndicatorEngine(['MA5', 'MACD', 'KDJ'])
+    df = engine.attach(datasource.data_hist(code, start, end))   # 原数据追加指标列，可以直接给 PdTable 显示
+    row = engine.append({'收盘': 10.2, '最高': 10.5, '最低': 10.0})   # 新K线的指标 {列名: 值}
+"""
+
+# 日线的价格列，与 datasource.provider.HIST_COLUMNS 一致
+CLOSE_COLUMN = '收盘'
+HIGH_COLUMN = '最高'
+LOW_COLUMN = '最低'
+
+
+class MA:
+    def __init__(self, n=5):
+        self.n = n
+        self.columns = [f'MA{n}']
+        self._window = _RollingWindow(n)
+
+    def compute(self, close, high, low):
+        result = _rolling_mean(close, self.n)
+        self._window.reset(close[-self.n:])
+        return {self.columns[0]: result}
+
+    def update(self, close, high, low):
+        self._window.push(close)
+        return {self.columns[0]: self._window.mean if self._window.full() else np.nan}
+
+
+class EMA:
+    def __init__(self, n=12):
+        self.n = n
+        self.columns = [f'EMA{n}']
+        self._ema = _EmaState(2 / (n + 1))
+
+    def compute(self, close, high, low):
+        return {self.columns[0]: self._ema.compute(close)}
+
+    def update(self, close, high, low):
+        return {self.columns[0]: self._ema.update(close)}
+
+
+class MACD:
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.columns = ['DIF', 'DEA', 'MACD']
+        self._fast = _EmaState(2 / (fast + 1))
+        self._slow = _EmaState(2 / (slow + 1))
+        self._signal = _EmaState(2 / (signal + 1))
+
+    def compute(self, close, high, low):
+        dif = self._fast.compute(close) - self._slow.compute(close)
+        dea = self._signal.compute(dif)
+        return dict(zip(self.columns, (dif, dea, 2 * (dif - dea))))
+
+    def update(self, close, high, low):
+        dif = self._fast.update(close) - self._slow.update(close)
+        dea = self._signal.update(dif)
+        return dict(zip(self.columns, (dif, dea, 2 * (dif - dea))))
+
+
+class RSI:
+    def __init__(self, n=14):
+        self.n = n
+        self.columns = [f'RSI{n}']
+        self._gain = _EmaState(1 / n)
+        self._move = _EmaState(1 / n)
+        self._last_close = np.nan
+
+    def compute(self, close, high, low):
+        if len(close) == 0:
+            return {self.columns[0]: np.array([], dtype=np.float64)}
+        diff = np.diff(close)
+        # 第一根K线没有昨收，从第二根开始平滑
+        gain = np.concatenate([[np.nan], self._gain.compute(np.maximum(diff, 0))])
+        move = np.concatenate([[np.nan], self._move.compute(np.abs(diff))])
+        self._last_close = close[-1]
+        return {self.columns[0]: _ratio(gain, move)}
+
+    def update(self, close, high, low):
+        last, self._last_close = self._last_close, close
+        if np.isnan(last):
+            return {self.columns[0]: np.nan}
+        diff = close - last
+        gain = self._gain.update(max(diff, 0.0))
+        move = self._move.update(abs(diff))
+        return {self.columns[0]: _ratio(gain, move)}
+
+
+class KDJ:
+    def __init__(self, n=9, m1=3, m2=3):
+        self.n = n
+        self.columns = ['K', 'D', 'J']
+        self._k = _EmaState(1 / m1, initial=50.0)
+        self._d = _EmaState(1 / m2, initial=50.0)
+        self._highs = _WindowExtreme(n, max)
+        self._lows = _WindowExtreme(n, min)
+
+    def compute(self, close, high, low):
+        highest = pd.Series(high).rolling(self.n, min_periods=1).max().to_numpy()
+        lowest = pd.Series(low).rolling(self.n, min_periods=1).min().to_numpy()
+        k = self._k.compute(_rsv(close, highest, lowest))
+        d = self._d.compute(k)
+        self._highs.reset(high[-self.n:])
+        self._lows.reset(low[-self.n:])
+        return dict(zip(self.columns, (k, d, 3 * k - 2 * d)))
+
+    def update(self, close, high, low):
+        rsv = _rsv(close, self._highs.push(high), self._lows.push(low))
+        k = self._k.update(rsv)
+        d = self._d.update(k)
+        return dict(zip(self.columns, (k, d, 3 * k - 2 * d)))
+
+
+class BOLL:
+    def __init__(self, n=20, k=2):
+        self.n = n
+        self.k = k
+        self.columns = ['BOLL', 'UB', 'LB']
+        self._window = _RollingWindow(n)
+
+    def compute(self, close, high, low):
+        mid = _rolling_mean(close, self.n)
+        std = np.full(len(close), np.nan)
+        if len(close) >= self.n:
+            # 窗口内先减去均值再求平方和，避免累加平方和的精度损失
+            windows = np.lib.stride_tricks.sliding_window_view(close, self.n)
+            std[self.n - 1:] = windows.std(axis=1)
+        self._window.reset(close[-self.n:])
+        return dict(zip(self.columns, (mid, mid + self.k * std, mid - self.k * std)))
+
+    def update(self, close, high, low):
+        self._window.push(close)
+        if not self._window.full():
+            return dict.fromkeys(self.columns, np.nan)
+        mid = self._window.mean
+        std = self._window.std()
+        return dict(zip(self.columns, (mid, mid + self.k * std, mid - self.k * std)))
+
+
+# 指标名称 -> 指标类
+INDICATORS = {'MA': MA, 'EMA': EMA, 'MACD': MACD, 'RSI': RSI, 'KDJ': KDJ, 'BOLL': BOLL}
+
+_SPEC_PATTERN = re.compile(r'^([A-Z]+)([\d.,]*)$')
+
+
+def create_indicator(spec):
+    """
+    按描述创建指标，例如 'MA20'、'MACD12,26,9'
+    """
+    match = _SPEC_PATTERN.match(spec.strip().upper())
+    if match is None or match.group(1) not in INDICATORS:
+        raise ValueError(f'不支持的指标: {spec}')
+    args = [float(arg) if '.' in arg else int(arg) for arg in match.group(2).split(',') if arg]
+    return INDICATORS[match.group(1)](*args)
+
+
+class IndicatorEngine:
+    """
+    一组指标的计算，compute 向量化计算整段历史并保留状态，append 按状态增量计算新K线
+    """
+
+    def __init__(self, specs, close=CLOSE_COLUMN, high=HIGH_COLUMN, low=LOW_COLUMN):
+        """
+        @param specs: 指标描述数组，例如 ['MA5', 'MA20', 'MACD', 'RSI6', 'KDJ', 'BOLL']
+        @param close: 收盘价列名
+        @param high: 最高价列名
+        @param low: 最低价列名
+        """
+        self.indicators = [create_indicator(spec) for spec in specs]
+        self.close = close
+        self.high = high
+        self.low = low
+        self.columns = [column for indicator in self.indicators for column in indicator.columns]
+        if len(set(self.columns)) != len(self.columns):
+            raise ValueError(f'指标列名重复: {self.columns}')
+
+    def compute(self, df) -> pd.DataFrame:
+        """
+        计算全部指标，返回与 df 行对应的指标列
+        """
+        close, high, low = self._arrays(df)
+        result = {}
+        for indicator in self.indicators:
+            result.update(indicator.compute(close, high, low))
+        return pd.DataFrame(result, index=df.index, columns=self.columns)
+
+    def attach(self, df) -> pd.DataFrame:
+        """
+        返回追加了指标列的新 DataFrame，同名列会被覆盖
+        """
+        indicators = self.compute(df)
+        base = df.drop(columns=[column for column in self.columns if column in df.columns])
+        return pd.concat([base, indicators], axis=1)
+
+    def append(self, bar) -> dict:
+        """
+        追加一根新K线，返回新K线的指标 {列名: 值}，必须先调用 compute/attach 计算历史
+        @param bar: 包含收盘、最高、最低的 dict 或 Series，没有最高最低时用收盘价
+        """
+        close = float(bar[self.close])
+        high = float(bar[self.high]) if self.high in bar else close
+        low = float(bar[self.low]) if self.low in bar else close
+        result = {}
+        for indicator in self.indicators:
+            result.update(indicator.update(close, high, low))
+        return result
+
+    def formats(self, fmt='%.2f'):
+        """
+        指标列的显示格式，传给 PdTable 的 formats
+        """
+        return dict.fromkeys(self.columns, fmt)
+
+    def _arrays(self, df):
+        close = df[self.close].to_numpy(dtype=np.float64)
+        high = df[self.high].to_numpy(dtype=np.float64) if self.high in df.columns else close
+        low = df[self.low].to_numpy(dtype=np.float64) if self.low in df.columns else close
+        return close, high, low
+
+
+def add_indicators(df, specs, **columns) -> pd.DataFrame:
+    """
+    一次性计算指标并追加为列，不需要增量更新时使用
+    @param specs: 指标描述数组
+    @param columns: 价格列名，见 IndicatorEngine
+    """
+    return IndicatorEngine(specs, **columns).attach(df)
+
+
+class _EmaState:
+    """
+    y = alpha * x + (1 - alpha) * y'，初值为 initial，没有初值时取第一个非空值
+    """
+
+    def __init__(self, alpha, initial=None):
+        self.alpha = alpha
+        self.initial = initial
+        self.last = np.nan
+
+    def compute(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            self.last = np.nan
+            return values.copy()
+        series = pd.Series(values)
+        if self.initial is not None:
+            # 把初值作为第一个元素一起平滑，再去掉
+            series = pd.Series(np.concatenate([[self.initial], values]))
+        result = series.ewm(alpha=self.alpha, adjust=False, ignore_na=True).mean().to_numpy(copy=True)
+        if self.initial is not None:
+            result = result[1:]
+        result[np.isnan(values)] = np.nan
+        valid = result[~np.isnan(result)]
+        self.last = valid[-1] if len(valid) > 0 else np.nan
+        return result
+
+    def update(self, value):
+        if np.isnan(value):
+            return np.nan
+        if np.isnan(self.last):
+            self.last = value if self.initial is None else self.alpha * value + (1 - self.alpha) * self.initial
+        else:
+            self.last = self.alpha * value + (1 - self.alpha) * self.last
+        return self.last
+
+
+class _RollingWindow:
+    """
+    最近 n 个值的均值和离差平方和，每次 push 滑动更新 O(1)；
+    每滑动 n 次按窗口内的值重新计算一次，浮点误差不会随着追加的K线数累积
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self._values = deque(maxlen=n)
+        self.mean = np.nan
+        # 窗口内的离差平方和 sum((x - mean) ** 2)
+        self._m2 = np.nan
+        # 上次重新计算之后滑动的次数
+        self._slides = 0
+        # 末尾连续相同的值的个数，达到 n 时窗口内的值全部相同
+        self._repeats = 0
+
+    def full(self):
+        return len(self._values) == self.n
+
+    def reset(self, values):
+        self._values = deque(maxlen=self.n)
+        self._repeats = 0
+        for value in np.asarray(values, dtype=np.float64).tolist():
+            self._count_repeat(value)
+            self._values.append(value)
+        self._resync()
+
+    def push(self, value):
+        self._count_repeat(value)
+        if not self.full():
+            # 窗口没满时直接重新计算，最多 n 次
+            self._values.append(value)
+            self._resync()
+            return
+        old = self._values[0]
+        self._values.append(value)
+        self._slides += 1
+        if self._slides >= self.n or self._repeats >= self.n:
+            self._resync()
+        else:
+            # 滑动更新均值和离差平方和(Welford)，比累加平方和相减的精度损失小
+            old_mean = self.mean
+            self.mean += (value - old) / self.n
+            self._m2 = max(self._m2 + (value - old) * (value - self.mean + old - old_mean), 0.0)
+
+    def std(self):
+        """
+        窗口的总体标准差
+        """
+        return float(np.sqrt(self._m2 / len(self._values)))
+
+    def _count_repeat(self, value):
+        self._repeats = self._repeats + 1 if self._values and self._values[-1] == value else 1
+
+    def _array(self):
+        return np.fromiter(self._values, dtype=np.float64, count=len(self._values))
+
+    def _resync(self):
+        self._slides = 0
+        if not self._values:
+            self.mean = self._m2 = np.nan
+            return
+        if self._repeats >= len(self._values):
+            # 窗口内的值全部相同，直接取准确值，避免方差接近 0 时开方放大残留的误差
+            self.mean, self._m2 = float(self._values[-1]), 0.0
+            return
+        window = self._array()
+        self.mean = float(window.mean())
+        self._m2 = float(np.square(window - self.mean).sum())
+
+
+class _WindowExtreme:
+    """
+    最近 n 个值的最大或最小值，单调队列，每次 push 均摊 O(1)
+    """
+
+    def __init__(self, n, func):
+        self.n = n
+        self.func = func
+        self._queue = deque()
+        self._count = 0
+
+    def reset(self, values):
+        self._queue.clear()
+        self._count = 0
+        for value in values:
+            self.push(value)
+
+    def push(self, value):
+        """
+        加入一个值，返回窗口内的极值
+        """
+        while self._queue and self.func(self._queue[-1][1], value) == value:
+            self._queue.pop()
+        self._queue.append((self._count, value))
+        if self._queue[0][0] <= self._count - self.n:
+            self._queue.popleft()
+        self._count += 1
+        return self._queue[0][1]
+
+
+def _rolling_mean(values, n):
+    result = np.full(len(values), np.nan)
+    if len(values) >= n:
+        result[n - 1:] = np.lib.stride_tricks.sliding_window_view(values, n).mean(axis=1)
+    return result
+
+
+def _ratio(numerator, denominator):
+    """
+    numerator / denominator * 100，分母为 0 时(价格一直不变)为 0
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(denominator == 0, 0.0, np.divide(numerator, denominator) * 100)
+    return ratio if np.ndim(ratio) else float(ratio)
+
+
+def _rsv(close, highest, lowest):
+    """
+    (收盘 - 最低) / (最高 - 最低) * 100，最高等于最低时为 50
+    """
+    spread = np.subtract(highest, lowest)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = np.where(spread == 0, 50.0, np.subtract(close, lowest) / spread * 100)
+    return rsv if np.ndim(rsv) else float(rsv)
+
+
+if __name__ == '__main__':
+    import time
+
+    # 性能演示，正确性见 tests/test_indicators.py
+    specs = ['MA5', 'EMA12', 'MACD', 'RSI6', 'KDJ', 'BOLL']
+    rng = np.random.default_rng(0)
+    bars = 1000000
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, bars)))
+    spread = np.abs(rng.normal(0, 0.01, bars)) * close
+    hist = pd.DataFrame({CLOSE_COLUMN: close, HIGH_COLUMN: close + spread, LOW_COLUMN: close - spread})
+
+    engine = IndicatorEngine(specs)
+    start = time.perf_counter()
+    engine.compute(hist)
+    print(f'{bars} 根K线向量化计算 {(time.perf_counter() - start) * 1000:.1f}ms')
+    bar = {CLOSE_COLUMN: 10.0, HIGH_COLUMN: 10.1, LOW_COLUMN: 9.9}
+    start = time.perf_counter()
+    for i in range(10000):
+        engine.append(bar)
+    print(f'增量计算每根K线 {(time.perf_counter() - start) / 10000 * 1e6:.1f}us')
@@ -0,0 +1,28 @@
+import functools
+
+from PyQt5.QtWidgets import QApplication
+
+"""
+样式表工具
+qdarkstyle 的样式表只加载一次，各个窗口共用
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def dark_stylesheet():
+    """
+    qdarkstyle 暗色样式表，第一次使用时才导入 qdarkstyle
+    """
+    import qdarkstyle
+    return qdarkstyle.load_stylesheet()
+
+
+def apply_dark_style(widget):
+    """
+    给窗口设置暗色样式表，app 已经设置了同一份样式表时不再重复设置
+    """
+    stylesheet = dark_stylesheet()
+    app = QApplication.instance()
+    if app is not None and app.styleSheet() == stylesheet:
+        return
+    widget.setStyleSheet(stylesheet)
@@ -1,14 +1,32 @@
 import datetime
+import functools
 import time
 
+import numpy as np
 import pandas as pd
 
+from utils import tradecalendar
+
 """
 时间操作工具
 参考链接： https://www.jianshu.com/p/cdd6c5874892
+单个字符串的转换结果会缓存，整列转换使用 *_array 系列函数
 """
 
+# 单个值转换的缓存数量
+MEMO_SIZE = 4096
+
+# numpy 时间偏移单位
+_DELTA_UNITS = {'days': 'D', 'weeks': 'W', 'hours': 'h', 'minutes': 'm', 'milliseconds': 'ms'}
+
+# 走 numpy 快速路径的日期格式：(长度, 年月日各位数字的下标, 分隔符的下标)
+_FAST_FORMATS = {
+    '%Y%m%d': (8, [0, 1, 2, 3, 4, 5, 6, 7], []),
+    '%Y-%m-%d': (10, [0, 1, 2, 3, 5, 6, 8, 9], [4, 7]),
+}
+
 
+@functools.lru_cache(maxsize=MEMO_SIZE)
 def str_to_stamp(time_str, format_str):
     """
     字符串转时间戳
@@ -21,6 +39,7 @@ def str_to_stamp(time_str, format_str):
     return time_stamp
 
 
+@functools.lru_cache(maxsize=MEMO_SIZE)
 def stamp_to_str(timestamp, format_str):
     """
     时间戳转格式化时间字符串
@@ -32,6 +51,7 @@ def stamp_to_str(timestamp, format_str):
     return time.strftime(format_str, time_array)
 
 
+@functools.lru_cache(maxsize=MEMO_SIZE)
 def time_str_delta(time_str, format_str, **offset):
     """
     格式化时间偏移
@@ -123,6 +143,7 @@ def is_today_timestamp(timestamp):
     return tmp_time_str == today_str
 
 
+@functools.lru_cache(maxsize=MEMO_SIZE)
 def format_convert(time_str, src_format_str, dst_format_str):
     """
     时间字符串格式转换
@@ -135,6 +156,7 @@ def format_convert(time_str, src_format_str, dst_format_str):
     return datetime.datetime.strftime(time_instance, dst_format_str)
 
 
+@functools.lru_cache(maxsize=MEMO_SIZE)
 def timestamp_to_str(time_stamp: pd.Timestamp, format_str='%Y-%m-%d') -> str:
     """
     Timestamp 数据类型格式化为字符串，
@@ -143,6 +165,184 @@ def timestamp_to_str(time_stamp: pd.Timestamp, format_str='%Y-%m-%d') -> str:
     return str(pd.to_datetime(time_stamp, format=format_str).date())
 
 
+def to_datetime64(values, format_str):
+    """
+    时间字符串数组转为 datetime64 数组
+    :param values: list、numpy 数组或 Series eg: ['20220810', '20220811']
+    :param format_str: 格式化字符串，'%Y%m%d' 和 '%Y-%m-%d' 走纯 numpy 的快速路径
+    :return: datetime64 数组，日期格式精度为天，其他格式精度为纳秒
+    :raise ValueError: 与 format_convert 一致，有字符串不符合格式或者日期不存在时抛出
+    """
+    if format_str in _FAST_FORMATS:
+        return _parse_fast(values, format_str)
+    return pd.to_datetime(pd.Series(values), format=format_str).to_numpy()
+
+
+def _parse_fast(values, format_str):
+    """
+    '%Y%m%d'、'%Y-%m-%d' 的快速路径，直接按字符取出年月日的数字，并校验长度、分隔符和日期范围，
+    没通过校验的逐个用 strptime 解析
+    """
+    width, digit_positions, separator_positions = _FAST_FORMATS[format_str]
+    # 多留一个字符，超长的字符串在该位置不为 0，不会被静默截断
+    values = np.atleast_1d(np.asarray(values))
+    strs = values.astype(f'U{width + 1}')
+    chars = strs.view(np.uint32).reshape(-1, width + 1).astype(np.int64)
+    valid = (chars[:, width] == 0) & np.all(chars[:, :width] != 0, axis=1)
+    digits = chars[:, digit_positions] - ord('0')
+    valid &= np.all((digits >= 0) & (digits <= 9), axis=1)
+    if separator_positions:
+        valid &= np.all(chars[:, separator_positions] == ord('-'), axis=1)
+    years = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    months = digits[:, 4] * 10 + digits[:, 5]
+    days = digits[:, 6] * 10 + digits[:, 7]
+    # 与 strptime 一致，年份从 1 开始
+    valid &= (years >= 1) & (months >= 1) & (months <= 12) & (days >= 1)
+    months = np.where(valid, months, 1)
+    month_starts = (years - 1970).astype('datetime64[Y]') + (months - 1).astype('timedelta64[M]')
+    month_days = ((month_starts + 1).astype('datetime64[D]') - month_starts.astype('datetime64[D]')).astype(np.int64)
+    valid &= days <= month_days
+    dates = month_starts.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
+    if not valid.all():
+        # 不符合定长格式的(例如 '2022-1-01')交给 strptime，规则与 format_convert 完全一致，不合法时抛出 ValueError
+        for i in np.flatnonzero(~valid):
+            dates[i] = np.datetime64(datetime.datetime.strptime(str(values[i]), format_str).date(), 'D')
+    return dates
+
+
+def from_datetime64(dates, format_str):
+    """
+    datetime64 数组格式化为字符串数组
+    :param dates: datetime64 数组
+    :param format_str: 格式化字符串，'%Y%m%d' 和 '%Y-%m-%d' 走纯 numpy 的快速路径
+    :return: 字符串数组，NaT 对应空字符串
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]') if np.asarray(dates).dtype.kind != 'M' else np.asarray(dates)
+    nat = np.isnat(dates)
+    if format_str == '%Y-%m-%d':
+        result = np.datetime_as_string(dates, unit='D')
+    elif format_str == '%Y%m%d':
+        # 'YYYY-MM-DD' 去掉中间的 '-'
+        chars = np.datetime_as_string(dates, unit='D').astype('U10').view('U1').reshape(-1, 10)
+        result = np.ascontiguousarray(chars[:, [0, 1, 2, 3, 5, 6, 8, 9]]).view('U8').ravel()
+    else:
+        result = pd.DatetimeIndex(dates).strftime(format_str).to_numpy()
+    if nat.any():
+        result = np.where(nat, '', result)
+    return result
+
+
+def format_convert_array(values, src_format_str, dst_format_str):
+    """
+    format_convert 的数组版本
+    :param values: 时间字符串数组 eg: ['2022-10-25', '2022-10-26']
+    :param src_format_str: 格式化字符串 eg: '%Y-%m-%d'
+    :param dst_format_str: 格式化字符串 eg: '%Y%m%d'
+    :return: 字符串数组
+    """
+    return from_datetime64(to_datetime64(values, src_format_str), dst_format_str)
+
+
+def str_to_stamp_array(values, format_str):
+    """
+    str_to_stamp 的数组版本，按本地时区转换
+    :param values: 时间字符串数组
+    :param format_str: 格式化字符串
+    :return: int64 时间戳数组
+    """
+    seconds = to_datetime64(values, format_str).astype('datetime64[s]').astype(np.int64)
+    return seconds - _local_offsets(seconds, naive=True)
+
+
+def stamp_to_str_array(timestamps, format_str):
+    """
+    stamp_to_str 的数组版本，按本地时区转换
+    :param timestamps: 时间戳数组
+    :param format_str: 格式化字符串
+    :return: 字符串数组
+    """
+    seconds = np.asarray(timestamps).astype(np.int64)
+    local = (seconds + _local_offsets(seconds, naive=False)).astype('datetime64[s]')
+    return from_datetime64(local, format_str)
+
+
+def time_str_delta_array(values, format_str, **offset):
+    """
+    time_str_delta 的数组版本
+    :param values: 时间字符串数组
+    :param format_str: 格式化字符串
+    :param offset: 偏移单位 eg: days=3 或 weeks=3
+    :return: 偏移后的时间字符串数组
+    """
+    if len(offset) != 1:
+        raise Exception('字典size必须为1，参考eg')
+    key, value = next(iter(offset.items()))
+    if key not in _DELTA_UNITS:
+        raise Exception(f'不支持的偏移单位 {key}')
+    dates = to_datetime64(values, format_str)
+    return from_datetime64(dates + np.timedelta64(int(value), _DELTA_UNITS[key]), format_str)
+
+
+def trade_day_delta(time_str, format_str, days):
+    """
+    按交易日偏移，time_str_delta 按自然日偏移，会把周末和节假日算进去
+    :param time_str: 日期字符串 eg: '2024-02-08'
+    :param format_str: 格式化字符串 eg: '%Y-%m-%d'，只保留日期部分
+    :param days: 交易日数，非交易日先对齐到最近的交易日，见 TradeCalendar.shift
+    :return: 偏移后的日期字符串
+    """
+    return trade_day_delta_array([time_str], format_str, days)[0]
+
+
+def trade_day_delta_array(values, format_str, days):
+    """
+    trade_day_delta 的数组版本
+    :param days: 交易日数，整数或与 values 等长的数组
+    """
+    dates = to_datetime64(values, format_str).astype('datetime64[D]')
+    return from_datetime64(tradecalendar.get_calendar().shift(dates, days), format_str)
+
+
+def trade_days_between(start_str, end_str, format_str):
+    """
+    [start, end] 之间(包含两端)的交易日数量
+    """
+    dates = to_datetime64([start_str, end_str], format_str).astype('datetime64[D]')
+    return int(tradecalendar.get_calendar().count(dates[0], dates[1]))
+
+
+def timestamp_to_str_array(time_stamps, format_str='%Y-%m-%d'):
+    """
+    timestamp_to_str 的数组版本
+    :param time_stamps: Timestamp 或 datetime64 数组
+    :return: '%Y-%m-%d' 字符串数组
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(time_stamps, format=format_str))
+    if dates.tz is not None:
+        dates = dates.tz_localize(None)
+    return np.datetime_as_string(dates.to_numpy(), unit='D')
+
+
+def _local_offsets(seconds, naive):
+    """
+    每个时间点的本地时区偏移(秒)
+    当前时区没有夏令时(例如 Asia/Shanghai)时直接使用固定偏移，不再考虑历史上的夏令时；
+    否则按小时去重后逐个计算
+    :param seconds: 秒数组，naive 为 True 时是本地时间，否则是 UTC 时间戳
+    """
+    if not time.daylight:
+        return np.full(len(seconds), -time.timezone, dtype=np.int64)
+    hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+    offsets = np.empty(len(hours), dtype=np.int64)
+    for i, hour in enumerate(hours.tolist()):
+        if naive:
+            local = datetime.datetime(1970, 1, 1) + datetime.timedelta(hours=hour)
+            offsets[i] = hour * 3600 - int(time.mktime(local.timetuple()))
+        else:
+            offsets[i] = time.localtime(hour * 3600).tm_gmtoff
+    return offsets[inverse.ravel()]
+
+
 def cur_millis():
     """
     当前的毫秒数
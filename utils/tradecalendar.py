@@ -0,0 +1,222 @@
+import datetime
+import os
+import threading
+
+import numpy as np
+
+from constants.appconstants import cache_dir_path
+
+"""
+A 股交易日历
+交易日存为升序的 datetime64[D] 数组，查询都是二分查找，偏移、计数、缺失区间都可以整列向量化计算。
+日历来自 akshare 的 tool_trade_date_hist_sina，缓存在本地，获取失败时退化为只去掉周末的工作日历；
+日历覆盖范围之外的日期同样按工作日处理
+"""
+
+# 本地缓存文件
+CACHE_FILE_NAME = 'trade_calendar.npy'
+# 工作日历的起止日期
+WEEKDAY_START = '1990-12-19'
+
+
+class TradeCalendar:
+    """
+    交易日历，日期参数都可以是 '%Y-%m-%d' 字符串、datetime64 或它们的数组
+    """
+
+    def __init__(self, sessions):
+        """
+        @param sessions: 交易日数组，会去重排序
+        """
+        self.sessions = np.unique(np.asarray(sessions, dtype='datetime64[D]'))
+        if len(self.sessions) == 0:
+            raise ValueError('交易日历为空')
+        self.first = self.sessions[0]
+        self.last = self.sessions[-1]
+
+    @classmethod
+    def weekdays(cls, start=WEEKDAY_START, end=None):
+        """
+        只去掉周末的日历，end 默认为明年年底
+        """
+        if end is None:
+            end = f'{datetime.date.today().year + 1}-12-31'
+        days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+        return cls(days[np.is_busday(days)])
+
+    def _extended(self, dates):
+        """
+        日历范围之外的日期按工作日补齐，返回覆盖 dates 的交易日数组
+        """
+        low, high = dates.min(), dates.max()
+        if low >= self.first and high <= self.last:
+            return self.sessions
+        parts = [self.sessions]
+        if low < self.first:
+            days = np.arange(low - 7, self.first)
+            parts.insert(0, days[np.is_busday(days)])
+        if high > self.last:
+            days = np.arange(self.last + 1, high + 8)
+            parts.append(days[np.is_busday(days)])
+        return np.concatenate(parts)
+
+    def _prepare(self, dates):
+        dates = np.atleast_1d(np.asarray(dates, dtype='datetime64[D]'))
+        return dates, self._extended(dates) if len(dates) > 0 else self.sessions
+
+    def is_session(self, dates):
+        """
+        是否交易日，bool 数组
+        """
+        dates, sessions = self._prepare(dates)
+        position = np.searchsorted(sessions, dates)
+        return sessions[np.minimum(position, len(sessions) - 1)] == dates
+
+    def shift(self, dates, n):
+        """
+        偏移 n 个交易日，非交易日先按偏移方向对齐到最近的交易日(n > 0 时向前对齐到上一个交易日，n < 0 时向后)，
+        n 为 0 时非交易日对齐到下一个交易日
+        @param n: 整数或与 dates 等长的整数数组
+        """
+        dates, sessions = self._prepare(dates)
+        n = np.asarray(n, dtype=np.int64)
+        if np.any(n > 0) or np.any(n < 0):
+            # 需要的交易日可能超出日历范围，按最大偏移补齐
+            span = int(np.abs(n).max()) * 7 // 5 + 14
+            sessions = self._extended(np.concatenate([dates - span, dates + span]))
+        right = np.searchsorted(sessions, dates, side='right') - 1
+        left = np.searchsorted(sessions, dates, side='left')
+        position = np.where(n > 0, right, left) + n
+        return sessions[np.clip(position, 0, len(sessions) - 1)]
+
+    def count(self, start, end):
+        """
+        [start, end] 之间(包含两端)的交易日数量
+        """
+        start, end = np.asarray(start, dtype='datetime64[D]'), np.asarray(end, dtype='datetime64[D]')
+        _, sessions = self._prepare(np.concatenate([np.atleast_1d(start), np.atleast_1d(end)]))
+        result = np.searchsorted(sessions, end, side='right') - np.searchsorted(sessions, start, side='left')
+        return np.maximum(result, 0)
+
+    def between(self, start, end):
+        """
+        [start, end] 之间的交易日数组
+        """
+        start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+        if end < start:
+            return self.sessions[:0]
+        _, sessions = self._prepare(np.array([start, end]))
+        return sessions[np.searchsorted(sessions, start, side='left'):np.searchsorted(sessions, end, side='right')]
+
+    def clamp(self, start, end):
+        """
+        把区间收缩到首尾都是交易日，区间内没有交易日时返回 None
+        @return: (第一个交易日, 最后一个交易日) '%Y-%m-%d' 字符串
+        """
+        sessions = self.between(start, end)
+        if len(sessions) == 0:
+            return None
+        return str(sessions[0]), str(sessions[-1])
+
+    def missing_ranges(self, have, start, end):
+        """
+        [start, end] 中不在 have 里的交易日，合并为连续区间(中间没有其他交易日即视为连续)
+        @param have: 已有的日期数组，例如缓存中日线的日期列
+        @return: [(开始, 结束)] '%Y-%m-%d' 字符串
+        """
+        sessions = self.between(start, end)
+        have = np.asarray(have, dtype='datetime64[D]')
+        missing = ~np.isin(sessions, have) if len(have) > 0 else np.ones(len(sessions), dtype=bool)
+        index = np.flatnonzero(missing)
+        if len(index) == 0:
+            return []
+        # 缺失的交易日在 sessions 中的下标连续即为同一段
+        breaks = np.flatnonzero(np.diff(index) != 1)
+        firsts = np.concatenate([[index[0]], index[breaks + 1]])
+        lasts = np.concatenate([index[breaks], [index[-1]]])
+        return [(str(sessions[first]), str(sessions[last])) for first, last in zip(firsts, lasts)]
+
+    def previous_session(self, date, include=True):
+        """
+        date 之前最近的交易日，include 为 True 时包含 date 当天，'%Y-%m-%d' 字符串
+        """
+        date = np.datetime64(date, 'D') - (0 if include else 1)
+        _, sessions = self._prepare(np.array([date - 14, date]))
+        return str(sessions[np.searchsorted(sessions, date, side='right') - 1])
+
+    def next_session(self, date, include=True):
+        """
+        date 之后最近的交易日，include 为 True 时包含 date 当天，'%Y-%m-%d' 字符串
+        """
+        date = np.datetime64(date, 'D') + (0 if include else 1)
+        _, sessions = self._prepare(np.array([date, date + 14]))
+        return str(sessions[np.searchsorted(sessions, date, side='left')])
+
+
+# 默认日历，第一次使用时加载
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar() -> TradeCalendar:
+    global _calendar
+    with _calendar_lock:
+        if _calendar is None:
+            _calendar = load_calendar()
+        return _calendar
+
+
+def set_calendar(calendar: TradeCalendar):
+    """
+    替换默认日历，例如测试时使用 TradeCalendar.weekdays()
+    """
+    global _calendar
+    with _calendar_lock:
+        _calendar = calendar
+
+
+def load_calendar(cache_path=None, refresh=False) -> TradeCalendar:
+    """
+    加载交易日历，本地缓存覆盖到今天时直接使用，否则从 akshare 获取并写入缓存，都失败时使用工作日历
+    @param cache_path: 缓存文件，默认在 cache_dir_path 下
+    @param refresh: True 时忽略本地缓存
+    """
+    if cache_path is None:
+        cache_path = os.path.join(cache_dir_path, CACHE_FILE_NAME)
+    today = np.datetime64(datetime.date.today(), 'D')
+    cached = None
+    if not refresh:
+        try:
+            cached = TradeCalendar(np.load(cache_path))
+            if cached.last >= today:
+                return cached
+        except (OSError, ValueError) as e:
+            if os.path.exists(cache_path):
+                print('交易日历缓存读取失败', cache_path, e)
+    try:
+        calendar = TradeCalendar(_fetch_sessions())
+    except Exception as e:
+        print('交易日历获取失败，使用工作日历', e)
+        # 旧的缓存仍然比工作日历准确
+        return cached if cached is not None else TradeCalendar.weekdays()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        np.save(cache_path, calendar.sessions)
+    except OSError as e:
+        print('交易日历缓存写入失败', cache_path, e)
+    return calendar
+
+
+def _fetch_sessions():
+    # akshare 导入很慢，用到时才导入
+    import akshare as ak
+    df = ak.tool_trade_date_hist_sina()
+    return np.asarray(df['trade_date'].astype(str).to_numpy(), dtype='datetime64[D]')
+
+
+if __name__ == '__main__':
+    calendar = get_calendar()
+    print('交易日', calendar.first, '-', calendar.last, len(calendar.sessions))
+    print('2024-02-08 之后 3 个交易日', calendar.shift('2024-02-08', 3))
+    print('2024 年交易日数', calendar.count('2024-01-01', '2024-12-31'))
+    print('缺失区间', calendar.missing_ranges(['2024-01-02', '2024-01-03', '2024-01-08'], '2024-01-01', '2024-01-10'))
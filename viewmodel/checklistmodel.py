@@ -0,0 +1,157 @@
+import numpy as np
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+
+# 第 0 行固定为全选
+SELECT_ALL_TEXT = '全选'
+
+
+class CheckListModel(QAbstractListModel):
+    """
+    可勾选的列表模型，第 0 行是全选，之后是过滤后可见的选项
+    勾选状态保存在与选项一一对应的 bool 数组中，全选、反选只修改数组，
+    然后发出一次 dataChanged 和一次 selection_changed
+    """
+    # 勾选状态变化，批量操作只发一次
+    selection_changed = pyqtSignal()
+
+    def __init__(self, items=None, parent=None):
+        super().__init__(parent)
+        self._items = []
+        self._lower = np.array([], dtype=str)
+        self._checked = np.zeros(0, dtype=bool)
+        # 可见行到选项下标的映射
+        self._visible = np.zeros(0, dtype=np.int64)
+        self._filter = ''
+        self.set_items(items or [])
+
+    def set_items(self, items):
+        """
+        设置选项，清空勾选状态
+        """
+        self.beginResetModel()
+        self._items = [str(item) for item in items]
+        self._lower = np.array([item.lower() for item in self._items], dtype=str)
+        self._checked = np.zeros(len(self._items), dtype=bool)
+        self._visible = self._match(self._filter)
+        self.endResetModel()
+        self.selection_changed.emit()
+
+    def items(self):
+        return list(self._items)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._visible) + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return SELECT_ALL_TEXT if row == 0 else self._items[self._visible[row - 1]]
+        if role == Qt.CheckStateRole:
+            if row == 0:
+                return self._select_all_state()
+            return Qt.Checked if self._checked[self._visible[row - 1]] else Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        row = index.row()
+        if row == 0:
+            self.set_visible_checked(value == Qt.Checked)
+            return True
+        self._checked[self._visible[row - 1]] = value == Qt.Checked
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        # 全选行的半选状态随之变化
+        self.dataChanged.emit(self.index(0), self.index(0), [Qt.CheckStateRole])
+        self.selection_changed.emit()
+        return True
+
+    def toggle(self, row):
+        """
+        切换一行的勾选状态
+        """
+        index = self.index(row)
+        checked = self.data(index, Qt.CheckStateRole) == Qt.Checked
+        self.setData(index, Qt.Unchecked if checked else Qt.Checked, Qt.CheckStateRole)
+
+    def set_visible_checked(self, checked):
+        """
+        勾选或取消全部可见选项
+        """
+        self._checked[self._visible] = checked
+        self._notify_all()
+
+    def invert_visible(self):
+        """
+        反选全部可见选项
+        """
+        self._checked[self._visible] = ~self._checked[self._visible]
+        self._notify_all()
+
+    def set_checked_items(self, items, checked=True):
+        """
+        按名称批量勾选，名称不存在时抛出 ValueError
+        """
+        positions = {item: i for i, item in enumerate(self._items)}
+        rows = []
+        for item in items:
+            if item not in positions:
+                raise ValueError(f'{item} 不在选项中')
+            rows.append(positions[item])
+        self._checked[rows] = checked
+        self._notify_all()
+
+    def clear_checked(self):
+        self._checked[:] = False
+        self._notify_all()
+
+    def checked_items(self):
+        """
+        已勾选的选项，按选项顺序，不受过滤影响
+        """
+        return [self._items[i] for i in np.flatnonzero(self._checked)]
+
+    def checked_count(self):
+        return int(np.count_nonzero(self._checked))
+
+    def all_checked(self):
+        return len(self._items) > 0 and bool(self._checked.all())
+
+    def set_filter(self, text):
+        """
+        只显示包含 text 的选项，不区分大小写，勾选状态不变
+        """
+        text = text.strip().lower()
+        if text == self._filter:
+            return
+        self.beginResetModel()
+        self._filter = text
+        self._visible = self._match(text)
+        self.endResetModel()
+
+    def filter_text(self):
+        return self._filter
+
+    def _match(self, text):
+        if not text:
+            return np.arange(len(self._items))
+        return np.flatnonzero(np.char.find(self._lower, text) >= 0)
+
+    def _select_all_state(self):
+        checked = np.count_nonzero(self._checked[self._visible])
+        if len(self._visible) > 0 and checked == len(self._visible):
+            return Qt.Checked
+        return Qt.PartiallyChecked if checked else Qt.Unchecked
+
+    def _notify_all(self):
+        self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1), [Qt.CheckStateRole])
+        self.selection_changed.emit()
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+"""
+PdTable 的懒加载数据源
+数据源需要实现 row_count() 和 read(start, stop)，read 返回 [start, stop) 行的 DataFrame，
+PdTable 滚动到底部时按块读取，内存只随看过的行增长
+"""
+
+
+class FrameSource:
+    """
+    已经在内存中的 DataFrame，主要用于测试和对比
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+
+    def row_count(self):
+        return len(self.data)
+
+    def read(self, start, stop):
+        return self.data.iloc[start:stop].reset_index(drop=True)
+
+
+class ParquetSource:
+    """
+    按 row group 读取 Parquet 文件，只读取 [start, stop) 覆盖到的 row group，最近用过的 row group 缓存在内存中
+    写文件时 row group 不宜太大，例如 df.to_parquet(path, row_group_size=50000)
+    """
+
+    def __init__(self, path, columns=None, cache_groups=2):
+        """
+        @param path: Parquet 文件路径
+        @param columns: 只读取的列，默认全部
+        @param cache_groups: 缓存的 row group 数
+        """
+        # pyarrow 是可选依赖，用到时才导入
+        import pyarrow.parquet as pq
+        self.path = path
+        self.columns = columns
+        self.cache_groups = cache_groups
+        self._file = pq.ParquetFile(path)
+        metadata = self._file.metadata
+        sizes = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        # 每个 row group 的起始行，最后一个元素为总行数
+        self._starts = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self._cache = OrderedDict()
+
+    def row_count(self):
+        return int(self._starts[-1])
+
+    def read(self, start, stop):
+        stop = min(stop, self.row_count())
+        if start >= stop:
+            return self._read_group(0).iloc[0:0] if len(self._starts) > 1 else pd.DataFrame(columns=self.columns)
+        first = int(np.searchsorted(self._starts, start, side='right')) - 1
+        last = int(np.searchsorted(self._starts, stop, side='left')) - 1
+        frames = []
+        for group in range(first, last + 1):
+            df = self._read_group(group)
+            group_start = self._starts[group]
+            frames.append(df.iloc[max(start - group_start, 0):stop - group_start])
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+
+    def _read_group(self, group):
+        df = self._cache.get(group)
+        if df is not None:
+            self._cache.move_to_end(group)
+            return df
+        df = self._file.read_row_group(group, columns=self.columns).to_pandas()
+        self._cache[group] = df
+        while len(self._cache) > self.cache_groups:
+            self._cache.popitem(last=False)
+        return df
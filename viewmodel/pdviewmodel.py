@@ -1,28 +1,178 @@
-from PyQt5.QtCore import QAbstractTableModel, Qt
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from core.AppThreadExecutor import PRIORITY_INTERACTIVE
+
+# 增量更新时，连续区间超过这个数量就不再逐段通知，改为整体刷新
+DIFF_MAX_RUNS = 64
+
+# 设置了 executor 时，行数达到这个数量的排序、过滤和整体刷新才放到线程池中计算
+ASYNC_MIN_ROWS = 100000
+
+# 懒加载数据源没有指定分块大小时，每次加载的行数
+DEFAULT_CHUNK_SIZE = 10000
 
 
 class PdTable(QAbstractTableModel):
-    def __init__(self, data=None, column=0):
+    def __init__(self, data=None, column=0, formats=None, key=None, chunk_size=None, source=None):
+        """
+        @param data: DataFrame 数据
+        @param column: 默认排序的列
+        @param formats: 每列的显示格式 {列名: 格式}，格式为 '%.2f' 这类字符串或者 callable
+        @param key: 行标识列，例如 'code'，设置后 notify_data 按该列做增量更新
+        @param chunk_size: 分块加载的行数，设置后视图先只看到 chunk_size 行，滚动到底部时由 fetchMore 继续加载，
+                           None 表示一次显示全部
+        @param source: 懒加载数据源，见 viewmodel.lazysource，设置后忽略 data，数据随滚动逐块读取
+        """
         QAbstractTableModel.__init__(self)
+        # 原始数据，排序不会修改它，显示顺序由 _perm 决定
         self._data = data
         # 默认降序排序，选中第三列
         self.order = 1
         self.column = column
-        # 固定排序
+        # 多列排序 [(列, 是否升序), ...]，为空时按 column/order 单列排序
+        self.sort_keys = []
+        # 固定排序，按上一次排序时 fix_sort_column 的先后位置来排
         self.fix_sort = False
-        self.last_sort_list = []
+        self.fix_sort_column = 'name'
+        # 上一次排序后 fix_sort_column 列的值和显示顺序，用到固定排序时才计算位置
+        self._fixed_snapshot = None
+        self._fixed_positions = None
+        # 行过滤，接收 DataFrame 返回 bool 数组
+        self._row_filter = None
+        # 排序、过滤在 executor 的线程中计算，见 set_executor
+        self.executor = None
+        self.async_min_rows = ASYNC_MIN_ROWS
+        # 每次请求新的显示顺序或者数据变化时加一，用于丢弃过期的计算结果
+        self._generation = 0
+        # notify_data 传入、还在线程池中计算的新数据，算好之前的排序、过滤请求都基于它
+        self._pending_data = None
+        # 增量更新的行标识列
+        self.key = key
+        # 视图行到原始行的映射，None 表示原始顺序
+        self._perm = None
+        # 列缓存，每列一个 numpy 数组，以及显示字符串的缓存数组(按需构建，None 表示未构建，
+        # 数组中为 None 的单元格显示时才格式化，只有看过的单元格才会生成字符串)
+        self.formats = dict(formats) if formats else {}
+        self._values = []
+        self._display = []
+        # 每列的排序键缓存 (key, na)
+        self._sort_cache = []
+        # 分块加载：已经提供给视图的行数(懒加载数据源时为已经读取的行数)，以及懒加载数据源
+        self.chunk_size = chunk_size
+        self._source = None
+        self._fetched = 0 if data is None or chunk_size is None else min(chunk_size, len(data))
+        self._rebuild_cache()
+        if source is not None:
+            self.set_source(source)
 
     def rowCount(self, parent=None):
+        total = self._total_rows()
+        if self.chunk_size is None:
+            return total
+        return min(total, self._fetched)
+
+    def _total_rows(self):
+        """
+        已经在内存中的行数，不受分块限制
+        """
+        if self._perm is not None:
+            return len(self._perm)
+        if self._data is None:
+            return 0
         return self._data.shape[0]
 
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.chunk_size is None:
+            return False
+        available = self._source.row_count() if self._source is not None else self._total_rows()
+        return self._fetched < available
+
+    def fetchMore(self, parent=QModelIndex()):
+        """
+        视图滚动到底部时调用，再提供 chunk_size 行，懒加载数据源时从数据源读取
+        """
+        if not self.canFetchMore(parent):
+            return
+        first = self.rowCount()
+        if self._source is None:
+            count = min(self.chunk_size, self._total_rows() - self._fetched)
+            self.beginInsertRows(QModelIndex(), first, first + count - 1)
+            self._fetched += count
+            self.endInsertRows()
+            return
+
+        chunk = self._source.read(self._fetched, self._fetched + self.chunk_size)
+        if len(chunk) == 0:
+            return
+        # 数据变化了，正在计算的排序结果作废
+        self._generation += 1
+        rows = np.arange(len(self._data), len(self._data) + len(chunk))
+        if self._row_filter is not None:
+            rows = rows[np.asarray(self._row_filter(chunk), dtype=bool)]
+        if len(rows) > 0:
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._append_rows(chunk, rows)
+        self._fetched += len(chunk)
+        if len(rows) > 0:
+            self.endInsertRows()
+
+    def set_source(self, source, chunk_size=None):
+        """
+        切换为懒加载数据源，先读取第一块
+        @param source: 实现 row_count()/read(start, stop) 的数据源
+        @param chunk_size: 每块的行数，默认沿用当前设置，都没有时为 DEFAULT_CHUNK_SIZE
+        """
+        self.chunk_size = chunk_size or self.chunk_size or DEFAULT_CHUNK_SIZE
+        self._generation += 1
+        self._pending_data = None
+        self.beginResetModel()
+        self._source = source
+        self._data = source.read(0, self.chunk_size)
+        self._fetched = len(self._data)
+        self._fixed_snapshot = None
+        self._fixed_positions = None
+        self._rebuild_cache()
+        self._perm = None
+        if self._row_filter is not None:
+            self._perm = np.flatnonzero(np.asarray(self._row_filter(self._data), dtype=bool))
+        self.endResetModel()
+
+    def _append_rows(self, chunk, rows):
+        """
+        懒加载时追加读取到的行，已有的显示缓存保留，排序只作用于已加载的行，新行追加在末尾
+        @param rows: 新行中通过过滤的原始行号
+        """
+        self._data = pd.concat([self._data, chunk], ignore_index=True)
+        for col in range(self._data.shape[1]):
+            self._values[col] = self._data.iloc[:, col].to_numpy()
+            if self._display[col] is not None:
+                self._display[col] = np.concatenate([self._display[col], np.full(len(chunk), None, dtype=object)])
+            self._sort_cache[col] = None
+        if self._perm is not None:
+            self._perm = np.concatenate([self._perm, rows])
+        elif len(rows) < len(chunk):
+            self._perm = np.concatenate([np.arange(len(self._data) - len(chunk)), rows])
+
     def columnCount(self, parent=None):
+        if self._data is None:
+            return 0
         return self._data.shape[1]
 
     # 显示数据
     def data(self, index, role=Qt.DisplayRole):
         if index.isValid():
             if role == Qt.DisplayRole:
-                return str(self._data.iloc[index.row(), index.column()])
+                col = index.column()
+                display = self._display[col]
+                if display is None:
+                    display = self._build_display(col)
+                row = self._source_row(index.row())
+                text = display[row]
+                if text is None:
+                    text = display[row] = format_value(self._values[col][row], self.formats.get(self._data.columns[col]))
+                return text
         return None
 
     # 显示行和列头
@@ -30,45 +180,537 @@ class PdTable(QAbstractTableModel):
         if orientation == Qt.Horizontal and role == Qt.DisplayRole:
             return self._data.columns[col]
         elif orientation == Qt.Vertical and role == Qt.DisplayRole:
+            if self._perm is not None:
+                return col
             return self._data.axes[0][col]
         return None
 
     def sort(self, column, order):
         self.column = column
         self.order = order
-        self._notify_data_change()
+        self.sort_keys = []
+        if self._data is None:
+            return
+        self._request_view(remember_fixed=True)
+
+    def sort_by(self, columns, orders=None):
+        """
+        多列稳定排序，排在前面的列优先
+        @param columns: 列号或列名数组
+        @param orders: 每列的 Qt.AscendingOrder/Qt.DescendingOrder，默认全部升序
+        """
+        if orders is None:
+            orders = [Qt.AscendingOrder] * len(columns)
+        self.sort_keys = [(self._column_position(column), order == Qt.AscendingOrder)
+                          for column, order in zip(columns, orders)]
+        self.column, self.order = self.sort_keys[0][0], orders[0]
+        self._request_view(remember_fixed=True)
+
+    def set_row_filter(self, row_filter):
+        """
+        只显示满足条件的行，与排序一起计算
+        @param row_filter: 接收 DataFrame 返回等长 bool 数组的函数，例如 lambda df: df['change'] > 0，None 表示不过滤
+        """
+        self._row_filter = row_filter
+        if self._data is None:
+            return
+        self._request_view(rows_changed=True)
 
-        # 去重
-        list1 = list(self._data['name'])
-        self.last_sort_list = sorted(set(list1), key=list1.index)
+    def set_executor(self, executor, min_rows=ASYNC_MIN_ROWS):
+        """
+        排序、过滤和整体刷新数据放到线程池中计算，算好之前视图保持原来的显示，算好后一次性替换，
+        期间再次请求(例如连续点击表头)时，旧的请求直接丢弃
+        @param executor: AppThreadExecutor，None 表示全部在主线程同步计算
+        @param min_rows: 行数少于该值时仍然同步计算
+        """
+        self.executor = executor
+        self.async_min_rows = min_rows
 
     def notify_data(self, data):
-        self._data = data
-        self._notify_data_change()
+        """
+        刷新数据，设置了 key 且新旧数据结构一致时走增量更新，
+        否则整体替换并重新排序；懒加载数据源时切换回普通的 DataFrame
+        """
+        self._source = None
+        if data is None:
+            self._generation += 1
+            self._pending_data = None
+            self.beginResetModel()
+            self._data = None
+            self._perm = None
+            self._fetched = 0
+            self._rebuild_cache()
+            self.endResetModel()
+            return
+        if self._can_diff(data):
+            self._generation += 1
+            self._pending_data = None
+            self._diff_update(data)
+            return
+        self._request_view(data=data)
 
-    def _notify_data_change(self):
-        if self.fix_sort:
-            # 固定位置，则按上一次的排序来排
-            if len(self.last_sort_list) == 0:
-                self.layoutChanged.emit()
-            else:
-                # 按上一次的序列排序
+    def _can_diff(self, data):
+        """
+        是否可以按 key 做增量更新：列一致，且新旧数据的 key 都不重复
+        """
+        if self.key is None or self._data is None or data is None:
+            return False
+        if self._row_filter is not None:
+            # 增量更新保持原来的行，过滤条件需要整体重新计算
+            return False
+        if self.chunk_size is not None and self._fetched < self._total_rows():
+            # 还有没提供给视图的行，增删的通知对不上视图的行数
+            return False
+        if self.key not in data.columns or list(data.columns) != list(self._data.columns):
+            return False
+        return self._data[self.key].is_unique and data[self.key].is_unique
+
+    def _diff_update(self, data):
+        """
+        按 key 对比新旧数据，只通知变化的部分：
+        被删除的行发 rowsRemoved，新增的行追加到末尾发 rowsInserted，值变化的单元格发 dataChanged。
+        增量模式下保持当前的行顺序，不重新排序
+        """
+        old_keys = pd.Index(self._data[self.key].to_numpy())
+        new_keys = pd.Index(data[self.key].to_numpy())
+        # 每个旧原始行在新数据中的位置，-1 表示已被删除
+        old_to_new = new_keys.get_indexer(old_keys)
+        matched = np.flatnonzero(old_to_new >= 0)
+        inserted = np.ones(len(data), dtype=bool)
+        inserted[old_to_new[matched]] = False
+        inserted = np.flatnonzero(inserted)
+
+        # 每个视图行在新数据中的位置
+        view_to_new = old_to_new[self._view_perm()]
+        removed_runs = _runs(np.flatnonzero(view_to_new < 0))
+        perm = np.concatenate([view_to_new[view_to_new >= 0], inserted])
+        if len(removed_runs) > DIFF_MAX_RUNS:
+            # 删除的区间太零散，整体刷新更划算
+            self.beginResetModel()
+            self._data = data
+            self._perm = perm
+            self._fetched = len(perm)
+            self._rebuild_cache()
+            self.endResetModel()
+            return
+
+        # 从下往上删除，保证前面的区间行号不变，原始数据不动，只删除视图映射
+        for first, last in reversed(removed_runs):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self._perm = np.delete(self._view_perm(), np.s_[first:last + 1])
+            self.endRemoveRows()
+
+        # 逐列向量化对比保留下来的行，只重新格式化变化的单元格和新增的行
+        values = []
+        display = []
+        sort_cache = []
+        changed_rows = np.zeros(len(data), dtype=bool)
+        changed_cols = []
+        for col, name in enumerate(data.columns):
+            new_values = data.iloc[:, col].to_numpy()
+            changed = ~_equal_mask(self._values[col][matched], new_values[old_to_new[matched]])
+            changed_src = old_to_new[matched][changed]
+            if len(changed_src) > 0:
+                changed_rows[changed_src] = True
+                changed_cols.append(col)
+            old_display = self._display[col]
+            new_display = None
+            if old_display is not None:
+                new_display = np.empty(len(data), dtype=object)
+                new_display[old_to_new[matched]] = old_display[matched]
+                # 变化的单元格和新增的行留到显示时再格式化，行情这类整列变化时只格式化可见的行
+                new_display[changed_src] = None
+                new_display[inserted] = None
+            values.append(new_values)
+            display.append(new_display)
+            sort_cache.append(None)
+
+        def swap():
+            self._data = data
+            self._perm = perm
+            self._values = values
+            self._display = display
+            self._sort_cache = sort_cache
+            # 增量更新前已经全部提供给视图，新增的行直接可见
+            self._fetched = len(perm)
+
+        kept_count = len(perm) - len(inserted)
+        if len(inserted) > 0:
+            self.beginInsertRows(QModelIndex(), kept_count, len(perm) - 1)
+            swap()
+            self.endInsertRows()
+        else:
+            swap()
+
+        if changed_cols:
+            first_col, last_col = changed_cols[0], changed_cols[-1]
+            changed_view = np.flatnonzero(changed_rows[perm])
+            changed_runs = _runs(changed_view)
+            if len(changed_runs) > DIFF_MAX_RUNS:
+                changed_runs = [(changed_runs[0][0], changed_runs[-1][1])]
+            for first, last in changed_runs:
+                self.dataChanged.emit(self.index(first, first_col), self.index(last, last_col))
+
+    def set_column_format(self, name, fmt):
+        """
+        设置某一列的显示格式，只重建该列的显示缓存
+        @param name: 列名
+        @param fmt: '%.2f' 这类格式字符串，或者接收单个值返回字符串的 callable，None 表示还原为 str
+        """
+        if fmt is None:
+            self.formats.pop(name, None)
+        else:
+            self.formats[name] = fmt
+        if self._data is None:
+            return
+        for col, col_name in enumerate(self._data.columns):
+            if col_name == name:
+                self._display[col] = None
+                self.dataChanged.emit(self.index(0, col), self.index(self.rowCount() - 1, col))
+
+    def _request_view(self, data=None, remember_fixed=False, rows_changed=False):
+        """
+        重新计算显示顺序(排序 + 过滤)
+        行数达到 async_min_rows 且设置了 executor 时在线程池中计算，期间保持原来的显示
+        @param data: 新的原始数据，为空时按当前数据重新计算
+        @param remember_fixed: 用户主动排序，计算完记下 fix_sort_column 的顺序
+        @param rows_changed: 过滤条件变了，显示的行会增减
+        """
+        if data is None and self._pending_data is not None:
+            # 新数据还没算好又要重新排序、过滤，基于新数据计算，旧请求只作废显示顺序，不丢数据
+            data = self._pending_data
+        self._pending_data = None
+        self._generation += 1
+        generation = self._generation
+        request = self._view_request(data, remember_fixed, rows_changed)
+        if self.executor is None or request.data is None or len(request.data) < self.async_min_rows:
+            self._apply_view(request, compute_view(request))
+            return
+
+        self._pending_data = data
+
+        def on_ready(future):
+            if generation != self._generation:
+                # 期间又有新的请求或者数据变化，结果作废
+                return
+            self._pending_data = None
+            self._apply_view(request, future.result())
+
+        self.executor.submit(compute_view, on_ready, request, priority=PRIORITY_INTERACTIVE,
+                             key=f'pdtable_view_{id(self)}', task_name='PdTable.compute_view')
+
+    def _view_request(self, data, remember_fixed, rows_changed):
+        """
+        当前状态的快照，线程池中只读这些数据，不碰模型本身
+        """
+        request = _ViewRequest()
+        request.new_data = data is not None
+        request.data = data if data is not None else self._data
+        request.previous = self._cache_snapshot() if data is not None else None
+        request.values = None if data is not None else list(self._values)
+        request.sort_cache = None if data is not None else list(self._sort_cache)
+        request.keys = self.sort_keys or [(self.column, self.order == Qt.AscendingOrder)]
+        # 用户主动排序时总是按排序列排，整体刷新数据时按 fix_sort 决定
+        request.fix_sort = self.fix_sort and not remember_fixed
+        request.fix_column = self.fix_sort_column
+        request.fixed_snapshot = self._fixed_snapshot
+        request.fixed_positions = self._fixed_positions
+        request.row_filter = self._row_filter
+        request.remember_fixed = remember_fixed
+        request.rows_changed = rows_changed
+        return request
+
+    def _apply_view(self, request, result):
+        """
+        主线程执行，把计算好的显示顺序(以及新数据的列缓存)一次性替换进来
+        """
+        if result.fixed_positions is not None:
+            self._fixed_positions = result.fixed_positions
+        if request.new_data:
+            old_count = self.rowCount() if self._data is not None else -1
+            total = len(request.data if result.perm is None else result.perm)
+            fetched = self._fetched
+            if self.chunk_size is not None:
+                # 保留已经滚动加载过的行数
+                fetched = min(max(self._fetched, self.chunk_size), total)
+            if old_count == (total if self.chunk_size is None else fetched):
                 self.layoutAboutToBeChanged.emit()
-                self._data['name'] = self._data['name'].astype('category')
-                self._data['name'] = self._data['name'].cat.set_categories(self.last_sort_list)
-                self._data.sort_values('name', inplace=True)
-                self._data.reset_index(inplace=True, drop=True)
+                self._swap_view(request, result, fetched)
                 self.layoutChanged.emit()
-                pass
+            else:
+                # 行数变化了，布局变化无法表达，整体刷新
+                self.beginResetModel()
+                self._swap_view(request, result, fetched)
+                self.endResetModel()
+        elif request.rows_changed:
+            self.beginResetModel()
+            self._sort_cache = result.sort_cache
+            self._perm = result.perm
+            if self.chunk_size is not None and self._source is None:
+                self._fetched = min(max(self._fetched, self.chunk_size), self._total_rows())
+            self.endResetModel()
         else:
-            col_name = self._data.columns.tolist()[self.column]
-            self.layoutAboutToBeChanged.emit()
-            self._data.sort_values(col_name, ascending=self.order == Qt.AscendingOrder, inplace=True)
-            self._data.reset_index(inplace=True, drop=True)
-            self.layoutChanged.emit()
+            self._sort_cache = result.sort_cache
+            self._apply_perm(result.perm)
+
+        if request.remember_fixed and self._data is not None and self.fix_sort_column in self._data.columns:
+            self._fixed_snapshot = (self._values[self._data.columns.get_loc(self.fix_sort_column)], self._view_perm())
+            self._fixed_positions = None
+
+    def _swap_view(self, request, result, fetched):
+        self._data = request.data
+        self._values = result.values
+        self._display = result.display
+        self._sort_cache = result.sort_cache
+        self._perm = result.perm
+        self._fetched = fetched
+
+    def _apply_perm(self, perm):
+        """
+        原始数据不变，只切换显示顺序，同时把持久化索引(选中项等)映射到新的位置
+        """
+        self.layoutAboutToBeChanged.emit()
+        old_perm = self._view_perm()
+        self._perm = perm
+        persistent = self.persistentIndexList()
+        if persistent:
+            # 原始行 -> 新视图行
+            source_to_view = np.full(len(self._data), -1, dtype=np.intp)
+            view_perm = self._view_perm()
+            source_to_view[view_perm] = np.arange(len(view_perm))
+            new_indexes = []
+            for index in persistent:
+                row = source_to_view[old_perm[index.row()]] if index.row() < len(old_perm) else -1
+                # 分块加载时，移到还没提供给视图的位置的选中项失效
+                valid = 0 <= row < self.rowCount()
+                new_indexes.append(self.index(int(row), index.column()) if valid else QModelIndex())
+            self.changePersistentIndexList(persistent, new_indexes)
+        self.layoutChanged.emit()
+
+    def _column_position(self, column):
+        if isinstance(column, str):
+            return self._data.columns.get_loc(column)
+        return column
+
+    def _view_perm(self):
+        """
+        视图行到原始行的映射数组，原始顺序时返回 arange
+        """
+        if self._perm is None:
+            return np.arange(len(self._data))
+        return self._perm
+
+    def _source_row(self, row):
+        if self._perm is None:
+            return row
+        return self._perm[row]
+
+    def _cache_snapshot(self):
+        """
+        当前的列缓存 {列名: (values, display, sort_key)}
+        """
+        if self._data is None or len(self._values) == 0:
+            return {}
+        return dict(zip(self._data.columns, zip(self._values, self._display, self._sort_cache)))
+
+    def _rebuild_cache(self):
+        """
+        从 DataFrame 重建每列的 numpy 数组，显示字符串和排序键等到用到时再计算
+        """
+        self._values = []
+        self._display = []
+        self._sort_cache = []
+        if self._data is None:
+            return
+        for col in range(self._data.shape[1]):
+            self._values.append(self._data.iloc[:, col].to_numpy())
+            self._display.append(None)
+            self._sort_cache.append(None)
+
+    def _build_display(self, col):
+        """
+        为一列分配显示缓存，单元格在显示时才格式化，百万行的表只格式化看过的单元格
+        """
+        display = np.full(len(self._values[col]), None, dtype=object)
+        self._display[col] = display
+        return display
 
     def get_data(self, row):
-        return self._data.iloc[row]
+        return self._data.iloc[self._source_row(row)]
 
     def data_len(self):
-        return len(self._data)
+        return self.rowCount()
+
+
+class _ViewRequest:
+    """
+    计算显示顺序所需的数据快照
+    """
+    __slots__ = ('new_data', 'data', 'previous', 'values', 'sort_cache', 'keys', 'fix_sort', 'fix_column',
+                 'fixed_snapshot', 'fixed_positions', 'row_filter', 'remember_fixed', 'rows_changed')
+
+
+class _ViewResult:
+    """
+    显示顺序的计算结果，新数据时还包含重建好的列缓存
+    """
+    __slots__ = ('values', 'display', 'sort_cache', 'perm', 'fixed_positions')
+
+
+def compute_view(request):
+    """
+    按快照计算视图到原始行的映射，只读 request，可以在线程池中执行
+    @return: _ViewResult，perm 为 None 表示原始顺序
+    """
+    result = _ViewResult()
+    result.fixed_positions = None
+    data = request.data
+    if data is None:
+        result.values, result.display, result.sort_cache, result.perm = [], [], [], None
+        return result
+
+    if request.new_data:
+        # 内容没有变化的列沿用原来的显示字符串和排序键
+        values, display, sort_cache = [], [], []
+        for col, name in enumerate(data.columns):
+            column_values = data.iloc[:, col].to_numpy()
+            old = request.previous.get(name)
+            if old is not None and _same_values(old[0], column_values):
+                display.append(old[1])
+                sort_cache.append(old[2])
+            else:
+                display.append(None)
+                sort_cache.append(None)
+            values.append(column_values)
+        result.display = display
+    else:
+        values, sort_cache = request.values, request.sort_cache
+        result.display = None
+    result.values = values
+    result.sort_cache = sort_cache
+
+    perm = None
+    if len(values) == 0:
+        pass
+    elif request.fix_sort:
+        # 固定排序：按上一次排序记下的位置排列，新出现的行排在最后
+        positions = request.fixed_positions
+        if positions is None and request.fixed_snapshot is not None:
+            old_values, old_perm = request.fixed_snapshot
+            positions = result.fixed_positions = pd.Index(pd.unique(old_values[old_perm]))
+        if positions is not None and request.fix_column in data.columns:
+            rank = positions.get_indexer(values[data.columns.get_loc(request.fix_column)])
+            rank[rank < 0] = len(positions)
+            perm = np.argsort(rank, kind='stable')
+    else:
+        for col, _ in request.keys:
+            if sort_cache[col] is None:
+                sort_cache[col] = sort_key(values[col])
+        perm = argsort_columns([sort_cache[col] for col, _ in request.keys],
+                               [ascending for _, ascending in request.keys])
+
+    if request.row_filter is not None:
+        mask = np.asarray(request.row_filter(data), dtype=bool)
+        base = perm if perm is not None else np.arange(len(data))
+        perm = base[mask[base]]
+    result.perm = perm
+    return result
+
+
+def argsort_columns(keys, ascending):
+    """
+    多列稳定排序，返回视图行到原始行的映射，空值始终排在最后
+    @param keys: 每列的排序键 (key, na)，由 sort_key 生成，排在前面的列优先
+    @param ascending: 每列是否升序
+    """
+    if len(keys) == 1 and not keys[0][1].any():
+        # 单列且没有空值，一次 argsort 即可
+        key = keys[0][0] if ascending[0] else -keys[0][0]
+        return np.argsort(key, kind='stable')
+    # np.lexsort 以最后一个键为主键，每列的空值标记优先于值本身
+    lex_keys = []
+    for (key, na), asc in reversed(list(zip(keys, ascending))):
+        lex_keys.append(key if asc else -key)
+        lex_keys.append(na)
+    return np.lexsort(lex_keys)
+
+
+def sort_key(values):
+    """
+    把一列数据转换为可以直接 argsort 的数值排序键
+    数值和日期直接使用，字符串等按字典序编码为整数，返回 (key, na)，na 为空值标记
+    """
+    kind = values.dtype.kind
+    if kind == 'b':
+        return values.astype(np.int8), np.zeros(len(values), dtype=bool)
+    if kind == 'i':
+        return values.astype(np.int64), np.zeros(len(values), dtype=bool)
+    if kind in 'uf':
+        values = values.astype(np.float64)
+        na = np.isnan(values)
+        return np.where(na, 0, values), na
+    if kind in 'Mm':
+        na = np.isnat(values)
+        return np.where(na, 0, values.view(np.int64)), na
+    try:
+        codes, _ = pd.factorize(values, sort=True)
+    except TypeError:
+        # 混合类型无法直接比较，按字符串排序
+        codes, _ = pd.factorize(values.astype(str), sort=True)
+    return codes.astype(np.int64), codes < 0
+
+
+def format_value(value, fmt=None):
+    """
+    格式化单个值
+    @param value: 列的 numpy 数组中取出的值
+    @param fmt: None 时与 str(value) 一致，日期按 Timestamp 显示；'%.2f' 这类格式字符串；或者 callable
+    """
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    elif isinstance(value, np.timedelta64):
+        value = pd.Timedelta(value)
+    if fmt is None:
+        return str(value)
+    if callable(fmt):
+        return fmt(value)
+    return fmt % value
+
+
+def _runs(rows):
+    """
+    把有序的行号数组切分为连续区间 [(first, last), ...]
+    """
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) != 1)
+    firsts = np.concatenate([[rows[0]], rows[breaks + 1]])
+    lasts = np.concatenate([rows[breaks], [rows[-1]]])
+    return list(zip(firsts.tolist(), lasts.tolist()))
+
+
+def _equal_mask(old, new):
+    """
+    逐元素对比两列数据，NaN 与 NaN 视为相等
+    """
+    try:
+        equal = np.asarray(old == new, dtype=bool)
+    except (TypeError, ValueError):
+        equal = np.zeros(len(new), dtype=bool)
+    if equal.shape != new.shape:
+        equal = np.zeros(len(new), dtype=bool)
+    return equal | (pd.isna(old) & pd.isna(new))
+
+
+def _same_values(old, new):
+    """
+    两列 numpy 数据是否完全一致，NaN 视为相等
+    """
+    if old.shape != new.shape or old.dtype != new.dtype:
+        return False
+    try:
+        if new.dtype.kind in 'fc':
+            return np.array_equal(old, new, equal_nan=True)
+        return bool(np.all(old == new))
+    except (TypeError, ValueError):
+        return False
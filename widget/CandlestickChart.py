@@ -0,0 +1,442 @@
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QLineF, QRect, QRectF, Qt, QTimer
+from PyQt5.QtGui import QColor, QPainter, QPen
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget
+
+# 涨跌颜色，红涨绿跌
+UP_COLOR = QColor(230, 60, 60)
+DOWN_COLOR = QColor(40, 180, 100)
+BACKGROUND_COLOR = QColor(25, 25, 30)
+AXIS_COLOR = QColor(150, 150, 160)
+
+# 金字塔最粗一层的K线数量下限
+PYRAMID_MIN_SIZE = 256
+# 合并为像素列时，每列至少由这么多个金字塔块组成
+BLOCKS_PER_COLUMN = 8
+
+
+class OhlcPyramid:
+    """
+    K线的多分辨率金字塔，第 k 层每个块为 2^k 根原始K线的最高、最低价，第 0 层即原始K线
+    按任意边界合并时，桶拆成对齐的块：两端不足一个大块的部分每层最多取一个小块，中间的整块从选定的一层取，
+    结果与逐根合并完全一致，每个桶只读取约 2 * BLOCKS_PER_COLUMN 个块和两端各不超过层数个小块；
+    开盘、收盘直接取桶的首尾，成交量由累加和相减得到
+    """
+
+    def __init__(self, open_, high, low, close, volume):
+        self.open, self.high, self.low, self.close, self.volume = (
+            np.asarray(values, dtype=np.float64) for values in (open_, high, low, close, volume))
+        self.size = len(self.close)
+        self._volume_sum = np.concatenate([[0.0], np.cumsum(self.volume)])
+        # 每层末尾补一个哨兵(最高价 -inf，最低价 inf)，reduceat 的结束下标可以等于该层的长度
+        h, l = self.high, self.low
+        levels = [(np.append(h, -np.inf), np.append(l, np.inf))]
+        while len(h) > PYRAMID_MIN_SIZE:
+            starts = np.arange(0, len(h), 2)
+            h, l = np.maximum.reduceat(h, starts), np.minimum.reduceat(l, starts)
+            levels.append((np.append(h, -np.inf), np.append(l, np.inf)))
+        self.levels = levels
+
+    def buckets(self, bounds):
+        """
+        按原始K线下标的边界合并，第 i 个桶为 [bounds[i], bounds[i + 1])
+        @param bounds: 单调不减的边界数组，已经限制在 [0, size] 之内
+        @return: (有数据的桶的下标, open, high, low, close, volume)
+        """
+        bounds = np.asarray(bounds, dtype=np.int64)
+        valid = np.flatnonzero(bounds[1:] > bounds[:-1])
+        starts, ends = bounds[valid], bounds[valid + 1]
+        if len(valid) == 0:
+            empty = np.array([])
+            return valid, empty, empty, empty, empty, empty
+        # 选一层块大小不超过桶宽 1/BLOCKS_PER_COLUMN 的金字塔
+        width = (ends[-1] - starts[0]) / len(valid)
+        level = int(np.clip(math.floor(math.log2(max(width / BLOCKS_PER_COLUMN, 1))), 0, len(self.levels) - 1))
+        highs = np.full(len(valid), -np.inf)
+        lows = np.full(len(valid), np.inf)
+        position = starts.copy()
+        # 头部：从低层到高层，位置在该层没有对齐时取一个小块，直到对齐到选定的一层或者剩下的放不下
+        for k in range(level):
+            self._take_blocks(k, position, ((position >> k) & 1 == 1) & (position + (1 << k) <= ends), highs, lows)
+        # 中间：选定一层的整块，头部没有对齐时剩下的不到一个整块，count 为 0
+        count = (ends - position) >> level
+        inner = np.flatnonzero(count > 0)
+        if len(inner) > 0:
+            first = position[inner] >> level
+            high, low = self.levels[level]
+            highs[inner] = np.maximum(highs[inner], _reduce_segments(np.maximum, high, first, first + count[inner]))
+            lows[inner] = np.minimum(lows[inner], _reduce_segments(np.minimum, low, first, first + count[inner]))
+            position[inner] += count[inner] << level
+        # 尾部：从高层到低层，剩下的长度够一个块就取
+        for k in range(level - 1, -1, -1):
+            self._take_blocks(k, position, ends - position >= (1 << k), highs, lows)
+        volume = self._volume_sum[ends] - self._volume_sum[starts]
+        return valid, self.open[starts], highs, lows, self.close[ends - 1], volume
+
+    def _take_blocks(self, level, position, mask, highs, lows):
+        """
+        mask 选中的桶取 position 处第 level 层的一个块并入结果，position 前进一个块
+        """
+        index = np.flatnonzero(mask)
+        if len(index) == 0:
+            return
+        high, low = self.levels[level]
+        block = position[index] >> level
+        highs[index] = np.maximum(highs[index], high[block])
+        lows[index] = np.minimum(lows[index], low[block])
+        position[index] += 1 << level
+
+
+def _reduce_segments(ufunc, values, starts, ends):
+    """
+    每段 [starts[i], ends[i]) 的归约，段非空、按顺序排列且互不重叠，values 末尾有一个哨兵
+    只对 [starts[0], ends[-1]] 这一段做 reduceat，耗时与这些段覆盖的范围有关，与 values 的长度无关
+    """
+    base = starts[0]
+    # reduceat 对成对的 (start, end) 下标，偶数位置即每段的结果
+    index = np.empty(2 * len(starts), dtype=np.int64)
+    index[0::2] = starts - base
+    index[1::2] = ends - base
+    return ufunc.reduceat(values[base:ends[-1] + 1], index)[0::2]
+
+
+class CandlestickChart(QWidget):
+    """
+    K线和成交量图
+    x 方向以像素为单位记录视图位置 offset，第 i 根K线的左边位于 i / bars_per_pixel - offset，
+    每根K线少于一个像素时按像素列合并为一根(由金字塔按列边界聚合)，每列只画一条线，绘制量与数据量无关。
+    平移整数像素时坐标系不变，直接滚动已经画好的内容，只重画露出来的一条；
+    纵轴范围只在可见数据超出当前范围或者明显变小时才改变，改变时才整体重画
+    """
+    # 右侧价格轴宽度，底部日期栏高度
+    AXIS_WIDTH = 64
+    DATE_HEIGHT = 18
+    # 成交量区域占绘图区高度的比例
+    VOLUME_RATIO = 0.22
+    # 每根K线最多占的像素数
+    MAX_BAR_PIXELS = 24
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setMouseTracking(False)
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setMinimumSize(200, 120)
+        self.times = np.array([], dtype='datetime64[m]')
+        self.pyramid = None
+        self.bars_per_pixel = 1.0
+        self.offset = 0
+        # 当前的纵轴范围
+        self._price_range = None
+        self._volume_max = None
+        # 当前视图每个像素列的数据，见 _build_columns
+        self._columns = None
+        self._drag_x = None
+        # 最近一次绘制的耗时(秒)和重画的宽度，用于观察平移时是否只重画了露出的部分
+        self.last_paint_time = 0.0
+        self.last_paint_width = 0
+
+    def set_bars(self, times, open_, high, low, close, volume=None):
+        """
+        设置K线数据，默认显示最后一屏
+        @param times: datetime64 数组
+        """
+        self.times = np.asarray(times, dtype='datetime64[m]')
+        if volume is None:
+            volume = np.zeros(len(self.times))
+        self.pyramid = OhlcPyramid(open_, high, low, close, volume)
+        self.show_last()
+
+    def set_frame(self, df, time_column='日期', columns=('开盘', '最高', '最低', '收盘', '成交量')):
+        """
+        设置 DataFrame 数据，列名默认与 datasource.data_hist 一致
+        """
+        df = df.dropna(subset=list(columns[:4]))
+        times = pd.to_datetime(df[time_column]).to_numpy()
+        volume = df[columns[4]].to_numpy(dtype=np.float64) if columns[4] in df.columns else None
+        self.set_bars(times, *(df[column].to_numpy(dtype=np.float64) for column in columns[:4]), volume)
+
+    def show_last(self, bars_per_pixel=None):
+        if bars_per_pixel is not None:
+            self.bars_per_pixel = bars_per_pixel
+        elif self.pyramid is not None:
+            self.bars_per_pixel = max(self.bars_per_pixel, 1 / self.MAX_BAR_PIXELS)
+        count = self.pyramid.size if self.pyramid is not None else 0
+        self.offset = int(count / self.bars_per_pixel) - self._chart_width()
+        self._refresh(full=True)
+
+    def pan(self, dx):
+        """
+        向左平移 dx 像素(负数向右)，只重画露出来的部分
+        """
+        if self.pyramid is None or dx == 0:
+            return
+        offset = self._clamp_offset(self.offset + int(dx))
+        dx = offset - self.offset
+        if dx == 0:
+            return
+        self.offset = offset
+        if self._refresh(full=False):
+            self.scroll(-dx, 0, QRect(0, 0, self._chart_width(), self.height()))
+
+    def zoom(self, factor, anchor_x=None):
+        """
+        缩放，factor 大于 1 时放大，anchor_x 处的K线位置不变
+        """
+        if self.pyramid is None:
+            return
+        anchor_x = self._chart_width() / 2 if anchor_x is None else anchor_x
+        bar = (self.offset + anchor_x) * self.bars_per_pixel
+        max_bpp = max(self.pyramid.size / max(self._chart_width(), 1), 1 / self.MAX_BAR_PIXELS)
+        self.bars_per_pixel = float(np.clip(self.bars_per_pixel / factor, 1 / self.MAX_BAR_PIXELS, max_bpp))
+        self.offset = self._clamp_offset(int(round(bar / self.bars_per_pixel - anchor_x)))
+        self._refresh(full=True)
+
+    def _clamp_offset(self, offset):
+        width = self._chart_width()
+        last = int(self.pyramid.size / self.bars_per_pixel)
+        return int(np.clip(offset, -width // 2, max(last - width // 2, -width // 2)))
+
+    def _chart_width(self):
+        return max(self.width() - self.AXIS_WIDTH, 1)
+
+    def _refresh(self, full):
+        """
+        重新计算可见的像素列，纵轴范围不变且不要求整体重画时返回 True，调用方滚动已有内容即可
+        """
+        self._columns = self._build_columns()
+        if self._update_range() or full:
+            self.update()
+            return False
+        return True
+
+    def _build_columns(self):
+        """
+        可见范围内每个绘制单元：每根K线超过一个像素时为单根K线，否则为一个像素列
+        @return: dict，x0/x1 为单元的左右像素位置，其余为 OHLCV 数组
+        """
+        width = self._chart_width()
+        if self.pyramid is None or self.pyramid.size == 0:
+            return None
+        bpp = self.bars_per_pixel
+        if bpp < 1:
+            first = max(int(math.floor(self.offset * bpp)), 0)
+            last = min(int(math.ceil((self.offset + width) * bpp)), self.pyramid.size)
+            bars = np.arange(first, max(last, first))
+            pyramid = self.pyramid
+            o, h, l, c, v = (values[first:last] for values in
+                             (pyramid.open, pyramid.high, pyramid.low, pyramid.close, pyramid.volume))
+            x0 = bars / bpp - self.offset
+            return {'x0': x0, 'x1': x0 + 1 / bpp, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        # 第 g 个全局像素列对应原始K线 [floor(g * bpp), floor((g + 1) * bpp))，边界只与 g 有关，平移后仍然一致
+        pixels = np.arange(self.offset, self.offset + width + 1)
+        bounds = np.clip(np.floor(pixels * bpp).astype(np.int64), 0, self.pyramid.size)
+        valid, o, h, l, c, v = self.pyramid.buckets(bounds)
+        x0 = valid.astype(np.float64)
+        return {'x0': x0, 'x1': x0 + 1, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+
+    def _update_range(self):
+        """
+        按可见数据更新纵轴范围，范围变化时返回 True
+        """
+        columns = self._columns
+        if columns is None or len(columns['x0']) == 0:
+            return False
+        low, high = float(columns['low'].min()), float(columns['high'].max())
+        volume = float(columns['volume'].max())
+        changed = False
+        current = self._price_range
+        if current is None or low < current[0] or high > current[1] or (high - low) < 0.6 * (current[1] - current[0]):
+            # 留出余量，小幅平移时不必改变范围
+            margin = max(high - low, abs(high) * 1e-3, 1e-9) * 0.08
+            self._price_range = (low - margin, high + margin)
+            changed = True
+        if self._volume_max is None or volume > self._volume_max or volume < 0.4 * self._volume_max:
+            self._volume_max = volume * 1.15 if volume > 0 else 1.0
+            changed = True
+        return changed
+
+    def _layout(self):
+        """
+        (价格区域, 成交量区域) 的 (top, bottom) 像素位置
+        """
+        plot_bottom = self.height() - self.DATE_HEIGHT
+        volume_top = plot_bottom - int(plot_bottom * self.VOLUME_RATIO)
+        return (4, volume_top - 6), (volume_top, plot_bottom)
+
+    def paintEvent(self, event):
+        start = time.perf_counter()
+        rect = event.rect()
+        painter = QPainter(self)
+        painter.fillRect(rect, BACKGROUND_COLOR)
+        columns = self._columns
+        if columns is not None and len(columns['x0']) > 0:
+            self._paint_bars(painter, rect, columns)
+            self._paint_dates(painter, rect)
+            self._paint_axis(painter, rect)
+        painter.end()
+        self.last_paint_time = time.perf_counter() - start
+        self.last_paint_width = rect.width()
+
+    def _paint_bars(self, painter, rect, columns):
+        (price_top, price_bottom), (volume_top, volume_bottom) = self._layout()
+        low_price, high_price = self._price_range
+        scale = (price_bottom - price_top) / (high_price - low_price)
+        volume_scale = (volume_bottom - volume_top) / self._volume_max
+
+        # 只画与重画区域相交的单元
+        x0, x1 = columns['x0'], columns['x1']
+        visible = np.flatnonzero((x1 > rect.left()) & (x0 < rect.right() + 1))
+        if len(visible) == 0:
+            return
+        x0, x1 = x0[visible], x1[visible]
+        o, h, l, c, v = (columns[name][visible] for name in ('open', 'high', 'low', 'close', 'volume'))
+        center = np.floor((x0 + x1) / 2) + 0.5
+        y_high = price_top + (high_price - h) * scale
+        y_low = price_top + (high_price - l) * scale
+        y_open = price_top + (high_price - o) * scale
+        y_close = price_top + (high_price - c) * scale
+        y_volume = volume_bottom - v * volume_scale
+        up = c >= o
+        bar_width = x1[0] - x0[0]
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        for mask, color in ((up, UP_COLOR), (~up, DOWN_COLOR)):
+            index = np.flatnonzero(mask)
+            if len(index) == 0:
+                continue
+            painter.setPen(QPen(color, 1))
+            painter.drawLines([QLineF(x, top, x, max(bottom, top + 1))
+                               for x, top, bottom in zip(center[index], y_high[index], y_low[index])])
+            if bar_width >= 3:
+                # K线够宽时画实体和成交量柱
+                body_left = np.floor(x0[index]) + 1
+                body_width = max(bar_width - 2, 1)
+                top = np.minimum(y_open[index], y_close[index])
+                height = np.maximum(np.abs(y_open[index] - y_close[index]), 1)
+                painter.setBrush(color)
+                painter.drawRects([QRectF(x, y, body_width, hh) for x, y, hh in zip(body_left, top, height)])
+                painter.drawRects([QRectF(x, y, body_width, volume_bottom - y)
+                                   for x, y in zip(body_left, y_volume[index])])
+                painter.setBrush(Qt.NoBrush)
+            else:
+                painter.drawLines([QLineF(x, volume_bottom, x, y) for x, y in zip(center[index], y_volume[index])])
+
+    def _paint_dates(self, painter, rect):
+        """
+        日期标签按全局像素位置取整，平移后与滚动过来的标签一致
+        """
+        step = 150
+        top = self.height() - self.DATE_HEIGHT
+        first = (self.offset + rect.left() - step) // step * step
+        # 两个标签之间超过一天时只显示日期
+        fmt = '%Y-%m-%d' if step * self.bars_per_pixel >= 240 else '%m-%d %H:%M'
+        painter.setPen(AXIS_COLOR)
+        for pixel in range(first, self.offset + rect.right() + step, step):
+            bar = int(math.floor(pixel * self.bars_per_pixel))
+            if bar < 0 or bar >= len(self.times):
+                continue
+            x = pixel - self.offset
+            painter.drawLine(x, top, x, top + 4)
+            painter.drawText(x + 3, self.height() - 4, pd.Timestamp(self.times[bar]).strftime(fmt))
+
+    def _paint_axis(self, painter, rect):
+        left = self._chart_width()
+        if rect.right() < left:
+            return
+        painter.fillRect(QRect(left, 0, self.AXIS_WIDTH, self.height()), BACKGROUND_COLOR)
+        (price_top, price_bottom), _ = self._layout()
+        low_price, high_price = self._price_range
+        painter.setPen(AXIS_COLOR)
+        painter.drawLine(left, 0, left, self.height())
+        for i in range(6):
+            price = high_price - (high_price - low_price) * i / 5
+            y = int(price_top + (price_bottom - price_top) * i / 5)
+            painter.drawLine(left, y, left + 4, y)
+            painter.drawText(left + 6, max(y + 4, 12), f'{price:.2f}')
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.pyramid is not None:
+            self.offset = self._clamp_offset(self.offset)
+            self._refresh(full=True)
+
+    def wheelEvent(self, event):
+        factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+        self.zoom(factor, event.pos().x())
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_x = event.pos().x()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_x is not None:
+            self.pan(self._drag_x - event.pos().x())
+            self._drag_x = event.pos().x()
+
+    def mouseReleaseEvent(self, event):
+        self._drag_x = None
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_Left:
+            self.pan(-20)
+        elif event.key() == Qt.Key_Right:
+            self.pan(20)
+        elif event.key() == Qt.Key_Up:
+            self.zoom(1.25)
+        elif event.key() == Qt.Key_Down:
+            self.zoom(0.8)
+        else:
+            super().keyPressEvent(event)
+
+
+def make_minute_bars(years=5, seed=0):
+    """
+    随机游走的1分钟K线，每年 250 个交易日，每天 240 根
+    """
+    rng = np.random.default_rng(seed)
+    count = years * 250 * 240
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.001, count)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.0008, count)) * close
+    high = np.maximum(open_, close) + spread
+    low = np.minimum(open_, close) - spread
+    days = np.busday_offset('2019-01-02', np.arange(count) // 240).astype('datetime64[m]')
+    minutes = np.arange(count) % 240
+    # 上午 9:31 - 11:30，下午 13:01 - 15:00
+    times = days + np.where(minutes < 120, 571 + minutes, 661 + minutes).astype('timedelta64[m]')
+    return times, open_, high, low, close, rng.lognormal(8, 1, count)
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    chart = CandlestickChart()
+    bars = make_minute_bars()
+    chart.set_bars(*bars)
+    chart.zoom(1 / 64)
+    print(f'{chart.pyramid.size} 根K线，金字塔 {len(chart.pyramid.levels)} 层')
+
+    win = QMainWindow()
+    win.setCentralWidget(chart)
+    win.resize(1200, 600)
+    win.show()
+
+    # 连续平移，统计每次绘制的耗时和重画宽度
+    def bench():
+        costs = []
+        widths = []
+        for _ in range(200):
+            start = time.perf_counter()
+            chart.pan(-8)
+            # 只处理 pan 产生的局部重画
+            QApplication.processEvents()
+            costs.append(time.perf_counter() - start)
+            widths.append(chart.last_paint_width)
+        print(f'平移 200 次，每次 {np.median(costs) * 1000:.2f}ms，重画宽度中位数 {int(np.median(widths))}px')
+
+    QTimer.singleShot(500, bench)
+    sys.exit(app.exec_())
@@ -1,61 +1,89 @@
 import sys
 
-import qdarkstyle
-from PyQt5.QtWidgets import QComboBox, QLineEdit, QListWidgetItem, QListWidget, QCheckBox, \
+from PyQt5.QtCore import QEvent, Qt
+from PyQt5.QtWidgets import QComboBox, QLineEdit, QListView, \
     QApplication, QVBoxLayout, QWidget, QPushButton, QDesktopWidget, QTextBrowser
 
+from utils.styleutils import dark_stylesheet
+from viewmodel.checklistmodel import CheckListModel, SELECT_ALL_TEXT
+
 
 # 继承下拉列表
 class ComboCheckBox(QComboBox):
+    """
+    多选下拉框，选项由 CheckListModel 提供，不再为每个选项创建复选框
+    第一行是全选，弹出框顶部的输入框用于过滤选项，全选、反选只作用于过滤后可见的选项
+    """
+
     def __init__(self, items):
         super().__init__()
-        self.items = ['全选'] + items  # 下拉列表
-        self.box_list = []  # 复选框列表
+        self.items = [SELECT_ALL_TEXT] + items  # 下拉列表
         self.text = QLineEdit()  # 输入框
         self.state = 0  # 选择中状态
-        q = QListWidget()  # 列表单元组件
-        for i in range(len(self.items)):
-            self.box_list.append(QCheckBox())
-            self.box_list[i].setText(self.items[i])
-            item = QListWidgetItem(q)
-            q.setItemWidget(item, self.box_list[i])
-            if i == 0:
-                self.box_list[i].stateChanged.connect(self.all_selected)
-            else:
-                self.box_list[i].stateChanged.connect(self.show_selected)
+        self.check_model = CheckListModel(items, self)
+        self.check_model.selection_changed.connect(self.show_selected)
         self.setFixedWidth(100)
         self.text.setReadOnly(True)  # 设置输入框只读
         self.setLineEdit(self.text)
-        self.setModel(q.model())
-        self.setView(q)
+        self.setModel(self.check_model)
+        view = QListView()
+        view.setUniformItemSizes(True)
+        self.setView(view)
+        # 点击选项只切换勾选，不关闭弹出框
+        view.viewport().installEventFilter(self)
+
+        # 过滤输入框，放在弹出框的顶部
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText('过滤')
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self.check_model.set_filter)
+        container = view.parentWidget()
+        if container is not None and container.layout() is not None:
+            container.layout().insertWidget(0, self.filter_edit)
+
+    def eventFilter(self, obj, event):
+        if obj is self.view().viewport():
+            if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+                index = self.view().indexAt(event.pos())
+                if index.isValid():
+                    self.check_model.toggle(index.row())
+                return True
+            if event.type() == QEvent.MouseButtonPress:
+                return False
+        return super().eventFilter(obj, event)
+
+    def showPopup(self):
+        super().showPopup()
+        self.filter_edit.setFocus()
+
+    def hidePopup(self):
+        super().hidePopup()
+        # 关闭弹出框时 QComboBox 会把当前行写入输入框，这里恢复为已选内容
+        self.show_selected()
+
+    def set_items(self, items):
+        """
+        替换全部选项，清空勾选状态
+        """
+        self.items = [SELECT_ALL_TEXT] + items
+        self.check_model.set_items(items)
 
     # 全选
     def all_selected(self):
-        if self.state == 0:
-            self.state = 1
-            for i in range(1, len(self.items)):
-                self.box_list[i].setChecked(True)
-        else:
-            self.state = 0
-            for i in range(1, len(self.items)):
-                self.box_list[i].setChecked(False)
-        self.show_selected()
+        self.check_model.toggle(0)
+
+    # 反选
+    def invert_selected(self):
+        self.check_model.invert_visible()
 
     def set_select(self, select_list):
-        for key_rps in select_list:
-            index = self.items.index(key_rps)
-            self.box_list[index].setChecked(True)
+        self.check_model.set_checked_items(select_list)
 
-    # 反选
     def get_selected(self):
-        ret = []
-        for i in range(1, len(self.items)):
-            if self.box_list[i].isChecked():
-                ret.append(self.box_list[i].text())
-        return ret
+        return self.check_model.checked_items()
 
     def show_selected(self):
-        self.text.clear()
+        self.state = 1 if self.check_model.all_checked() else 0
         ret = '; '.join(self.get_selected())
         self.text.setText(ret)
 
@@ -99,7 +127,7 @@ class MyWin(QWidget):
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    app.setStyleSheet(qdarkstyle.load_stylesheet())  # 设置样式表
+    app.setStyleSheet(dark_stylesheet())  # 设置样式表
     w = MyWin()
     w.show()
     sys.exit(app.exec_())
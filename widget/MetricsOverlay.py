@@ -0,0 +1,113 @@
+import functools
+import sys
+import time
+
+from PyQt5 import sip
+from PyQt5.QtCore import QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QLabel, QMainWindow, QPushButton
+
+from core import metrics as app_metrics
+from core.AppThreadExecutor import AppThreadExecutor
+
+
+class MetricsOverlay(QLabel):
+    """
+    界面内的指标浮层，贴在父窗口右上角，不响应鼠标
+    作为 sink 注册到指标汇总，显示最慢的几个任务、事件循环延迟和最近一次卡顿
+    """
+    # sink 可能在其他线程被调用，通过信号切换到主线程
+    _record_signal = pyqtSignal(object)
+
+    def __init__(self, parent, metrics=None, top=5, refresh_ms=1000):
+        """
+        @param parent: 浮层所在的窗口
+        @param metrics: 指标汇总，默认为 core.metrics.registry
+        @param top: 显示的任务数
+        @param refresh_ms: 刷新间隔
+        """
+        super().__init__(parent)
+        self.metrics = metrics if metrics is not None else app_metrics.registry
+        self.top = top
+        self._last_event = ''
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet('background-color: rgba(0, 0, 0, 160); color: #e0e0e0; '
+                           'font-family: monospace; font-size: 11px; padding: 4px;')
+        self._record_signal.connect(self._on_record)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(refresh_ms)
+        self.metrics.add_sink(self)
+        # 随父窗口销毁时不会收到 closeEvent，销毁时也要注销
+        self.destroyed.connect(functools.partial(self.metrics.remove_sink, self))
+        self.refresh()
+
+    def emit(self, record):
+        if sip.isdeleted(self):
+            # 销毁和注销之间其他线程仍可能调用
+            return
+        if record['type'] in ('loop_lag', 'stall') or not record.get('ok', True):
+            self._record_signal.emit(record)
+
+    def _on_record(self, record):
+        clock = time.strftime('%H:%M:%S')
+        if record['type'] == 'stall':
+            self._last_event = f"{clock} 卡住 {record['stall_ms']:.0f}ms {record['callback'] or ''}"
+        elif record['type'] == 'loop_lag':
+            self._last_event = f"{clock} 延迟 {record['lag_ms']:.0f}ms {record['callback'] or ''}"
+        else:
+            self._last_event = f"{clock} 失败 {record['name']} {record['error']}"
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        tasks = sorted(snapshot['tasks'].items(), key=lambda item: -_slowest(item[1]))[:self.top]
+        lines = ['任务                      执行p95  回调p95  执行中 失败']
+        for name, stats in tasks:
+            lines.append(f"{name[-24:]:<24} {_ms(stats['run_ms']['p95']):>8} {_ms(stats['callback_ms']['p95']):>8} "
+                         f"{stats['in_flight']:>5} {stats['failures']:>4}")
+        lines.append(f"事件循环延迟 p95 {_ms(snapshot['loop_lag_ms']['p95'])} 最大 {_ms(snapshot['loop_lag_ms']['max'])} "
+                     f"卡顿 {snapshot['stalls']}")
+        if self._last_event:
+            lines.append(self._last_event)
+        self.setText('\n'.join(lines))
+        self.adjustSize()
+        if self.parentWidget() is not None:
+            self.move(self.parentWidget().width() - self.width() - 8, 8)
+        self.raise_()
+
+    def closeEvent(self, event):
+        self.metrics.remove_sink(self)
+        super().closeEvent(event)
+
+
+def _slowest(stats):
+    return max(stats['run_ms']['p95'] or 0, stats['callback_ms']['p95'] or 0)
+
+
+def _ms(value):
+    return '-' if value is None else f'{value:.1f}'
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    executor = AppThreadExecutor()
+    app_metrics.registry.add_sink(app_metrics.LogSink(slow_ms=100))
+    monitor = app_metrics.EventLoopLagMonitor()
+    monitor.start()
+
+    win = QMainWindow()
+    win.resize(600, 400)
+    overlay = MetricsOverlay(win)
+
+    def slow_task():
+        time.sleep(0.3)
+        return 'done'
+
+    def slow_callback(future):
+        # 在主线程阻塞，模拟卡顿的回调
+        time.sleep(0.8)
+
+    button = QPushButton('提交任务', win)
+    button.move(20, 20)
+    button.clicked.connect(lambda: executor.submit(slow_task, slow_callback))
+    win.show()
+    sys.exit(app.exec_())